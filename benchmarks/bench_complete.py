@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+路径补全 `tree/complete/` 基准测试
+
+对比 按照父结点路径和标识前缀查询数据库(query) 与 进程内路径前缀树(trie) 两种方式，
+在约 50 万个结点的树上补全路径的耗时和SQL数量；trie 首次使用时加载的耗时单独统计。
+
+    python benchmarks/bench_complete.py
+"""
+
+from utils import setup_django, build_tree, timer
+
+# 每次补全返回的结点个数
+LIMIT = 20
+
+
+def query_complete(prefix: str) -> list:
+    from django_tree_perm.models import TreeNode
+    from django_tree_perm.utils import TREE_SPLIT_NODE_FLAG
+
+    parent, _, name = prefix.rpartition(TREE_SPLIT_NODE_FLAG)
+    queryset = TreeNode.objects.filter(disabled=False, name__startswith=name)
+    if parent:
+        queryset = queryset.filter(parent__path=parent)
+    else:
+        queryset = queryset.filter(parent__isnull=True)
+    return list(queryset.order_by("name").values("id", "name", "path", "is_key")[:LIMIT])
+
+
+def main() -> None:
+    setup_django()
+
+    from django_tree_perm.trie import path_trie
+
+    total = build_tree(root="bench", branches=8, depth=6, keys=15)
+    print(f"nodes={total}")
+    cases = [
+        ("root", "be"),
+        ("children", "bench.n2-1."),
+        ("name prefix", "bench.n2-1.n3-2.n4-3.n5-"),
+        ("key prefix", "bench.n2-1.n3-2.n4-3.n5-4.n6-5.k"),
+        ("not found", "bench.n2-1.not-found.n4"),
+    ]
+
+    with timer("load trie") as data:
+        path_trie.load()
+        data.update(path_trie.info())
+
+    for name, prefix in cases:
+        with timer(f"{name} strategy=query") as data:
+            data["count"] = len(query_complete(prefix))
+        with timer(f"{name} strategy=trie") as data:
+            data["count"] = len(path_trie.complete(prefix, limit=LIMIT)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+`TreeNodeQuerySet.filter_by_perm` 基准测试
+
+在 3 叉 10 层的树上，分别使用 路径前缀拼接(prefix)、按照 ancestor_ids 关联授权结点的 EXISTS 子查询(exists)
+和 闭包表(closure) 三种策略，对比 10 / 1k / 10k 个授权结点下 全表计数(count)、查询子结点(children) 和 按路径分页(page) 的耗时。
+
+    python benchmarks/bench_filter_by_perm.py
+"""
+import random
+
+from utils import setup_django, build_tree, timer
+
+
+def main() -> None:
+    setup_django()
+
+    from django.db import DatabaseError
+    from django.core.management import call_command
+    from django.test import override_settings
+    from django.contrib.auth import get_user_model
+    from django_tree_perm.models import TreeNode, Role, NodeRole
+
+    total = build_tree(branches=3, depth=10)
+    print(f"tree nodes: {total}")
+    call_command("rebuild_tree_closure", verbosity=0)
+    role = Role.objects.create(name="dev")
+    nodes = list(TreeNode.objects.filter(depth__gt=1).values_list("id", flat=True))
+    parent_id = TreeNode.objects.filter(depth=6).order_by("path").values_list("id", flat=True)[0]
+    random.seed(0)
+
+    cases = {
+        "count": lambda qs: qs.count(),
+        "children": lambda qs: len(qs.filter(parent_id=parent_id)),
+        "page": lambda qs: len(qs.order_by("path")[:20]),
+    }
+    for num in (10, 1000, 10000):
+        user = get_user_model().objects.create(username=f"user{num}")
+        NodeRole.objects.bulk_create(
+            [NodeRole(user=user, node_id=node_id, role=role) for node_id in random.sample(nodes, num)]
+        )
+        strategies = {
+            "prefix": {"TREE_PERM_FILTER_PATHS_LIMIT": 10**9},
+            "exists": {"TREE_PERM_FILTER_PATHS_LIMIT": 0},
+            "closure": {"TREE_PERM_CLOSURE_ENABLED": True},
+        }
+        for strategy, options in strategies.items():
+            with override_settings(**options):
+                for case, func in cases.items():
+                    name = f"grants={num} strategy={strategy} case={case}"
+                    try:
+                        with timer(name) as data:
+                            data["count"] = func(TreeNode.objects.all().filter_by_perm(user.id))
+                    except (DatabaseError, RecursionError) as e:
+                        print(f"{name} failed: {e.__class__.__name__} {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+`TreeNodeManger.move_path` 基准测试
+
+分别使用 数据库按集合更新(db) 和 逐个结点计算后批量更新(python) 两种方式，对比移动 100 / 1k / 10k 个子结点的子树耗时。
+
+    python benchmarks/bench_move_path.py
+"""
+from utils import setup_django, build_tree, timer
+
+
+def main() -> None:
+    setup_django()
+
+    from django.test import override_settings
+    from django_tree_perm.controller import TreeNodeManger
+    from django_tree_perm.models import TreeNode
+
+    for depth in (4, 5, 6):
+        root = f"bench{depth}"
+        build_tree(root=root, branches=10, depth=depth)
+        target = TreeNode(name="target", parent=TreeNode.objects.get(path=root))
+        target.validate_save()
+        count = TreeNode.objects.filter(path__startswith=f"{root}.n2-0.").count()
+        for strategy, in_db in (("db", True), ("python", False)):
+            with override_settings(TREE_PERM_MOVE_IN_DB=in_db):
+                node = TreeNode.objects.get(path=f"{root}.n2-0")
+                with timer(f"children={count} strategy={strategy}") as data:
+                    data["rows"] = TreeNodeManger(node=node).move_path(parent=target)
+                # 移回原位置，保证两种方式移动的子树一致
+                TreeNodeManger(node=node).move_path(parent=TreeNode.objects.get(path=root))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+`TreeNodeQuerySet.search_nodes` 基准测试
+
+对比 按照规则排名一次查询数据库(query) 与 内存搜索索引确认候选结点(index) 两种方式，
+在约 50 万个结点的树上执行搜索并获取结果的耗时和SQL数量；index 首次使用时加载索引的耗时单独统计。
+
+    python benchmarks/bench_search_nodes.py
+"""
+
+from utils import setup_django, build_tree, timer
+
+
+def main() -> None:
+    setup_django()
+
+    from django.conf import settings
+    from django_tree_perm.models import TreeNode
+    from django_tree_perm.search import search_index
+
+    total = build_tree(root="bench", branches=8, depth=6, keys=15)
+    print(f"nodes={total}")
+    key = TreeNode.objects.filter(is_key=True).order_by("-id").values_list("name", flat=True).first()
+    cases = [
+        ("key name equal", key),
+        ("key name contains", key[:-2]),
+        ("name contains", "n5-3"),
+        ("short value", "n6"),
+        ("path equal", "bench.n2-1.n3-2"),
+        ("path startswith", "bench.n2-1.n3"),
+        ("path contains", "n4-2.n5-"),
+        ("not found", "not-found"),
+    ]
+
+    settings.TREE_PERM_SEARCH_INDEX_ENABLED = True
+    with timer("load index") as data:
+        search_index.load()
+        data.update(search_index.info())
+
+    for name, value in cases:
+        for strategy in ("query", "index"):
+            settings.TREE_PERM_SEARCH_INDEX_ENABLED = strategy == "index"
+            with timer(f"{name} strategy={strategy}") as data:
+                data["count"] = len(list(TreeNode.objects.filter(disabled=False).search_nodes(value)))
+
+
+if __name__ == "__main__":
+    main()
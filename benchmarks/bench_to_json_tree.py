@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+`TreeNodeManger.to_json_tree` 基准测试
+
+对比 逐个实例化结点模型后按层级组装(legacy) 与 按字段值一次遍历组装(values) 两种方式，
+在约 10 万个结点的树上转换整棵树，以及从搜索结果追溯到根结点的耗时和内存峰值。
+
+    python benchmarks/bench_to_json_tree.py
+"""
+
+import typing
+import tracemalloc
+
+from utils import setup_django, build_tree, timer
+
+
+def legacy_to_json_tree(queryset: typing.Any, trace_to_root: bool = True) -> typing.List[dict]:
+    """优化之前的实现，用于对比"""
+    from django_tree_perm import utils
+    from django_tree_perm.models import TreeNode
+
+    if trace_to_root:
+        paths = utils.get_tree_paths(list(queryset.values_list("path", flat=True)))
+        queryset = TreeNode.objects.all().filter(path__in=paths)
+    nodes = [node.to_json(partial=True) for node in queryset]
+
+    tree = []
+    parent_child_nodes: dict = {}
+    for node in nodes:
+        if node["parent_id"]:
+            parent_child_nodes.setdefault(node["parent_id"], [])
+            parent_child_nodes[node["parent_id"]].append(node)
+        else:
+            tree.append(node)
+    leafs = tree
+    while leafs:
+        new_leafs = []
+        for parent in leafs:
+            children = parent_child_nodes.get(parent["id"], [])
+            if children:
+                parent["children"] = children
+                new_leafs.extend(children)
+        leafs = new_leafs
+    return tree
+
+
+def main() -> None:
+    setup_django()
+
+    from django_tree_perm.controller import TreeNodeManger
+    from django_tree_perm.models import TreeNode
+
+    total = build_tree(root="bench", branches=10, depth=5, keys=9)
+    print(f"nodes={total}")
+    cases = [
+        ("whole tree", lambda: TreeNode.objects.filter(disabled=False), False),
+        ("search trace_to_root", lambda: TreeNode.objects.filter(name__endswith="-3", is_key=True), True),
+    ]
+    for name, get_queryset, trace_to_root in cases:
+        for strategy, func in (("legacy", legacy_to_json_tree), ("values", TreeNodeManger.to_json_tree)):
+            tracemalloc.start()
+            with timer(f"{name} strategy={strategy}") as data:
+                func(get_queryset(), trace_to_root=trace_to_root)
+                data["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+            tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+基准测试公共方法
+
+在项目根目录执行 `python benchmarks/bench_xxx.py`，使用 `tests.settings` 配置的内存数据库。
+
+"""
+import os
+import sys
+import time
+import typing
+import contextlib
+
+import django
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django() -> None:
+    """初始化Django并创建数据表"""
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def build_tree(root: str = "bench", branches: int = 10, depth: int = 3, keys: int = 0) -> int:
+    """逐层批量创建一棵完整的树
+
+    Args:
+        root: 根结点标识
+        branches: 每个非叶子结点的子结点个数
+        depth: 树的深度(包含根结点，不包含key结点)
+        keys: 每个最底层结点下的key结点个数
+
+    Returns:
+        创建的结点个数
+    """
+    from django_tree_perm.models import TreeNode
+
+    parents = [TreeNode(name=root)]
+    parents[0].validate_save()
+    total = 1
+    for level in range(2, depth + 2 if keys else depth + 1):
+        is_key = level == depth + 1
+        count = keys if is_key else branches
+        nodes = []
+        for parent in parents:
+            for i in range(count):
+                name = f"k{parent.id}-{i}" if is_key else f"n{level}-{i}"
+                node = TreeNode(name=name, parent=parent, is_key=is_key)
+                node.patch_attrs()
+                nodes.append(node)
+        TreeNode.objects.bulk_create(nodes, batch_size=1000)
+        total += len(nodes)
+        # 部分数据库 bulk_create 不会回填主键
+        ids = dict(TreeNode.objects.filter(depth=level).values_list("path", "id"))
+        for node in nodes:
+            node.id = ids[node.path]
+        parents = nodes
+    return total
+
+
+@contextlib.contextmanager
+def timer(name: str, results: typing.Optional[dict] = None) -> typing.Iterator[dict]:
+    """统计代码块耗时和SQL数量"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    data: dict = {}
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        yield data
+        data["seconds"] = time.perf_counter() - start
+    data["queries"] = len(ctx.captured_queries)
+    data["sql_length"] = sum(len(q["sql"]) for q in ctx.captured_queries)
+    if results is not None:
+        results[name] = data
+    extra = " ".join(f"{k}={v}" for k, v in data.items() if k not in ("seconds", "queries", "sql_length"))
+    print(
+        f"{name:<40} {data['seconds'] * 1000:>10.1f}ms  queries={data['queries']:<6} "
+        f"sql_length={data['sql_length']:<10} {extra}"
+    )
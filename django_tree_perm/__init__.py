@@ -16,6 +16,47 @@ class SettingsProxy(object):
     # 时间格式化
     TREE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S UTC%z"
 
+    # 是否开启进程内权限缓存
+    TREE_PERM_CACHE_ENABLED = False
+    # 权限缓存最大条目数
+    TREE_PERM_CACHE_MAXSIZE = 1024
+    # 权限缓存过期时间(秒)
+    TREE_PERM_CACHE_TTL = 300
+    # 是否开启基于 Django cache 框架的跨进程共享权限缓存
+    TREE_PERM_SHARED_CACHE_ENABLED = False
+    # 共享权限缓存使用的 CACHES 配置名
+    TREE_PERM_SHARED_CACHE_ALIAS = "default"
+    # 共享权限缓存过期时间(秒)
+    TREE_PERM_SHARED_CACHE_TTL = 300
+    # 共享权限缓存key前缀
+    TREE_PERM_SHARED_CACHE_PREFIX = "tree_perm"
+    # filter_by_perm 按照路径前缀拼接查询条件的最大路径数，超过后改为关联授权结点的子查询
+    TREE_PERM_FILTER_PATHS_LIMIT = 100
+    # 移动结点时是否在数据库中按集合更新子结点，关闭后逐个结点计算再批量更新
+    TREE_PERM_MOVE_IN_DB = True
+    # 是否维护并使用key结点生效权限表 EffectivePerm
+    TREE_PERM_EFFECTIVE_ENABLED = False
+    # 是否开启进程内树结点索引
+    TREE_PERM_INDEX_ENABLED = False
+    # 树结点索引重新加载的间隔(秒)，用于感知其他进程的变更
+    TREE_PERM_INDEX_TTL = 60
+    # 是否开启进程内结点搜索索引
+    TREE_PERM_SEARCH_INDEX_ENABLED = False
+    # 结点搜索索引重新加载的间隔(秒)，用于感知其他进程的变更
+    TREE_PERM_SEARCH_INDEX_TTL = 60
+    # 结点路径前缀树重新加载的间隔(秒)，用于感知其他进程的变更
+    TREE_PERM_TRIE_TTL = 60
+    # 路径补全接口默认返回的结点个数
+    TREE_PERM_COMPLETE_LIMIT = 20
+    # 是否开启树结构接口的响应缓存，使用共享权限缓存相同的 CACHES 配置和key前缀
+    TREE_PERM_RESPONSE_CACHE_ENABLED = False
+    # 树结构接口响应缓存过期时间(秒)
+    TREE_PERM_RESPONSE_CACHE_TTL = 300
+    # 是否维护并使用结点的嵌套集合区间编码 lft/rgt 查询子树
+    TREE_PERM_NESTED_SET_ENABLED = False
+    # 是否维护并使用结点闭包表 TreeNodeClosure 判断继承的授权
+    TREE_PERM_CLOSURE_ENABLED = False
+
     def __getattribute__(self, attr: str) -> typing.Any:
         try:
             if hasattr(django_settings, attr):
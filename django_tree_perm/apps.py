@@ -8,4 +8,4 @@ class MrbacConfig(AppConfig):
     name = "django_tree_perm"
 
     def ready(self) -> None:
-        pass
+        from django_tree_perm import signals  # noqa: F401
@@ -0,0 +1,483 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+权限缓存模块
+
+进程内缓存用户被授予的权限，重复判断权限时直接在内存中匹配，不再查询数据库。
+
+- 通过配置 `TREE_PERM_CACHE_ENABLED` 开启，默认关闭
+- 缓存受 `TREE_PERM_CACHE_MAXSIZE` 容量限制(LRU淘汰)和 `TREE_PERM_CACHE_TTL` 过期时间限制
+- 通过配置 `TREE_PERM_SHARED_CACHE_ENABLED` 开启基于 Django cache 框架的跨进程共享缓存，可与进程内缓存同时使用
+- 通过 `NodeRole`、`Role`、`TreeNode` 的 post_save/post_delete 信号失效，详见 `django_tree_perm.signals`
+- 通过配置 `TREE_PERM_RESPONSE_CACHE_ENABLED` 开启树结构接口的响应缓存，结点变更后失效
+- 结点和用户变更时递增版本号，用作接口条件请求的校验值
+
+"""
+
+import time
+import typing
+import hashlib
+import threading
+import collections
+
+from django.db import transaction
+from django.core.cache import caches
+
+from django_tree_perm import settings
+from django_tree_perm.utils import get_tree_paths
+
+# 一条授权记录: (结点路径, 角色标识, 角色是否可管理结点)
+Grant = typing.Tuple[str, str, bool]
+# 用户授权集合，按结点路径索引: {path: ((role_name, can_manage), ...)}
+GrantMap = typing.Dict[str, typing.Tuple[typing.Tuple[str, bool], ...]]
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """带容量和过期时间限制的LRU缓存，线程安全
+
+    容量和过期时间在每次写入时从配置读取，便于动态调整。
+    """
+
+    def __init__(self, maxsize_setting: str, ttl_setting: str) -> None:
+        self.maxsize_setting = maxsize_setting
+        self.ttl_setting = ttl_setting
+        self.hits = 0
+        self.misses = 0
+        self._data: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def maxsize(self) -> int:
+        return int(getattr(settings, self.maxsize_setting))
+
+    @property
+    def ttl(self) -> float:
+        return float(getattr(settings, self.ttl_setting))
+
+    def get(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+        """获取缓存值，不存在或已过期返回default"""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                expires_at, value = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: typing.Hashable, value: typing.Any) -> None:
+        maxsize = self.maxsize
+        if maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: typing.Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def info(self) -> dict:
+        """缓存统计信息"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+    def reset_info(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+class SharedCache(object):
+    """跨进程共享缓存，基于 Django cache 框架
+
+    - 使用 `TREE_PERM_SHARED_CACHE_ALIAS` 指定的缓存后端，过期时间为 `TREE_PERM_SHARED_CACHE_TTL`
+    - 缓存key按照命名空间带上版本号(generation)，失效整个命名空间只需递增版本号，旧版本数据等待自然过期
+    - 缓存key也可以由多个命名空间的版本号共同决定，例如同时带上所有用户和单个用户授权的版本号
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.TREE_PERM_SHARED_CACHE_ENABLED)
+
+    @property
+    def cache(self) -> typing.Any:
+        return caches[settings.TREE_PERM_SHARED_CACHE_ALIAS]
+
+    @property
+    def ttl(self) -> float:
+        return float(settings.TREE_PERM_SHARED_CACHE_TTL)
+
+    def _generation_key(self, namespace: str) -> str:
+        return f"{settings.TREE_PERM_SHARED_CACHE_PREFIX}:{namespace}:gen"
+
+    def get_generation(self, namespace: str) -> int:
+        """获取命名空间当前的版本号"""
+        key = self._generation_key(namespace)
+        generation = self.cache.get(key)
+        if generation is None:
+            # 版本号丢失(被淘汰)时以当前毫秒时间初始化，避免与丢失前的版本号重复而读到旧数据
+            self.cache.add(key, int(time.time() * 1000), timeout=None)
+            generation = self.cache.get(key, 0)
+        return generation
+
+    def get_generations(self, namespaces: typing.Sequence[str]) -> typing.Tuple[int, ...]:
+        """一次获取多个命名空间当前的版本号"""
+        keys = [self._generation_key(namespace) for namespace in namespaces]
+        values = self.cache.get_many(keys)
+        return tuple(
+            values[key] if values.get(key) is not None else self.get_generation(namespace)
+            for key, namespace in zip(keys, namespaces)
+        )
+
+    def bump_generation(self, namespace: str) -> None:
+        """递增命名空间的版本号，使该命名空间下所有缓存失效"""
+        key = self._generation_key(namespace)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.get_generation(namespace)
+            self.cache.incr(key)
+
+    def make_key(self, namespace: str, key: str, generations: typing.Optional[typing.Tuple[int, ...]] = None) -> str:
+        """生成缓存key，不传递 generations 时使用命名空间当前的版本号"""
+        if generations is None:
+            generations = (self.get_generation(namespace),)
+        generation = ".".join(str(value) for value in generations)
+        return f"{settings.TREE_PERM_SHARED_CACHE_PREFIX}:{namespace}:{generation}:{key}"
+
+    def get(self, namespace: str, key: str, generations: typing.Optional[typing.Tuple[int, ...]] = None) -> typing.Any:
+        """获取缓存值，不存在返回None"""
+        value = self.cache.get(self.make_key(namespace, key, generations))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(
+        self, namespace: str, key: str, value: typing.Any, generations: typing.Optional[typing.Tuple[int, ...]] = None
+    ) -> None:
+        self.cache.set(self.make_key(namespace, key, generations), value, timeout=self.ttl)
+
+    def delete(self, namespace: str, key: str, generations: typing.Optional[typing.Tuple[int, ...]] = None) -> None:
+        self.cache.delete(self.make_key(namespace, key, generations))
+
+    def info(self) -> dict:
+        """缓存统计信息"""
+        return {"hits": self.hits, "misses": self.misses, "ttl": self.ttl}
+
+    def reset_info(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+class ChangeGenerations(SharedCache):
+    """数据变更版本号，基于 Django cache 框架，用作接口条件请求的校验值
+
+    - 数据变更时递增命名空间的版本号，事务提交后再次递增；不受缓存开关影响，读取时不再聚合查询数据库
+    - 版本号保存在 `TREE_PERM_SHARED_CACHE_ALIAS` 配置的缓存中，多进程部署时需使用跨进程共享的缓存后端
+    """
+
+    # 结点变更，与树结构接口响应缓存使用相同的版本号
+    TREE = "tree"
+    # 用户信息变更
+    USERS = "users"
+
+    def bump(self, namespace: str) -> None:
+        """递增版本号，事务提交后会再次递增，避免事务期间读取到的版本号对应旧数据"""
+        self.bump_generation(namespace)
+        transaction.on_commit(lambda: self.bump_generation(namespace))
+
+    def get_validators(self, namespaces: typing.Sequence[str]) -> dict:
+        """一次获取多个命名空间的版本号"""
+        return dict(zip(namespaces, self.get_generations(namespaces)))
+
+
+class TreeResponseCache(SharedCache):
+    """树结构接口响应缓存，基于 Django cache 框架
+
+    - 通过配置 `TREE_PERM_RESPONSE_CACHE_ENABLED` 开启，过期时间为 `TREE_PERM_RESPONSE_CACHE_TTL`
+    - 缓存编码后的响应内容，结点变更时递增版本号使所有缓存失效
+    - 同一个key并发未命中时只渲染一次：进程内其他线程等待渲染完成，跨进程通过 `cache.add` 加锁
+    """
+
+    namespace = ChangeGenerations.TREE
+    # 等待其他线程或进程渲染的最长时间(秒)，超时后自行渲染
+    lock_timeout = 10.0
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+        self._inflight: typing.Dict[str, threading.Event] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.TREE_PERM_RESPONSE_CACHE_ENABLED)
+
+    @property
+    def ttl(self) -> float:
+        return float(settings.TREE_PERM_RESPONSE_CACHE_TTL)
+
+    def get_or_render(self, key: str, render: typing.Callable[[], typing.Any]) -> typing.Any:
+        """获取缓存的响应内容，未命中时调用render渲染并缓存
+
+        Args:
+            key: 缓存key
+            render: 渲染响应内容的方法，返回值需可序列化且不为None
+
+        Returns:
+            响应内容
+        """
+        # 渲染前确定版本号，渲染期间结点变更时结果写入旧版本，不会被读取
+        full_key = self.make_key(self.namespace, key)
+        value = self.cache.get(full_key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+
+        with self._lock:
+            waiting = self._inflight.get(full_key)
+            if waiting is None:
+                event = self._inflight[full_key] = threading.Event()
+        if waiting is not None:
+            waiting.wait(self.lock_timeout)
+            value = self.cache.get(full_key)
+            return value if value is not None else render()
+
+        try:
+            return self._render_once(full_key, render)
+        finally:
+            with self._lock:
+                self._inflight.pop(full_key, None)
+            event.set()
+
+    def _render_once(self, full_key: str, render: typing.Callable[[], typing.Any]) -> typing.Any:
+        """跨进程加锁渲染，未获取到锁时等待其他进程的渲染结果"""
+        lock_key = f"{full_key}:lock"
+        deadline = time.monotonic() + self.lock_timeout
+        locked = self.cache.add(lock_key, 1, timeout=self.lock_timeout)
+        while not locked and time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = self.cache.get(full_key)
+            if value is not None:
+                return value
+            locked = self.cache.add(lock_key, 1, timeout=self.lock_timeout)
+        try:
+            value = render()
+            self.cache.set(full_key, value, timeout=self.ttl)
+            return value
+        finally:
+            if locked:
+                self.cache.delete(lock_key)
+
+    def invalidate(self) -> None:
+        """失效所有响应缓存；事务提交后会再次失效，避免缓存事务中的旧数据
+
+        未开启响应缓存时也会递增版本号，用作树结构接口条件请求的校验值，见 `ChangeGenerations`
+        """
+        change_generations.bump(self.namespace)
+
+
+def build_grant_map(grants: typing.Iterable[Grant]) -> GrantMap:
+    """将授权记录按结点路径聚合"""
+    data: typing.Dict[str, list] = {}
+    for path, role_name, can_manage in grants:
+        data.setdefault(path, []).append((role_name, bool(can_manage)))
+    return {path: tuple(items) for path, items in data.items()}
+
+
+def match_grants(
+    grant_map: GrantMap,
+    path: str,
+    roles: typing.Optional[typing.List[str]] = None,
+    can_manage: bool = False,
+) -> bool:
+    """判断授权集合中是否有结点的权限，结点自身及其父类结点上的授权均有效
+
+    Args:
+        grant_map: 用户授权集合
+        path: 结点路径
+        roles: 限定角色，有任意其中一种角色便是有权限
+        can_manage: 是否需要管理结点的权限
+
+    Returns:
+        有无权限
+    """
+    if not grant_map or not path:
+        return False
+    for _path in get_tree_paths(path):
+        for role_name, _can_manage in grant_map.get(_path, ()):
+            if roles and role_name not in roles:
+                continue
+            if can_manage and not _can_manage:
+                continue
+            return True
+    return False
+
+
+class PermCache(object):
+    """权限缓存
+
+    - grants: 以用户ID为key，缓存用户的授权集合
+    - nodes: 以结点path或key结点标识为key，缓存结点路径；结点不存在或已禁用缓存为空字符串
+    - shared: 跨进程共享缓存，依次查找进程内缓存、共享缓存、数据库
+    - 开启共享缓存后，进程内缓存的key带上共享缓存的版本号，其他进程失效缓存后不会再读到进程内的旧数据；
+      每次获取需要从共享缓存读取版本号，进程内缓存只节省读取和反序列化缓存数据的开销
+    - 用户授权缓存同时带上所有用户和单个用户授权的版本号，失效单个用户时递增该用户的版本号
+    """
+
+    def __init__(self) -> None:
+        self.grants = LRUCache("TREE_PERM_CACHE_MAXSIZE", "TREE_PERM_CACHE_TTL")
+        self.nodes = LRUCache("TREE_PERM_CACHE_MAXSIZE", "TREE_PERM_CACHE_TTL")
+        self.shared = SharedCache()
+
+    @property
+    def enabled(self) -> bool:
+        return self.local_enabled or self.shared.enabled
+
+    @property
+    def local_enabled(self) -> bool:
+        return bool(settings.TREE_PERM_CACHE_ENABLED)
+
+    def _get_or_load(
+        self,
+        local: LRUCache,
+        key: typing.Hashable,
+        namespace: str,
+        shared_key: str,
+        loader: typing.Callable[[], typing.Any],
+        scopes: typing.Sequence[str] = (),
+    ) -> typing.Any:
+        """依次从进程内缓存、共享缓存中获取，均未命中时调用loader加载并回填缓存
+
+        Args:
+            local: 进程内缓存
+            key: 进程内缓存的key
+            namespace: 共享缓存的命名空间
+            shared_key: 共享缓存的key
+            loader: 加载数据的方法
+            scopes: 除命名空间外，共享缓存key还需带上版本号的其他命名空间
+        """
+        local_enabled, shared_enabled = self.local_enabled, self.shared.enabled
+        generations = None
+        if shared_enabled:
+            # 加载前确定版本号，加载期间缓存失效时结果写入旧版本，不会被读取
+            generations = self.shared.get_generations([namespace, *scopes])
+            key = (key, generations)
+        value = local.get(key) if local_enabled else None
+        if value is not None:
+            return value
+        if shared_enabled:
+            value = self.shared.get(namespace, shared_key, generations)
+        if value is None:
+            value = loader()
+            if shared_enabled:
+                self.shared.set(namespace, shared_key, value, generations)
+        if local_enabled:
+            local.set(key, value)
+        return value
+
+    def get_user_grants(self, user_id: int) -> GrantMap:
+        """获取用户的授权集合，未命中缓存时查询数据库"""
+
+        def load() -> GrantMap:
+            from django_tree_perm.models import NodeRole
+
+            rows = NodeRole.objects.filter(user_id=user_id).values_list("node__path", "role__name", "role__can_manage")
+            return build_grant_map(rows)
+
+        return self._get_or_load(self.grants, user_id, "grants", str(user_id), load, scopes=[f"grants:{user_id}"])
+
+    def get_node_path(self, path: typing.Optional[str] = None, key_name: typing.Optional[str] = None) -> str:
+        """获取结点路径，优先按照key_name查找；结点不存在或已禁用时返回空字符串"""
+        if key_name:
+            cache_key: tuple = ("key", key_name)
+        elif path:
+            cache_key = ("path", path)
+        else:
+            return ""
+
+        def load() -> str:
+            from django_tree_perm.models import TreeNode
+            from django_tree_perm.index import tree_index
+
+            if tree_index.enabled:
+                return tree_index.get_node_path(path=path, key_name=key_name)
+            if key_name:
+                queryset = TreeNode.objects.filter(is_key=True, name=key_name)
+            else:
+                queryset = TreeNode.objects.filter(path=path)
+            row = queryset.values_list("path", "disabled").first()
+            return row[0] if row and not row[1] else ""
+
+        # 路径可能很长或包含特殊字符，共享缓存的key使用摘要
+        shared_key = "{}:{}".format(cache_key[0], hashlib.md5(cache_key[1].encode("utf-8")).hexdigest())
+        return self._get_or_load(self.nodes, cache_key, "nodes", shared_key, load)
+
+    def _clear_user(self, user_id: int) -> None:
+        self.grants.delete(user_id)
+        if self.shared.enabled:
+            self.shared.bump_generation(f"grants:{user_id}")
+
+    def _clear_grants(self) -> None:
+        self.grants.clear()
+        if self.shared.enabled:
+            self.shared.bump_generation("grants")
+
+    def _clear_nodes(self) -> None:
+        self.nodes.clear()
+        if self.shared.enabled:
+            self.shared.bump_generation("nodes")
+
+    def invalidate_user(self, user_id: int) -> None:
+        """失效用户的授权缓存；事务提交后会再次失效，避免缓存事务中的旧数据"""
+        self._clear_user(user_id)
+        transaction.on_commit(lambda: self._clear_user(user_id))
+
+    def invalidate_grants(self) -> None:
+        """失效所有用户的授权缓存"""
+        self._clear_grants()
+        transaction.on_commit(self._clear_grants)
+
+    def invalidate_all(self) -> None:
+        """失效所有缓存"""
+        self._clear_grants()
+        self._clear_nodes()
+        transaction.on_commit(self._clear_grants)
+        transaction.on_commit(self._clear_nodes)
+
+    def info(self) -> dict:
+        """缓存命中统计"""
+        return {
+            "grants": self.grants.info(),
+            "nodes": self.nodes.info(),
+            "shared": self.shared.info(),
+        }
+
+
+perm_cache = PermCache()
+change_generations = ChangeGenerations()
+tree_response_cache = TreeResponseCache()
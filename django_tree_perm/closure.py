@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+结点闭包表维护模块
+
+`TreeNodeClosure` 记录每个未禁用结点与其自身及所有父类结点的关系，父类结点、子孙结点查询改为索引关联。
+
+- 通过配置 `TREE_PERM_CLOSURE_ENABLED` 开启，默认关闭；开启前需执行 `python manage.py rebuild_tree_closure`
+- 结点新增、移动、导入、禁用由 `TreeNodeManger` 调用维护；结点删除时通过外键级联删除
+- 开启后 `PermManager.has_node_perm`、`TreeNodeQuerySet.filter_by_perm`、`Role.to_json(path=...)`
+  通过闭包表关联 `NodeRole.node_id` 判断继承的授权
+- 可通过管理命令 `rebuild_tree_closure` 全量重建，`--check` 检查数据一致性
+
+"""
+import typing
+import itertools
+
+from django.db import models
+
+from django_tree_perm import settings
+from django_tree_perm.utils import chunked
+from django_tree_perm.models import TreeNode, TreeNodeClosure
+
+
+# 每批处理的记录数量
+BATCH_SIZE = 1000
+
+# 父类结点ID和层级距离的列表，包含结点自身
+Chain = typing.List[typing.Tuple[int, int]]
+
+
+def is_enabled() -> bool:
+    return bool(settings.TREE_PERM_CLOSURE_ENABLED)
+
+
+def ancestor_ids(**lookups: typing.Any) -> models.QuerySet:
+    """查询匹配结点自身及其父类结点ID的子查询，用于关联 `NodeRole.node_id` 等外键
+
+    Args:
+        lookups: 结点的查询条件，例如 path="a.b"
+
+    Returns:
+        QuerySet, values("ancestor_id")
+    """
+    lookups = {f"descendant__{key}": value for key, value in lookups.items()}
+    return TreeNodeClosure.objects.filter(**lookups).values("ancestor_id")
+
+
+def _get_chains(node_ids: typing.Iterable[typing.Optional[int]]) -> typing.Dict[int, Chain]:
+    """查询结点自身及其父类结点，按照层级距离排序"""
+    chains: typing.Dict[int, Chain] = {}
+    for ids in chunked([node_id for node_id in set(node_ids) if node_id], BATCH_SIZE):
+        rows = TreeNodeClosure.objects.filter(descendant_id__in=ids).order_by("distance")
+        for descendant_id, ancestor_id, distance in rows.values_list("descendant_id", "ancestor_id", "distance"):
+            chains.setdefault(descendant_id, []).append((ancestor_id, distance))
+    return chains
+
+
+def _bulk_create(objs: typing.Iterable[TreeNodeClosure]) -> int:
+    count = 0
+    for chunk in chunked(objs, BATCH_SIZE):
+        TreeNodeClosure.objects.bulk_create(chunk)
+        count += len(chunk)
+    return count
+
+
+def _expand(node_id: int, parent_chain: Chain) -> Chain:
+    """根据父结点的关系计算结点自身的关系"""
+    return [(node_id, 0)] + [(ancestor_id, distance + 1) for ancestor_id, distance in parent_chain]
+
+
+def add_node(node: TreeNode) -> int:
+    """新增结点后写入其与自身及所有父类结点的关系
+
+    Returns:
+        写入的记录数量
+    """
+    chain = _expand(node.id, _get_chains([node.parent_id]).get(node.parent_id, []) if node.parent_id else [])
+    return _bulk_create(
+        TreeNodeClosure(ancestor_id=ancestor_id, descendant_id=node.id, distance=distance)
+        for ancestor_id, distance in chain
+    )
+
+
+def add_created(nodes: typing.List[TreeNode]) -> int:
+    """批量新增结点后写入关系，已存在的父结点一次查询获取其父类结点
+
+    Args:
+        nodes: 已写入数据库的新增结点
+
+    Returns:
+        写入的记录数量
+    """
+    created = set(node.id for node in nodes)
+    chains = _get_chains(node.parent_id for node in nodes if node.parent_id not in created)
+    objs: typing.List[TreeNodeClosure] = []
+    for node in sorted(nodes, key=lambda node: node.depth):
+        chains[node.id] = _expand(node.id, chains.get(node.parent_id, []) if node.parent_id else [])
+        objs.extend(
+            TreeNodeClosure(ancestor_id=ancestor_id, descendant_id=node.id, distance=distance)
+            for ancestor_id, distance in chains[node.id]
+        )
+    return _bulk_create(objs)
+
+
+def move_subtree(node: TreeNode) -> int:
+    """结点移动到新的父结点后，替换子树中所有结点与子树外父类结点的关系
+
+    子孙结点D与子树外父类结点的距离一定大于D与移动结点的距离，按照该距离分组删除，不需要排除子树内的结点。
+    已禁用的结点(没有关系记录)恢复时按照新增结点处理。
+
+    Returns:
+        写入的记录数量
+    """
+    subtree = list(TreeNodeClosure.objects.filter(ancestor_id=node.id).values_list("descendant_id", "distance"))
+    if not subtree:
+        return add_node(node)
+    subtree.sort(key=lambda item: item[1])
+    for distance, group in itertools.groupby(subtree, key=lambda item: item[1]):
+        for ids in chunked([descendant_id for descendant_id, _ in group], BATCH_SIZE):
+            TreeNodeClosure.objects.filter(descendant_id__in=ids, distance__gt=distance).delete()
+
+    parent_chain = _get_chains([node.parent_id]).get(node.parent_id, []) if node.parent_id else []
+    return _bulk_create(
+        TreeNodeClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, distance=distance + 1 + sub_distance)
+        for descendant_id, sub_distance in subtree
+        for ancestor_id, distance in parent_chain
+    )
+
+
+def clear_nodes(node_ids: typing.List[int]) -> None:
+    """清除结点的所有关系，用于key结点被禁用的场景"""
+    for ids in chunked(node_ids, BATCH_SIZE):
+        TreeNodeClosure.objects.filter(models.Q(descendant_id__in=ids) | models.Q(ancestor_id__in=ids)).delete()
+
+
+def iter_expected() -> typing.Iterator[typing.Tuple[int, int, int]]:
+    """按照深度逐层计算所有未禁用结点的关系，只保留上一层的结点关系
+
+    Returns:
+        (ancestor_id, descendant_id, distance) 的迭代器
+    """
+    rows = TreeNode.objects.filter(disabled=False).order_by("depth").values_list("id", "parent_id", "depth")
+    previous: typing.Dict[int, Chain] = {}
+    for _, group in itertools.groupby(rows.iterator(chunk_size=BATCH_SIZE), key=lambda row: row[2]):
+        current: typing.Dict[int, Chain] = {}
+        for node_id, parent_id, _ in group:
+            current[node_id] = _expand(node_id, previous.get(parent_id, []) if parent_id else [])
+            for ancestor_id, distance in current[node_id]:
+                yield ancestor_id, node_id, distance
+        previous = current
+
+
+def rebuild() -> int:
+    """全量重建闭包表
+
+    Returns:
+        写入的记录数量
+    """
+    TreeNodeClosure.objects.all().delete()
+    return _bulk_create(
+        TreeNodeClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, distance=distance)
+        for ancestor_id, descendant_id, distance in iter_expected()
+    )
+
+
+def check() -> dict:
+    """检查闭包表数据是否与结点数据一致
+
+    Returns:
+        dict, 包含缺失的记录 `missing` 和多余的记录 `extra`，值为 (ancestor_id, descendant_id, distance) 列表
+    """
+    expected = set(iter_expected())
+    actual = set(TreeNodeClosure.objects.values_list("ancestor_id", "descendant_id", "distance"))
+    return {
+        "missing": sorted(expected - actual),
+        "extra": sorted(actual - expected),
+    }
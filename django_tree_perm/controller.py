@@ -1,17 +1,42 @@
 #!/usr/bin/env python
 # coding=utf-8
+import json
 import typing
-
-import re
+import itertools
 
 from django.db import models
 from django.db import transaction
+from django.db.models.functions import Concat, Substr, MD5, Cast, Replace
+from django.utils import timezone
 from django.shortcuts import get_object_or_404
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 
+from django_tree_perm import settings
 from django_tree_perm import utils
 from django_tree_perm import exceptions
-from django_tree_perm.models import User, TreeNode, NodeRole
+from django_tree_perm import effective
+from django_tree_perm import counts
+from django_tree_perm import intervals
+from django_tree_perm import closure
+from django_tree_perm.cache import perm_cache, tree_response_cache, build_grant_map, match_grants
+from django_tree_perm.index import tree_index
+from django_tree_perm.search import search_index
+from django_tree_perm.trie import path_trie
+from django_tree_perm.models import User, TreeNode, Role, NodeRole, EffectivePerm, TreeNodeClosure
+
+
+class BinaryCollate(models.Func):
+    """按照二进制排序规则比较字符串，排序结果与数据库及字段的默认排序规则无关"""
+
+    template = "%(expressions)s"
+    # 各数据库的二进制排序规则，未定义的数据库使用默认排序规则
+    collations = {"postgresql": "C", "mysql": "utf8mb4_bin", "sqlite": "BINARY", "oracle": "BINARY"}
+
+    def as_sql(self, compiler: typing.Any, connection: typing.Any, **extra_context: typing.Any) -> typing.Any:
+        collation = self.collations.get(connection.vendor)
+        if collation:
+            extra_context["template"] = f"%(expressions)s COLLATE {connection.ops.quote_name(collation)}"
+        return super().as_sql(compiler, connection, **extra_context)
 
 
 class TreeNodeManger(object):
@@ -19,6 +44,11 @@ class TreeNodeManger(object):
     树结点管理类
     """
 
+    # 树型结构json数据中结点的字段，同 `TreeNode.to_json(partial=True)`
+    TREE_JSON_FIELDS = ("id", "name", "alias", "parent_id", "is_key", "path")
+    # 扁平结点记录允许的字段，见 `import_tree_records`
+    TREE_RECORD_FIELDS = ("path", "alias", "description", "is_key")
+
     def __init__(
         self,
         node: typing.Optional[TreeNode] = None,
@@ -96,7 +126,13 @@ class TreeNodeManger(object):
             "disabled": False,
         }
         node = TreeNode(**values)
-        node.validate_save()
+        with transaction.atomic():
+            if intervals.is_enabled():
+                intervals.place_new(node)
+            node.validate_save()
+            counts.update_ancestors(node.path, 1)
+            if closure.is_enabled():
+                closure.add_node(node)
         return cls(node=node, user=user)
 
     @transaction.atomic
@@ -191,25 +227,120 @@ class TreeNodeManger(object):
         if node.parent_id == parent.id:
             # 已在节点下无需处理
             return 0
+        # 按照区间查询子结点前重新获取区间
+        intervals.refresh(node)
+
+        # 结点自身及其子孙结点个数，已禁用的结点不在父类结点的计数中
+        size = 1 + node.descendant_count
+        old_path = "" if node.disabled else node.path
 
         node.parent = parent
         node.disabled = False
         # 要更新所有子结点path属性
         old_prefix = node.path_prefix  # 提前记录旧的树路径
+        old_depth = node.depth
+        old_ancestors = utils.join_ancestor_ids(node.ancestor_ids, node.id)
+        # 按照旧的路径或者区间查询所有子结点
+        children = TreeNode.objects.descendants_of(node)
         # 优先更新结点自身
         node.validate_save()
         rows = 1
+        deltas = counts.collect({}, utils.get_path_parent(node.path), 1, size)
+        if old_path:
+            counts.collect(deltas, utils.get_path_parent(old_path), -1, -size)
+        counts.apply(deltas)
 
         # 更新所有子结点path属性
-        nodes = list(TreeNode.objects.filter(path__startswith=old_prefix))
-        if nodes:
-            new_prefix = node.path_prefix
-            for _node in nodes:
-                re_prefix = old_prefix.replace(".", "\\.")
-                _node.path = re.sub(rf"^{re_prefix}", new_prefix, _node.path, flags=0)
-                _node.patch_attrs()
-            TreeNode.objects.bulk_update(nodes, TreeNode.TREE_SPECIAL_FIELDS, batch_size=1000)
-            rows += len(nodes)
+        if settings.TREE_PERM_MOVE_IN_DB:
+            count = self._move_children_in_db(
+                children,
+                old_prefix,
+                node.path_prefix,
+                node.depth - old_depth,
+                old_ancestors=old_ancestors,
+                new_ancestors=utils.join_ancestor_ids(node.ancestor_ids, node.id),
+            )
+        else:
+            count = self._move_children_in_python(node, children)
+        if intervals.is_enabled():
+            intervals.place_moved(node)
+        if closure.is_enabled():
+            closure.move_subtree(node)
+        if count:
+            rows += count
+            # 批量更新不会触发信号
+            tree_response_cache.invalidate()
+            if tree_index.enabled:
+                tree_index.invalidate()
+            if search_index.enabled:
+                search_index.invalidate()
+            if path_trie.active:
+                path_trie.invalidate()
+            if effective.is_enabled():
+                # 子结点中key结点继承的权限发生变化
+                effective.sync_key_nodes(node.get_self_and_children())
+        return rows
+
+    @classmethod
+    def _move_children_in_python(cls, node: TreeNode, children: models.QuerySet) -> int:
+        """逐个结点计算 `TREE_SPECIAL_FIELDS` 后批量更新
+
+        按照深度由浅到深处理，子结点的路径根据已更新的父结点拼接
+
+        Args:
+            node: 已更新的结点
+            children: 按照移动前的路径或者区间查询子结点的条件
+
+        Returns:
+            更新结点记录数量
+        """
+        nodes = list(children.order_by("depth"))
+        parents = {node.id: node}
+        for _node in nodes:
+            if _node.parent_id in parents:
+                _node.parent = parents[_node.parent_id]
+            _node.patch_attrs()
+            parents[_node.id] = _node
+        TreeNode.objects.bulk_update(nodes, TreeNode.TREE_SPECIAL_FIELDS, batch_size=1000)
+        return len(nodes)
+
+    @classmethod
+    def _move_children_in_db(
+        cls,
+        children: models.QuerySet,
+        old_prefix: str,
+        new_prefix: str,
+        depth_delta: int,
+        old_ancestors: str = "",
+        new_ancestors: str = "",
+    ) -> int:
+        """在数据库中按集合更新子结点的 `TREE_SPECIAL_FIELDS`，不加载结点数据
+
+        - 一条 UPDATE 替换路径前缀和父类结点ID前缀并调整深度；
+        - 一条 UPDATE 重新计算非key结点的 node_hash，key结点按照 name 计算无需更新；
+        - 已禁用的结点已脱离树结构，不做处理；
+
+        Args:
+            children: 按照移动前的路径或者区间查询子结点的条件
+            old_prefix: 移动前的路径前缀
+            new_prefix: 移动后的路径前缀
+            depth_delta: 深度的变化
+            old_ancestors: 移动前子结点的父类结点ID前缀
+            new_ancestors: 移动后子结点的父类结点ID前缀
+
+        Returns:
+            更新结点记录数量
+        """
+        rows = children.filter(disabled=False).update(
+            path=Concat(models.Value(new_prefix), Substr("path", len(old_prefix) + 1)),
+            depth=models.F("depth") + depth_delta,
+            ancestor_ids=Concat(models.Value(new_ancestors), Substr("ancestor_ids", len(old_ancestors) + 1)),
+            updated_at=timezone.now(),
+        )
+        if rows:
+            TreeNode.objects.filter(path__startswith=new_prefix, disabled=False, is_key=False).update(
+                node_hash=MD5("path")
+            )
         return rows
 
     @transaction.atomic
@@ -241,6 +372,11 @@ class TreeNodeManger(object):
             node.parent = None
             node.disabled = True
             node.validate_save()
+            counts.update_ancestors(node.path, -1)
+            if intervals.is_enabled():
+                TreeNode.objects.filter(id=node.id).update(lft=0, rgt=0)
+            if closure.is_enabled():
+                closure.clear_nodes([node.id])
             # 清除结点相关用户权限
             NodeRole.objects.filter(node_id=node.id).delete()
             return 0
@@ -255,8 +391,10 @@ class TreeNodeManger(object):
         if not has_children:
             # 会级联删除相关用户权限
             node.delete()
+            counts.update_ancestors(node.path, -1)
             return 1
-        # 处理子结点
+        # 处理子结点，按照区间查询前重新获取区间
+        intervals.refresh(node)
         query_set = node.get_self_and_children()
         # 更新所有叶子key结点为disabled
         node_ids = []
@@ -264,18 +402,145 @@ class TreeNodeManger(object):
         for _node in query_set.filter(is_key=True, disabled=False):
             _node.disabled = True
             _node.parent = None
+            _node.lft = _node.rgt = 0
             _node.patch_attrs()
             nodes.append(_node)
             node_ids.append(_node.id)
         if nodes:
-            fields = list(set(["disabled", "parent"] + list(TreeNode.TREE_SPECIAL_FIELDS)))
+            fields = list(
+                set(["disabled", "parent"] + list(TreeNode.TREE_SPECIAL_FIELDS + TreeNode.TREE_INTERVAL_FIELDS))
+            )
             TreeNode.objects.bulk_update(nodes, fields, batch_size=1000)
+            # 批量更新不会触发信号
+            tree_response_cache.invalidate()
+            if tree_index.enabled:
+                tree_index.invalidate()
+            if search_index.enabled:
+                search_index.invalidate()
+            if path_trie.active:
+                path_trie.invalidate()
             # 清除结点相关用户权限
             NodeRole.objects.filter(node_id__in=node_ids).delete()
+            if effective.is_enabled():
+                effective.clear_key_nodes(node_ids)
+            if closure.is_enabled():
+                closure.clear_nodes(node_ids)
         # 删除所有子结点
-        row, _ = query_set.filter(is_key=False).delete()
+        row, deleted = query_set.filter(is_key=False).delete()
+        counts.update_ancestors(node.path, -(len(nodes) + deleted.get(TreeNode._meta.label, 0)))
         return row
 
+    def remove_in_chunks(
+        self,
+        chunk_size: int = 1000,
+        progress: typing.Optional[typing.Callable[[int, int], None]] = None,
+    ) -> int:
+        """分批删除结点及其所有子结点，与 `remove(clear_chidren=True)` 效果一致，用于子树很大的场景
+
+        - 每批在单独的事务中执行，中断后重新执行可继续删除；
+        - 先分批禁用子树中的key结点，再按照深度由深到浅分批删除其他结点，结点自身最后删除；
+        - 每批删除的结点深度相同，同一条删除语句中不会同时包含父结点和子结点，逐行检查外键约束的数据库也不会报错；
+        - 用户权限等关联数据直接按照条件批量删除，不加载到内存中，也不会触发删除信号；
+        - 每批事务提交后失效缓存和索引，中断后已提交的变更也不会读到旧数据；
+        - 其他事务可能重新编号区间，每批在事务中重新获取结点的区间后再查询子树；
+
+        Args:
+            chunk_size: 每批处理的结点数量
+            progress: 进度回调，参数为已处理的结点数量和结点总数
+
+        Raises:
+            exceptions.PermDenyException: 无权限时抛出的异常
+            exceptions.ParamsValidateException: 结点数据校验异常
+
+        Returns:
+            删除结点数据库记录的数量
+        """
+        node = self.node
+        if node.is_key or not node.children.exists():
+            return self.remove(clear_chidren=True)
+        # 校验权限
+        if self.user and not PermManager.has_node_perm(self.user, path=node.path, can_manage=True):
+            raise exceptions.PermDenyException(f"No remove permission for the path={node.path}")
+
+        # 使用维护的子孙结点个数作为进度总数，不再统计子树
+        total = 1 + node.descendant_count
+        done = 0
+        parent_path = utils.get_path_parent(node.path)
+
+        def _raw_delete_relations(node_ids: typing.List[int]) -> None:
+            for queryset in (
+                EffectivePerm.objects.filter(node_id__in=node_ids),
+                EffectivePerm.objects.filter(node_role__node_id__in=node_ids),
+                NodeRole.objects.filter(node_id__in=node_ids),
+                TreeNodeClosure.objects.filter(descendant_id__in=node_ids),
+                TreeNodeClosure.objects.filter(ancestor_id__in=node_ids),
+            ):
+                queryset._raw_delete(queryset.db)
+
+        def _subtree() -> models.QuerySet:
+            intervals.refresh(node)
+            return node.get_self_and_children()
+
+        def _invalidate() -> None:
+            # 未触发信号，手动失效缓存和索引，均在事务提交后生效
+            perm_cache.invalidate_all()
+            tree_response_cache.invalidate()
+            if tree_index.enabled:
+                tree_index.invalidate()
+            if search_index.enabled:
+                search_index.invalidate()
+            if path_trie.active:
+                path_trie.invalidate()
+
+        # 分批禁用key结点，路径保持不变，node_hash 按照主键计算
+        while True:
+            with transaction.atomic():
+                key_qs = _subtree().filter(is_key=True, disabled=False)
+                node_ids = list(key_qs.values_list("id", flat=True)[:chunk_size])
+                if not node_ids:
+                    break
+                _raw_delete_relations(node_ids)
+                TreeNode.objects.filter(id__in=node_ids).update(
+                    disabled=True,
+                    parent=None,
+                    lft=0,
+                    rgt=0,
+                    ancestor_ids="",
+                    node_hash=MD5(Cast("id", output_field=models.CharField())),
+                    updated_at=timezone.now(),
+                )
+                # 子树内的其他结点随后都会被删除，只更新结点自身及其父类结点链路
+                counts.apply(counts.collect({}, node.path, 0, -len(node_ids)))
+                _invalidate()
+            done += len(node_ids)
+            if progress:
+                progress(done, total)
+
+        # 由深到浅逐层分批删除，删除时子结点已不存在
+        rows = 0
+        while True:
+            with transaction.atomic():
+                node_qs = _subtree().filter(is_key=False)
+                depth = node_qs.order_by("-depth").values_list("depth", flat=True).first()
+                if depth is None:
+                    break
+                node_ids = list(node_qs.filter(depth=depth).values_list("id", flat=True)[:chunk_size])
+                _raw_delete_relations(node_ids)
+                deleted = TreeNode.objects.filter(id__in=node_ids)._raw_delete(TreeNode.objects.db)
+                deltas = counts.collect({}, node.path, 0, -deleted)
+                if node.id in node_ids:
+                    counts.collect(deltas, parent_path, -1, 0)
+                counts.apply(deltas)
+                _invalidate()
+            rows += deleted
+            done += len(node_ids)
+            if progress:
+                progress(done, total)
+            if node.id in node_ids:
+                # 结点自身最后删除，子树已删除完毕
+                break
+        return rows
+
     @classmethod
     def find_parent_node(
         cls,
@@ -349,37 +614,223 @@ class TreeNodeManger(object):
         return node
 
     @classmethod
-    def load_tree_data(cls, data: typing.List[dict]) -> int:
-        """加载JSON树结构数据写入数据库中
+    def load_tree_data(cls, data: typing.List[dict], batch_size: int = 1000) -> int:
+        """加载JSON树结构数据写入数据库中，详见 `import_tree_data`
 
         Args:
             data: 树结构数据
+            batch_size: 每批写入的结点数量
 
         Returns:
             新增结点个数
         """
+        return cls.import_tree_data(data, batch_size=batch_size)["created"]
+
+    @classmethod
+    def import_tree_data(cls, data: typing.List[dict], batch_size: int = 1000) -> typing.Dict[str, int]:
+        """按照树的层级批量导入JSON树结构数据
 
-        def _save_nodes(items: typing.List, parent: typing.Optional[TreeNode] = None) -> int:
-            count = 0
-            for item in items:
-                # 提取子结点数据
-                children = item.pop("children", [])
-                name = item["name"]
-                # 处理当前结点
-                path = utils.TREE_SPLIT_NODE_FLAG.join([parent.path, name]) if parent else name
-                node = TreeNode.objects.filter(path=path).first()
-                if not node:
-                    count += 1
-                    node = TreeNode(parent_id=parent.id if parent else None, **item)
-                    node.validate_save()
-                # 处理子结点
-                count += _save_nodes(children, parent=node)
-            return count
+        - 一次查询获取已存在的结点路径，已存在的结点跳过，其子结点继续导入；
+        - 结点数据在内存中校验并计算 `TREE_SPECIAL_FIELDS`，每一层级批量写入；
+        - 任意结点校验失败则整体回滚；
 
+        Args:
+            data: 树结构数据，结点的子结点放在 `children` 中
+            batch_size: 每批写入的结点数量
+
+        Raises:
+            ValidationError: 结点数据校验异常
+            exceptions.ParamsValidateException: key结点作为父结点或根结点
+
+        Returns:
+            dict, 新增结点个数 `created` 和已存在跳过的结点个数 `skipped`
+        """
+        result = {"created": 0, "skipped": 0}
+        if not data:
+            return result
+
+        # 一次查询获取导入数据所在子树中已存在的结点
+        query = models.Q()
+        for name in set(item["name"] for item in data):
+            query |= models.Q(path=name) | models.Q(path__startswith=f"{name}{utils.TREE_SPLIT_NODE_FLAG}")
+        existing = cls._get_existing_nodes(TreeNode.objects.filter(query, disabled=False))
+        created_nodes: typing.List[TreeNode] = []
+
+        # 当前层级待处理的 (结点数据, 父结点)
+        level: typing.List[typing.Tuple[dict, typing.Optional[TreeNode]]] = [(item, None) for item in data]
         with transaction.atomic():
-            total = _save_nodes(data)
+            while level:
+                nodes: typing.Dict[str, TreeNode] = {}
+                next_level: typing.List[typing.Tuple[dict, typing.Optional[TreeNode]]] = []
+                for item, parent in level:
+                    values = {k: v for k, v in item.items() if k != "children"}
+                    node = cls._build_node(parent=parent, **values)
+                    if node.path in existing or node.path in nodes:
+                        result["skipped"] += 1
+                        node = nodes.get(node.path) or existing[node.path]
+                    else:
+                        nodes[node.path] = node
+                    next_level.extend((child, node) for child in item.get("children") or [])
+
+                new_nodes = list(nodes.values())
+                cls._bulk_create_nodes(new_nodes, batch_size=batch_size)
+                created_nodes.extend(new_nodes)
+                result["created"] += len(new_nodes)
+                level = next_level
+
+            if created_nodes:
+                cls._after_bulk_create(created_nodes, batch_size=batch_size)
+        return result
+
+    @classmethod
+    def import_tree_records(
+        cls,
+        records: typing.Iterable[dict],
+        chunk_size: int = 1000,
+        resume_after: typing.Optional[str] = None,
+        progress: typing.Optional[typing.Callable[[typing.Dict[str, typing.Any]], None]] = None,
+    ) -> typing.Dict[str, typing.Any]:
+        """流式导入扁平的结点记录，内存占用只与 chunk_size 有关，用于导入超大的树
+
+        - 每条记录包含结点路径 `path`，以及可选字段 `alias`/`description`/`is_key`，其他字段视为参数错误；
+        - 父结点记录需在子结点之前，或者已存在数据库中；
+        - 每 chunk_size 条记录在单独的事务中写入，已存在的结点跳过；
+        - 中断后可通过 resume_after 传递最后提交的路径，跳过该路径及之前的记录继续导入；
+
+        Args:
+            records: 结点记录的可迭代对象，例如逐行解析NDJSON文件
+            chunk_size: 每个事务写入的记录数量
+            resume_after: 上次最后提交的结点路径
+            progress: 每批提交后的回调，参数与返回值一致
 
-        return total
+        Raises:
+            ValidationError: 结点数据校验异常
+            exceptions.ParamsValidateException: 记录字段错误、父结点不存在、key结点作为父结点或根结点，或者未找到 resume_after
+
+        Returns:
+            dict, 新增结点个数 `created`、已存在跳过的结点个数 `skipped` 和最后提交的结点路径 `last_path`
+        """
+        result: typing.Dict[str, typing.Any] = {"created": 0, "skipped": 0, "last_path": resume_after}
+        iterator = iter(records)
+        if resume_after:
+            for record in iterator:
+                if record.get("path") == resume_after:
+                    break
+            else:
+                raise exceptions.ParamsValidateException(f"The resume path={resume_after} not found in records.")
+        for chunk in utils.chunked(iterator, chunk_size):
+            with transaction.atomic():
+                created, skipped = cls._import_records_chunk(chunk, batch_size=chunk_size)
+            result["created"] += created
+            result["skipped"] += skipped
+            result["last_path"] = chunk[-1]["path"]
+            if progress:
+                progress(dict(result))
+        return result
+
+    @classmethod
+    def _import_records_chunk(cls, records: typing.List[dict], batch_size: int = 1000) -> typing.Tuple[int, int]:
+        """写入一批扁平的结点记录，按照深度由浅到深批量写入
+
+        Returns:
+            新增结点个数和已存在跳过的结点个数
+        """
+        for record in records:
+            unknown = set(record) - set(cls.TREE_RECORD_FIELDS)
+            if unknown or not record.get("path"):
+                raise exceptions.ParamsValidateException(
+                    f"Invalid node record {record}, allowed fields: {', '.join(cls.TREE_RECORD_FIELDS)}."
+                )
+        paths = set(record["path"] for record in records)
+        lookup = paths | set(utils.get_path_parent(path) for path in paths)
+        existing = cls._get_existing_nodes(TreeNode.objects.filter(path__in=lookup, disabled=False))
+
+        nodes: typing.Dict[str, TreeNode] = {}
+        skipped = 0
+        records = sorted(records, key=lambda record: record["path"].count(utils.TREE_SPLIT_NODE_FLAG))
+        for _, group in itertools.groupby(records, key=lambda record: record["path"].count(utils.TREE_SPLIT_NODE_FLAG)):
+            new_nodes = []
+            for record in group:
+                path = record["path"]
+                if path in existing or path in nodes:
+                    skipped += 1
+                    continue
+                parent = None
+                parent_path = utils.get_path_parent(path)
+                if parent_path:
+                    parent = nodes.get(parent_path) or existing.get(parent_path)
+                    if not parent:
+                        raise exceptions.ParamsValidateException(f"The parent node of path={path} not found.")
+                values = {k: v for k, v in record.items() if k != "path"}
+                node = cls._build_node(name=path.split(utils.TREE_SPLIT_NODE_FLAG)[-1], parent=parent, **values)
+                nodes[path] = node
+                new_nodes.append(node)
+            cls._bulk_create_nodes(new_nodes, batch_size=batch_size)
+        if nodes:
+            cls._after_bulk_create(list(nodes.values()), batch_size=batch_size)
+        return len(nodes), skipped
+
+    @classmethod
+    def _get_existing_nodes(cls, queryset: models.QuerySet) -> typing.Dict[str, TreeNode]:
+        """查询已存在的结点，仅包含作为父结点校验及计算子结点 `TREE_SPECIAL_FIELDS` 所需的字段"""
+        rows = queryset.values_list("id", "path", "is_key", "ancestor_ids")
+        return {
+            path: TreeNode(id=node_id, path=path, is_key=is_key, ancestor_ids=ancestor_ids)
+            for node_id, path, is_key, ancestor_ids in rows
+        }
+
+    @classmethod
+    def _build_node(cls, parent: typing.Optional[TreeNode] = None, **values: typing.Any) -> TreeNode:
+        """构造结点对象并在内存中校验字段，不查询数据库；与 `add_node` 一致，key结点不能作为父结点或根结点"""
+        if parent and parent.is_key:
+            raise exceptions.ParamsValidateException("This key node is not allowed to be a parent node.")
+        if not parent and values.get("is_key"):
+            raise exceptions.ParamsValidateException("Leaf nodes are not allowed to be root node.")
+        node = TreeNode(parent=parent, **values)
+        node.patch_attrs()
+        node.clean_fields(exclude=["parent", "node_hash"])
+        return node
+
+    @classmethod
+    def _bulk_create_nodes(cls, nodes: typing.List[TreeNode], batch_size: int = 1000) -> None:
+        """校验 node_hash 唯一(路径及key结点标识全局唯一)后批量写入，并回填主键
+
+        key结点的 node_hash 由标识计算，可能与同名的根结点路径相同，所以按照 node_hash 校验所有结点。
+        """
+        if not nodes:
+            return
+        hashes = [node.node_hash for node in nodes]
+        duplicated = len(set(hashes)) != len(hashes)
+        for chunk in utils.chunked(hashes, batch_size):
+            if duplicated or TreeNode.objects.filter(node_hash__in=chunk).exists():
+                raise ValidationError({"node_hash": [TreeNode._meta.get_field("node_hash").error_messages["unique"]]})
+        TreeNode.objects.bulk_create(nodes, batch_size=batch_size)
+        # 部分数据库 bulk_create 不会回填主键
+        missing = {node.path: node for node in nodes if node.pk is None}
+        for chunk in utils.chunked(list(missing.keys()), batch_size):
+            for path, node_id in TreeNode.objects.filter(path__in=chunk, disabled=False).values_list("path", "id"):
+                missing[path].id = node_id
+
+    @classmethod
+    def _after_bulk_create(cls, nodes: typing.List[TreeNode], batch_size: int = 1000) -> None:
+        """批量写入不会触发信号，手动更新结点计数、失效缓存和索引，并计算新增key结点的生效权限"""
+        counts.apply_created(nodes)
+        if intervals.is_enabled():
+            intervals.place_created(nodes)
+        if closure.is_enabled():
+            closure.add_created(nodes)
+        key_ids = [node.id for node in nodes if node.is_key]
+        perm_cache.invalidate_all()
+        tree_response_cache.invalidate()
+        if tree_index.enabled:
+            tree_index.invalidate()
+        if search_index.enabled:
+            search_index.invalidate()
+        if path_trie.active:
+            path_trie.invalidate()
+        if effective.is_enabled():
+            for chunk in utils.chunked(key_ids, batch_size):
+                effective.sync_key_nodes(TreeNode.objects.filter(id__in=chunk))
 
     @classmethod
     def to_json_tree(cls, queryset: models.QuerySet, trace_to_root: bool = True) -> typing.List[dict]:
@@ -392,35 +843,166 @@ class TreeNodeManger(object):
         Returns:
             list[dict] 树型结构json数据
         """
+        fields = cls.TREE_JSON_FIELDS
         if trace_to_root:
-            paths = utils.get_tree_paths(list(queryset.values_list("path", flat=True)))
-            queryset = TreeNode.objects.all().filter(path__in=paths)
-
+            items = {row["path"]: row for row in queryset.values(*fields)}
+            # 补全缺失的父类结点，已查询到的结点不再重复查询
+            paths = [path for path in utils.get_tree_paths(list(items.keys())) if path not in items]
+            if paths and tree_index.enabled:
+                # 父类结点从内存索引中获取
+                for path in paths:
+                    index_node = tree_index.get_by_path(path)
+                    if index_node:
+                        items[path] = index_node.to_json()
+            elif paths:
+                for chunk in utils.chunked(paths, 1000):
+                    items.update((row["path"], row) for row in TreeNode.objects.filter(path__in=chunk).values(*fields))
+            nodes: typing.Iterable[dict] = [items[path] for path in sorted(items.keys())]
+        else:
+            nodes = queryset.values(*fields).iterator(chunk_size=2000)
+
+        # 一次遍历将子结点挂到父结点上，父结点不在结果中的结点不展示
         tree = []
-        # 以parent_id为key, value是数组--存放直接子结点
-        parent_child_nodes: dict = {}
-        for node in queryset:
-            if node.parent_id:
-                parent_child_nodes.setdefault(node.parent_id, [])
-                parent_child_nodes[node.parent_id].append(node.to_json(partial=True))
+        parents: typing.Dict[int, dict] = {}
+        orphans = []
+        for node in nodes:
+            parents[node["id"]] = node
+            parent_id = node["parent_id"]
+            if not parent_id:
+                tree.append(node)
+            elif parent_id in parents:
+                parents[parent_id].setdefault("children", []).append(node)
             else:
-                tree.append(node.to_json(partial=True))
-
-        # 组装树形结构
-        leafs = tree
-        while True:
-            if not leafs:
-                break
-            new_leafs = []
-            for parent in leafs:
-                children = parent_child_nodes.get(parent["id"], [])
-                if children:
-                    parent["children"] = children
-                    new_leafs.extend(children)
-            leafs = new_leafs
+                orphans.append(node)
+        # 结点顺序不保证父结点在前时补充挂载
+        for node in orphans:
+            parent = parents.get(node["parent_id"])
+            if parent:
+                parent.setdefault("children", []).append(node)
 
         return tree
 
+    @classmethod
+    def load_children(
+        cls,
+        parent_id: typing.Optional[int] = None,
+        parent_path: typing.Optional[str] = None,
+        levels: int = 1,
+        page: int = 1,
+        page_size: int = 1000,
+    ) -> typing.Dict[str, typing.Any]:
+        """逐级加载子结点，结点数据同 `TreeNode.to_json(partial=True)`，并返回直接子结点个数
+
+        - 不传递父结点时加载根结点；
+        - 父结点的直接子结点分页返回，`count` 是直接子结点总个数；
+        - levels 大于1时，继续加载下级结点放在 `children` 中，每个结点最多返回 page_size 个子结点，
+          可根据 `children_count` 判断是否需要按照 parent_id 分页加载剩余的子结点；
+
+        Args:
+            parent_id: 父结点ID
+            parent_path: 父结点路径
+            levels: 加载的层级数
+            page: 页码
+            page_size: 每页子结点个数
+
+        Returns:
+            dict, 包含 `count` 和 `results`，结点额外包含 `children_count`、`descendant_count`、`has_children`
+        """
+        queryset = TreeNode.objects.filter(disabled=False)
+        if parent_id:
+            queryset = queryset.filter(parent_id=parent_id)
+        elif parent_path:
+            queryset = queryset.filter(parent__path=parent_path)
+        else:
+            queryset = queryset.filter(depth=1)
+
+        offset = (page - 1) * page_size
+        end = offset + page_size
+        results = cls._with_has_children(cls._values_with_children_count(queryset)[offset:end])
+        if offset == 0 and len(results) < page_size:
+            # 第一页未满时无需再查询总数
+            count = len(results)
+        else:
+            count = queryset.count()
+
+        nodes = results
+        for _ in range(levels - 1):
+            parents = {node["id"]: node for node in nodes if node["has_children"]}
+            nodes = []
+            for chunk in utils.chunked(list(parents.keys()), 1000):
+                rows = cls._values_with_children_count(TreeNode.objects.filter(disabled=False, parent_id__in=chunk))
+                for node in rows.iterator(chunk_size=2000):
+                    children = parents[node["parent_id"]].setdefault("children", [])
+                    if len(children) < page_size:
+                        children.append(node)
+                        nodes.append(node)
+            cls._with_has_children(nodes)
+        return {"count": count, "results": results}
+
+    @classmethod
+    def _values_with_children_count(cls, queryset: models.QuerySet) -> models.QuerySet:
+        """按照路径排序，查询结点数据及未禁用的直接子结点、子孙结点个数"""
+        return queryset.order_by("path").values(
+            *cls.TREE_JSON_FIELDS, "descendant_count", children_count=models.F("child_count")
+        )
+
+    @classmethod
+    def _with_has_children(cls, nodes: typing.Iterable[dict]) -> typing.List[dict]:
+        nodes = list(nodes)
+        for node in nodes:
+            node["has_children"] = node["children_count"] > 0
+        return nodes
+
+    @classmethod
+    def iter_json_tree(cls, path: typing.Optional[str] = None, chunk_size: int = 2000) -> typing.Iterator[str]:
+        """流式生成树型结构的JSON文本，用于导出超大的树
+
+        按照路径顺序分批遍历结点，只保留当前结点的父类结点链路，内存占用与树的大小无关；
+        结点数据同 `TreeNode.to_json(partial=True)`，子结点放在 `children` 中。
+
+        Args:
+            path: 结点路径，仅导出该结点及其子结点；不传递导出整棵树
+            chunk_size: 每批从数据库读取的结点数量
+
+        Returns:
+            JSON文本片段的迭代器，拼接后是结点数组
+        """
+        queryset = TreeNode.objects.filter(disabled=False)
+        if path:
+            queryset = queryset.filter(
+                models.Q(path=path) | models.Q(path__startswith=f"{path}{utils.TREE_SPLIT_NODE_FLAG}")
+            )
+        # 字符"-"排在分隔符"."之前，替换为之后的字符，保证子结点紧跟在父结点之后；
+        # 按照二进制排序规则排序，避免数据库的排序规则忽略标点或不按字节比较，导致子结点与父结点不相邻
+        rows = (
+            queryset.annotate(sort_path=BinaryCollate(Replace("path", models.Value("-"), models.Value("/"))))
+            .order_by("sort_path")
+            .values(*cls.TREE_JSON_FIELDS)
+            .iterator(chunk_size=chunk_size)
+        )
+
+        # 父类结点链路：[路径, 是否已输出children]
+        stack: typing.List[list] = []
+        parts = ["["]
+        for row in rows:
+            while stack and not row["path"].startswith(f"{stack[-1][0]}{utils.TREE_SPLIT_NODE_FLAG}"):
+                parts.append("]}" if stack.pop()[1] else "}")
+            if stack:
+                parts.append("," if stack[-1][1] else ', "children": [')
+                stack[-1][1] = True
+            elif len(parts) > 1:
+                parts.append(",")
+            # 去掉结尾的"}"，等待追加子结点
+            parts.append(json.dumps(row)[:-1])
+            stack.append([row["path"], False])
+            if len(parts) >= chunk_size:
+                yield "".join(parts)
+                parts = []
+        while stack:
+            parts.append("]}" if stack.pop()[1] else "}")
+        parts.append("]")
+        yield "".join(parts)
+
 
 class PermManager(object):
     """权限管理"""
@@ -456,6 +1038,12 @@ class PermManager(object):
 
         - 主要用于其他系统调用，判断用户是否有某key node的权限；
         - 结点的管理权限判断，需传递参数 can_manage=True；
+        - 开启 `TREE_PERM_CACHE_ENABLED` 后，使用进程内缓存的用户授权判断，命中缓存时无需查询数据库；
+        - 开启 `TREE_PERM_SHARED_CACHE_ENABLED` 后，使用跨进程共享缓存的用户授权判断；
+        - 开启 `TREE_PERM_EFFECTIVE_ENABLED` 后，按照 key_name 判断时直接查询生效权限表；
+        - 未开启缓存时，结点和角色条件均作为子查询，只查询一次数据库；
+        - 开启 `TREE_PERM_CLOSURE_ENABLED` 后，通过闭包表关联结点自身及其父类结点上的授权；
+        - 开启 `TREE_PERM_INDEX_ENABLED` 后，从内存索引中获取结点及其父类结点ID，按照结点ID查询授权，不关联结点表；
 
         Args:
             user: 用户
@@ -474,20 +1062,336 @@ class PermManager(object):
         if not user:
             return False
 
-        node = None
-        if key_name:
-            node = TreeNode.objects.filter(is_key=True, name=key_name).first()
-        elif path:
-            node = TreeNode.objects.filter(path=path).first()
-        if not node or node.disabled:
+        if perm_cache.enabled:
+            node_path = perm_cache.get_node_path(path=path, key_name=key_name)
+            return match_grants(perm_cache.get_user_grants(user.id), node_path, roles=roles, can_manage=can_manage)
+
+        if key_name and effective.is_enabled():
+            ep_qs = EffectivePerm.objects.filter(user_id=user.id, node__is_key=True, node__name=key_name)
+            if roles:
+                ep_qs = ep_qs.filter(role__name__in=roles)
+            if can_manage:
+                ep_qs = ep_qs.filter(role__can_manage=True)
+            return ep_qs.exists()
+
+        if closure.is_enabled() and (key_name or path):
+            # 授权结点是闭包表中目标结点的父类结点(含自身)，一次索引关联完成判断
+            if key_name:
+                node_ids = closure.ancestor_ids(is_key=True, name=key_name)
+            else:
+                node_ids = closure.ancestor_ids(path=path)
+            queryset = NodeRole.objects.filter(user_id=user.id, node_id__in=node_ids)
+        elif tree_index.enabled:
+            # 从内存索引中获取结点及其父类结点ID
+            index_node = tree_index.get_node(path=path, key_name=key_name)
+            if not index_node:
+                return False
+            queryset = NodeRole.objects.filter(user_id=user.id, node_id__in=index_node.get_ancestor_ids())
+        elif key_name or path:
+            # 结点查询作为子查询，一次查询完成判断
+            if key_name:
+                # 授权结点是目标结点自身或其父类结点
+                node_qs = TreeNode.objects.filter(is_key=True, name=key_name).filter(
+                    models.Q(path=models.OuterRef("node__path"))
+                    | models.Q(
+                        path__startswith=Concat(models.OuterRef("node__path"), models.Value(utils.TREE_SPLIT_NODE_FLAG))
+                    )
+                )
+                queryset = NodeRole.objects.filter(user_id=user.id)
+            elif path:
+                node_qs = TreeNode.objects.filter(path=path)
+                queryset = NodeRole.objects.filter(user_id=user.id, node__path__in=utils.get_tree_paths(path))
+            queryset = queryset.filter(models.Exists(node_qs.filter(disabled=False)))
+        else:
             return False
+        # 角色条件使用子查询，避免关联角色表
+        if roles or can_manage:
+            role_qs = Role.objects.all()
+            if roles:
+                role_qs = role_qs.filter(name__in=roles)
+            if can_manage:
+                role_qs = role_qs.filter(can_manage=True)
+            queryset = queryset.filter(role_id__in=role_qs.values("id"))
+        # 存在记录则有权限
+        return queryset.exists()
+
+    @classmethod
+    def has_node_perms(
+        cls,
+        user: typing.Optional[User],
+        paths: typing.Optional[typing.List[str]] = None,
+        key_names: typing.Optional[typing.List[str]] = None,
+        roles: typing.Optional[typing.List[str]] = None,
+        can_manage: bool = False,
+    ) -> typing.Dict[str, bool]:
+        """批量判断是否有多个结点的权限，与 `has_node_perm` 判断规则一致
+
+        - 一次查询获取所有结点及其父类结点ID，再一次按照结点ID查询用户的授权，不关联结点表；
+        - 同时传递 key_names 和 paths 时，与 `has_node_perm` 一致优先按照 key_names 判断；
+
+        Args:
+            user: 用户
+            paths: 结点路径列表
+            key_names: key结点的标识列表
+            roles: 有限定角色的权限，有任意其中一种角色便是有权限. 不传递表示系统中任意角色都可行.
+            can_manage: 是否有管理结点的权限
+
+        Returns:
+            以传入的 key_name 或 path 为key，有无权限为value的字典
+        """
+        values = list(dict.fromkeys(key_names or paths or []))
+        if cls.has_tree_perm(user):
+            return {value: True for value in values}
+
+        results = {value: False for value in values}
+        if not user or not values:
+            return results
+
+        if key_names and not perm_cache.enabled and effective.is_enabled():
+            ep_qs = EffectivePerm.objects.filter(user_id=user.id, node__is_key=True, node__name__in=values)
+            if roles:
+                ep_qs = ep_qs.filter(role__name__in=roles)
+            if can_manage:
+                ep_qs = ep_qs.filter(role__can_manage=True)
+            for value in ep_qs.values_list("node__name", flat=True).distinct():
+                results[value] = True
+            return results
+
+        nodes = cls._get_node_ancestors(paths=paths, key_names=key_names)
+        if not nodes:
+            return results
+
+        if perm_cache.enabled:
+            grant_map = perm_cache.get_user_grants(user.id)
+        else:
+            ancestor_paths = cls._get_ancestor_paths(nodes)
+            queryset = NodeRole.objects.filter(user_id=user.id, node_id__in=list(ancestor_paths.keys()))
+            if roles:
+                queryset = queryset.filter(role__name__in=roles)
+            if can_manage:
+                queryset = queryset.filter(role__can_manage=True)
+            grant_map = build_grant_map(
+                (ancestor_paths[node_id], role_name, role_can_manage)
+                for node_id, role_name, role_can_manage in queryset.values_list(
+                    "node_id", "role__name", "role__can_manage"
+                )
+            )
+
+        for value, (path, _) in nodes.items():
+            results[value] = match_grants(grant_map, path, roles=roles, can_manage=can_manage)
+        return results
+
+    @classmethod
+    def users_with_perm(
+        cls,
+        paths: typing.Optional[typing.List[str]] = None,
+        key_names: typing.Optional[typing.List[str]] = None,
+        roles: typing.Optional[typing.List[str]] = None,
+        can_manage: bool = False,
+    ) -> typing.Dict[str, typing.List[dict]]:
+        """反查有结点权限的用户，从父类结点继承的角色也算
+
+        - 一次查询获取所有结点及其父类结点ID，再一次按照结点ID查询授权，查询次数与结点数量无关；
+          结点需要先确认存在且未禁用，已禁用结点父类结点上的授权不应返回，所以不合并为一次查询；
+          开启 `TREE_PERM_INDEX_ENABLED` 后结点从内存索引获取，只查询一次授权；
+        - 同一用户仅返回一次，`node_id`/`path` 为距离结点最近的授权结点，`roles` 为用户拥有的所有角色；
+        - 仅返回通过角色授权的用户，不包含超级管理员；
+
+        Args:
+            paths: 结点路径列表
+            key_names: key结点的标识列表，优先于 paths
+            roles: 有限定角色的权限，有任意其中一种角色便是有权限. 不传递表示系统中任意角色都可行.
+            can_manage: 是否有管理结点的权限
+
+        Returns:
+            以传入的 key_name 或 path 为key，有权限的用户列表为value的字典
+        """
+        values = list(dict.fromkeys(key_names or paths or []))
+        results: typing.Dict[str, typing.List[dict]] = {value: [] for value in values}
+        if not values:
+            return results
+
+        nodes = cls._get_node_ancestors(paths=paths, key_names=key_names)
+        if not nodes:
+            return results
 
-        paths = utils.get_tree_paths(node.path)
-        # 判断是否有权限
-        queryset = NodeRole.objects.filter(user_id=user.id, node__path__in=paths)
+        ancestor_paths = cls._get_ancestor_paths(nodes)
+        queryset = NodeRole.objects.filter(node_id__in=list(ancestor_paths.keys()))
         if roles:
             queryset = queryset.filter(role__name__in=roles)
         if can_manage:
             queryset = queryset.filter(role__can_manage=True)
-        # 存在记录则有权限
-        return queryset.exists()
+        rows = queryset.order_by("user_id", "role_id").values_list(
+            "user_id", f"user__{User.USERNAME_FIELD}", "node_id", "role__name"
+        )
+        grants: typing.Dict[str, list] = {}
+        for user_id, username, node_id, role_name in rows:
+            grants.setdefault(ancestor_paths[node_id], []).append((user_id, username, node_id, role_name))
+
+        for value, (node_path, _) in nodes.items():
+            users: typing.Dict[int, dict] = {}
+            # 从结点自身向根结点查找
+            for path in reversed(utils.get_tree_paths(node_path)):
+                for user_id, username, node_id, role_name in grants.get(path, []):
+                    item = users.get(user_id)
+                    if not item:
+                        item = {"user_id": user_id, "username": username, "node_id": node_id, "path": path, "roles": []}
+                        users[user_id] = item
+                    if role_name not in item["roles"]:
+                        item["roles"].append(role_name)
+            results[value] = list(users.values())
+        return results
+
+    @classmethod
+    def _get_node_paths(
+        cls,
+        paths: typing.Optional[typing.List[str]] = None,
+        key_names: typing.Optional[typing.List[str]] = None,
+    ) -> typing.Dict[str, str]:
+        """一次查询获取结点路径，优先按照 key_names 查询；不存在或已禁用的结点会被忽略"""
+        nodes = cls._get_node_ancestors(paths=paths, key_names=key_names)
+        return {value: path for value, (path, _) in nodes.items()}
+
+    @classmethod
+    def _get_node_ancestors(
+        cls,
+        paths: typing.Optional[typing.List[str]] = None,
+        key_names: typing.Optional[typing.List[str]] = None,
+    ) -> typing.Dict[str, typing.Tuple[str, typing.List[int]]]:
+        """一次查询获取结点路径及由根结点开始的父类结点ID(含自身)，优先按照 key_names 查询；不存在或已禁用的结点会被忽略"""
+        values = key_names or paths or []
+        if tree_index.enabled:
+            results = {}
+            for value in values:
+                index_node = tree_index.get_node(path=value, key_name=value if key_names else None)
+                if index_node:
+                    results[value] = (index_node.path, index_node.get_ancestor_ids())
+            return results
+        node_qs = TreeNode.objects.filter(disabled=False)
+        if key_names:
+            rows = node_qs.filter(is_key=True, name__in=key_names).values_list("name", "path", "id", "ancestor_ids")
+        else:
+            rows = node_qs.filter(path__in=values).values_list("path", "path", "id", "ancestor_ids")
+        return {
+            value: (path, utils.split_ancestor_ids(ancestor_ids) + [node_id])
+            for value, path, node_id, ancestor_ids in rows
+        }
+
+    @staticmethod
+    def _get_ancestor_paths(nodes: typing.Dict[str, typing.Tuple[str, typing.List[int]]]) -> typing.Dict[int, str]:
+        """父类结点ID到结点路径，结点的父类结点ID与 `utils.get_tree_paths(path)` 的路径一一对应"""
+        return {
+            node_id: ancestor_path
+            for path, node_ids in nodes.values()
+            for node_id, ancestor_path in zip(node_ids, utils.get_tree_paths(path))
+        }
+
+
+class PermResolver(object):
+    """单个请求内的权限判断，判断规则与 `PermManager.has_node_perm` 一致
+
+    - 用户授权集合只加载一次，同一结点只查询一次，请求内多次判断权限的查询次数为常数；
+    - 开启 `TREE_PERM_CACHE_ENABLED` 或 `TREE_PERM_SHARED_CACHE_ENABLED` 后从缓存加载；
+    - 可通过 `django_tree_perm.middleware.PermResolverMiddleware` 挂载到 `request.tree_perm`；
+
+    Args:
+        user: 用户
+    """
+
+    def __init__(self, user: typing.Optional[User]) -> None:
+        self.user = user
+        self._grant_map: typing.Optional[typing.Dict[str, tuple]] = None
+        self._node_paths: typing.Dict[tuple, str] = {}
+        self._ancestor_paths: typing.Dict[tuple, typing.Set[str]] = {}
+
+    @property
+    def is_authenticated(self) -> bool:
+        return bool(self.user and self.user.is_authenticated)
+
+    def has_tree_perm(self) -> bool:
+        """是否具备树和角色的管理权限"""
+        return PermManager.has_tree_perm(self.user)
+
+    @property
+    def grant_map(self) -> typing.Dict[str, tuple]:
+        """用户的授权集合，首次访问时加载"""
+        if self._grant_map is None:
+            user = self.user
+            if user is None or not self.is_authenticated:
+                self._grant_map = {}
+            elif perm_cache.enabled:
+                self._grant_map = perm_cache.get_user_grants(user.id)
+            else:
+                rows = NodeRole.objects.filter(user_id=user.id).values_list(
+                    "node__path", "role__name", "role__can_manage"
+                )
+                self._grant_map = build_grant_map(rows)
+        return self._grant_map
+
+    def get_node_path(self, path: typing.Optional[str] = None, key_name: typing.Optional[str] = None) -> str:
+        """获取结点路径，优先按照key_name查找；结点不存在或已禁用时返回空字符串"""
+        value = key_name or path
+        if not value:
+            return ""
+        cache_key = ("key" if key_name else "path", value)
+        if cache_key not in self._node_paths:
+            if perm_cache.enabled:
+                self._node_paths[cache_key] = perm_cache.get_node_path(path=path, key_name=key_name)
+            else:
+                node_paths = PermManager._get_node_paths(
+                    paths=[path] if path else None, key_names=[key_name] if key_name else None
+                )
+                self._node_paths[cache_key] = node_paths.get(value, "")
+        return self._node_paths[cache_key]
+
+    def has_node_perm(
+        self,
+        path: typing.Optional[str] = None,
+        key_name: typing.Optional[str] = None,
+        roles: typing.Optional[typing.List[str]] = None,
+        can_manage: bool = False,
+    ) -> bool:
+        """是否有某个结点的权限
+
+        Args:
+            path: 结点路径
+            key_name: key结点的标识
+            roles: 有限定角色的权限，有任意其中一种角色便是有权限. 不传递表示系统中任意角色都可行.
+            can_manage: 是否有管理结点的权限
+
+        Returns:
+            有无权限
+        """
+        if self.has_tree_perm():
+            return True
+        if not self.is_authenticated:
+            return False
+        node_path = self.get_node_path(path=path, key_name=key_name)
+        if not node_path:
+            return False
+        return match_grants(self.grant_map, node_path, roles=roles, can_manage=can_manage)
+
+    def is_visible(self, path: str, roles: typing.Optional[typing.List[str]] = None) -> bool:
+        """结点对用户是否可见，不查询结点数据
+
+        有结点的权限，或者结点是有权限结点的父类结点(用于逐级找到有权限的结点)时可见。
+
+        Args:
+            path: 结点路径
+            roles: 有限定角色的权限，有任意其中一种角色便是有权限. 不传递表示系统中任意角色都可行.
+
+        Returns:
+            是否可见
+        """
+        if self.has_tree_perm():
+            return True
+        if match_grants(self.grant_map, path, roles=roles):
+            return True
+        cache_key = tuple(sorted(roles or []))
+        if cache_key not in self._ancestor_paths:
+            paths: typing.Set[str] = set()
+            for grant_path, grants in self.grant_map.items():
+                if not roles or any(role_name in roles for role_name, _ in grants):
+                    paths.update(utils.get_tree_paths(grant_path)[:-1])
+            self._ancestor_paths[cache_key] = paths
+        return path in self._ancestor_paths[cache_key]
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+结点子树规模维护模块
+
+`TreeNode.child_count` 记录未禁用的直接子结点个数，`TreeNode.descendant_count` 记录未禁用的子孙结点个数（不含自身）。
+
+- 结点新增、移动、删除、导入时由 `TreeNodeManger` 沿父类结点链路按集合增量更新
+- 直接保存模型或在数据库中批量修改数据不会维护，可通过管理命令 `rebuild_tree_counts` 检查并全量重建
+
+"""
+import typing
+
+from django.db import models
+
+from django_tree_perm.utils import get_tree_paths, get_path_parent, chunked
+from django_tree_perm.models import TreeNode
+
+
+# 每批处理的结点数量
+BATCH_SIZE = 1000
+
+# 路径到 [直接子结点个数变化, 子孙结点个数变化]
+Deltas = typing.Dict[str, typing.List[int]]
+
+
+def collect(deltas: Deltas, parent_path: str, children: int, descendants: int) -> Deltas:
+    """记录父类结点链路上的变化，不写入数据库
+
+    Args:
+        deltas: 已记录的变化，会被原地修改
+        parent_path: 直接父结点路径，为空时表示根结点，无需处理
+        children: 直接父结点的子结点个数变化
+        descendants: 所有父类结点的子孙结点个数变化
+
+    Returns:
+        记录后的变化
+    """
+    paths = get_tree_paths(parent_path)
+    for path in paths:
+        delta = deltas.setdefault(path, [0, 0])
+        delta[1] += descendants
+    if paths:
+        deltas[paths[-1]][0] += children
+    return deltas
+
+
+def apply(deltas: Deltas) -> int:
+    """按照路径分批，每批一条 UPDATE 语句使用 CASE 表达式更新所有结点
+
+    Args:
+        deltas: 路径到 [直接子结点个数变化, 子孙结点个数变化]
+
+    Returns:
+        更新的结点数量
+    """
+    items = [(path, delta) for path, delta in deltas.items() if delta[0] or delta[1]]
+    rows = 0
+    for chunk in chunked(items, BATCH_SIZE):
+        values = {}
+        for index, field in enumerate(TreeNode.TREE_COUNT_FIELDS):
+            whens = [models.When(path=path, then=models.Value(delta[index])) for path, delta in chunk if delta[index]]
+            if whens:
+                values[field] = models.F(field) + models.Case(
+                    *whens, default=models.Value(0), output_field=models.IntegerField()
+                )
+        rows += TreeNode.objects.filter(path__in=[path for path, _ in chunk], disabled=False).update(**values)
+    return rows
+
+
+def update_ancestors(path: str, size: int) -> int:
+    """结点及其子孙结点共 size 个加入(size>0)或者移出(size<0)路径 path 处后，更新其父类结点链路
+
+    Args:
+        path: 结点路径
+        size: 结点自身及其未禁用的子孙结点个数，负数表示移出
+
+    Returns:
+        更新的结点数量
+    """
+    children = (size > 0) - (size < 0)
+    return apply(collect({}, get_path_parent(path), children, size))
+
+
+def apply_created(nodes: typing.List[TreeNode]) -> int:
+    """批量新增结点后更新计数
+
+    新增结点的初始计数为0，其子树都在 nodes 中，直接计算后批量写入；已存在的父类结点按集合增量更新。
+
+    Args:
+        nodes: 已写入数据库的新增结点
+
+    Returns:
+        更新的结点数量
+    """
+    deltas: Deltas = {}
+    for node in nodes:
+        collect(deltas, get_path_parent(node.path), 1, 1)
+    changed = []
+    for node in nodes:
+        delta = deltas.pop(node.path, None)
+        if delta:
+            node.child_count, node.descendant_count = delta
+            changed.append(node)
+    TreeNode.objects.bulk_update(changed, TreeNode.TREE_COUNT_FIELDS, batch_size=BATCH_SIZE)
+    return len(changed) + apply(deltas)
+
+
+def compute() -> typing.Dict[int, typing.Tuple[int, int]]:
+    """根据 parent_id 计算未禁用结点的计数，按照深度由深到浅逐级累加
+
+    Returns:
+        结点ID到 (直接子结点个数, 子孙结点个数)
+    """
+    rows = TreeNode.objects.filter(disabled=False).values_list("id", "parent_id", "depth")
+    nodes = sorted(rows.iterator(chunk_size=BATCH_SIZE), key=lambda row: row[2], reverse=True)
+    counts = {node_id: [0, 0] for node_id, _, _ in nodes}
+    for node_id, parent_id, _ in nodes:
+        if parent_id in counts:
+            counts[parent_id][0] += 1
+            counts[parent_id][1] += counts[node_id][1] + 1
+    return {node_id: (children, descendants) for node_id, (children, descendants) in counts.items()}
+
+
+def check() -> typing.List[typing.Tuple[int, typing.Tuple[int, int], typing.Tuple[int, int]]]:
+    """检查计数是否与结点数据一致
+
+    Returns:
+        不一致的结点列表，元素为 (结点ID, 期望的计数, 实际的计数)，已禁用的结点期望计数为0
+    """
+    expected = compute()
+    results = []
+    rows = TreeNode.objects.values_list("id", *TreeNode.TREE_COUNT_FIELDS).order_by("id")
+    for node_id, children, descendants in rows.iterator(chunk_size=BATCH_SIZE):
+        value = expected.get(node_id, (0, 0))
+        if value != (children, descendants):
+            results.append((node_id, value, (children, descendants)))
+    return results
+
+
+def rebuild() -> int:
+    """全量重建计数，仅更新不一致的结点
+
+    Returns:
+        更新的结点数量
+    """
+    nodes = [
+        TreeNode(id=node_id, child_count=children, descendant_count=descendants)
+        for node_id, (children, descendants), _ in check()
+    ]
+    TreeNode.objects.bulk_update(nodes, TreeNode.TREE_COUNT_FIELDS, batch_size=BATCH_SIZE)
+    return len(nodes)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+视图装饰器模块
+
+"""
+import typing
+import functools
+from http import HTTPStatus
+
+from django.http import JsonResponse, HttpRequest, HttpResponse
+
+from django_tree_perm.middleware import get_perm_resolver
+
+
+# 结点参数: 固定值，或者根据视图参数 (request, *args, **kwargs) 计算的函数
+NodeParam = typing.Optional[typing.Union[str, typing.Callable[..., typing.Optional[str]]]]
+
+
+def require_node_perm(
+    path: NodeParam = None,
+    key_name: NodeParam = None,
+    roles: typing.Optional[typing.List[str]] = None,
+    can_manage: bool = False,
+) -> typing.Callable:
+    """视图装饰器，要求当前登录用户有结点的权限，判断规则与 `PermManager.has_node_perm` 一致
+
+    - 使用请求内的 `PermResolver` 判断，与视图内的其他权限判断共用已加载的授权和结点；
+    - path 和 key_name 均未传递时，从视图参数或者 GET 参数中读取 `path`/`key_name`；
+    - 未登录或者无权限返回 403；类视图可配合 `django.utils.decorators.method_decorator` 使用；
+
+    Args:
+        path: 结点路径，或者根据视图参数计算结点路径的函数
+        key_name: key结点的标识，或者根据视图参数计算key结点标识的函数
+        roles: 有限定角色的权限，有任意其中一种角色便是有权限. 不传递表示系统中任意角色都可行.
+        can_manage: 是否有管理结点的权限
+
+    Returns:
+        视图装饰器
+    """
+
+    def resolve(
+        param: NodeParam, name: str, request: HttpRequest, *args: typing.Any, **kwargs: typing.Any
+    ) -> typing.Optional[str]:
+        if callable(param):
+            return param(request, *args, **kwargs)
+        if param:
+            return param
+        if path is None and key_name is None:
+            return kwargs.get(name) or request.GET.get(name)
+        return None
+
+    def decorator(view_func: typing.Callable[..., HttpResponse]) -> typing.Callable[..., HttpResponse]:
+        @functools.wraps(view_func)
+        def wrapped_view(request: HttpRequest, *args: typing.Any, **kwargs: typing.Any) -> HttpResponse:
+            resolver = get_perm_resolver(request)
+            if not resolver.is_authenticated:
+                return JsonResponse({"error": "Not allowed without login."}, status=HTTPStatus.FORBIDDEN)
+            _path = resolve(path, "path", request, *args, **kwargs)
+            _key_name = resolve(key_name, "key_name", request, *args, **kwargs)
+            if not resolver.has_node_perm(path=_path, key_name=_key_name, roles=roles, can_manage=can_manage):
+                return JsonResponse(
+                    {"error": f"No permission for the node path={_path} key_name={_key_name}"},
+                    status=HTTPStatus.FORBIDDEN,
+                )
+            return view_func(request, *args, **kwargs)
+
+        return wrapped_view
+
+    return decorator
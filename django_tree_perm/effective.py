@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+key结点生效权限维护模块
+
+将 `NodeRole` 授权展开到其覆盖的 key 结点，写入物化表 `EffectivePerm`。
+
+- 通过配置 `TREE_PERM_EFFECTIVE_ENABLED` 开启，默认关闭
+- `NodeRole` 新增、key 结点新增/修改通过信号增量维护，详见 `django_tree_perm.signals`
+- `NodeRole` 删除、结点删除通过外键级联删除
+- 结点移动、批量删除由 `TreeNodeManger` 调用 `sync_key_nodes`/`clear_key_nodes` 维护
+- 可通过管理命令 `rebuild_effective_perms` 全量重建，`check_effective_perms` 检查数据一致性
+
+"""
+import typing
+
+from django.db import models
+
+from django_tree_perm import settings
+from django_tree_perm.utils import get_tree_paths, chunked
+from django_tree_perm.models import TreeNode, NodeRole, EffectivePerm
+
+
+# 每批处理的key结点数量
+BATCH_SIZE = 1000
+
+
+def is_enabled() -> bool:
+    return bool(settings.TREE_PERM_EFFECTIVE_ENABLED)
+
+
+def expand_key_nodes(keys: typing.List[typing.Tuple[int, str]]) -> typing.List[EffectivePerm]:
+    """计算key结点的生效权限
+
+    Args:
+        keys: key结点的ID和路径
+
+    Returns:
+        生效权限对象列表，未写入数据库
+    """
+    keys = [(node_id, path) for node_id, path in keys if path]
+    if not keys:
+        return []
+    grants: typing.Dict[str, list] = {}
+    rows = NodeRole.objects.filter(node__path__in=get_tree_paths([path for _, path in keys])).values_list(
+        "id", "node__path", "role_id", "user_id"
+    )
+    for row in rows:
+        grants.setdefault(row[1], []).append(row)
+
+    results = []
+    for node_id, path in keys:
+        for _path in get_tree_paths(path):
+            for node_role_id, _, role_id, user_id in grants.get(_path, []):
+                results.append(
+                    EffectivePerm(node_role_id=node_role_id, node_id=node_id, role_id=role_id, user_id=user_id)
+                )
+    return results
+
+
+def sync_node_role(node_role: NodeRole) -> int:
+    """将一条授权展开到其覆盖的所有key结点
+
+    Args:
+        node_role: 新增的授权
+
+    Returns:
+        写入的记录数量
+    """
+    node = node_role.node
+    queryset = node.get_self_and_children().filter(is_key=True, disabled=False)
+    count = 0
+    for node_ids in chunked(queryset.values_list("id", flat=True).iterator(), BATCH_SIZE):
+        objs = [
+            EffectivePerm(
+                node_role_id=node_role.id, node_id=node_id, role_id=node_role.role_id, user_id=node_role.user_id
+            )
+            for node_id in node_ids
+        ]
+        EffectivePerm.objects.bulk_create(objs, ignore_conflicts=True)
+        count += len(objs)
+    return count
+
+
+def clear_key_nodes(node_ids: typing.List[int]) -> None:
+    """清除key结点的生效权限，用于key结点被禁用的场景"""
+    for ids in chunked(node_ids, BATCH_SIZE):
+        EffectivePerm.objects.filter(node_id__in=ids).delete()
+
+
+def sync_key_nodes(queryset: models.QuerySet) -> int:
+    """重新计算key结点的生效权限，用于key结点新增、禁用或者路径变更的场景
+
+    Args:
+        queryset: QuerySet[TreeNode]，仅处理其中 is_key=True 的结点，已禁用的结点只清除不写入
+
+    Returns:
+        写入的记录数量
+    """
+    count = 0
+    keys = list(queryset.filter(is_key=True).values_list("id", "path", "disabled"))
+    for chunk in chunked(keys, BATCH_SIZE):
+        EffectivePerm.objects.filter(node_id__in=[node_id for node_id, _, _ in chunk]).delete()
+        objs = expand_key_nodes([(node_id, path) for node_id, path, disabled in chunk if not disabled])
+        EffectivePerm.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+        count += len(objs)
+    return count
+
+
+def rebuild() -> int:
+    """全量重建生效权限
+
+    Returns:
+        写入的记录数量
+    """
+    EffectivePerm.objects.all().delete()
+    return sync_key_nodes(TreeNode.objects.filter(disabled=False))
+
+
+def check() -> dict:
+    """检查生效权限数据是否与授权数据一致
+
+    Returns:
+        dict, 包含缺失的记录 `missing` 和多余的记录 `extra`，值为 (node_role_id, node_id) 列表
+    """
+    expected: typing.Set[typing.Tuple[int, int]] = set()
+    keys = list(TreeNode.objects.filter(is_key=True, disabled=False).values_list("id", "path"))
+    for chunk in chunked(keys, BATCH_SIZE):
+        expected.update((obj.node_role_id, obj.node_id) for obj in expand_key_nodes(chunk))
+    actual = set(EffectivePerm.objects.values_list("node_role_id", "node_id"))
+    return {
+        "missing": sorted(expected - actual),
+        "extra": sorted(actual - expected),
+    }
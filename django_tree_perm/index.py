@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+树结点内存索引模块
+
+进程内加载所有未禁用的结点，按照ID、路径、key结点标识查找结点时直接在内存中查找，不再查询数据库。
+
+- 通过配置 `TREE_PERM_INDEX_ENABLED` 开启，默认关闭；首次使用时加载
+- 单个结点的保存/删除通过信号在事务提交后增量更新，详见 `django_tree_perm.signals`
+- 批量移动、删除结点后在事务提交后标记重新加载
+- 其他进程的变更无法感知，加载超过 `TREE_PERM_INDEX_TTL` 秒后重新加载，加载期间继续使用旧的索引
+
+"""
+import time
+import typing
+import threading
+
+from django.db import transaction
+
+from django_tree_perm import settings
+from django_tree_perm.utils import split_ancestor_ids
+
+
+class IndexNode(typing.NamedTuple):
+    """索引中的结点数据"""
+
+    id: int
+    parent_id: typing.Optional[int]
+    name: str
+    alias: str
+    path: str
+    depth: int
+    is_key: bool
+    ancestor_ids: str
+
+    def get_ancestor_ids(self) -> typing.List[int]:
+        """由根结点开始的父类结点ID列表，包含结点自身"""
+        return split_ancestor_ids(self.ancestor_ids) + [self.id]
+
+    def to_json(self) -> dict:
+        """与 `TreeNode.to_json(partial=True)` 返回的数据一致"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "alias": self.alias,
+            "parent_id": self.parent_id,
+            "is_key": self.is_key,
+            "path": self.path,
+        }
+
+
+# 加载结点时查询的字段，与 IndexNode 字段顺序一致
+INDEX_FIELDS = IndexNode._fields
+
+
+class BaseIndex(object):
+    """从数据库全量加载的进程内索引基类，线程安全
+
+    - 加载时不持有读写锁，在新的实例中构建完整的索引后加锁替换，同一时间只有一个线程加载
+    - 索引过期后由一个线程重新加载，其他线程继续读取旧的索引；首次加载或清空后等待加载完成
+    - 加载期间的增量更新会被记录，替换前在新的索引中重放
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._loaded_at: typing.Optional[float] = None
+        # 加载期间的增量更新，为None时未在加载
+        self._pending: typing.Optional[typing.List[typing.Callable[[typing.Any], None]]] = None
+        # 清空次数，加载期间被清空时加载结果可能是旧数据
+        self._cleared = 0
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    @property
+    def ttl(self) -> float:
+        raise NotImplementedError
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None and self._loaded_at + self.ttl > time.monotonic()
+
+    @property
+    def active(self) -> bool:
+        """已加载(包括已过期)或正在加载，需要维护增量更新"""
+        return self._loaded_at is not None or self._pending is not None
+
+    def _build(self) -> typing.Any:
+        """从数据库构建新的索引实例"""
+        raise NotImplementedError
+
+    def _swap(self, index: typing.Any) -> None:
+        """替换为新索引实例的数据，调用时已持有锁"""
+        raise NotImplementedError
+
+    def _reset(self) -> None:
+        """清空索引数据，调用时已持有锁"""
+        raise NotImplementedError
+
+    def load(self) -> int:
+        """从数据库加载索引
+
+        Returns:
+            加载的结点数量
+        """
+        with self._reload_lock:
+            return self._load()
+
+    def _load(self) -> int:
+        with self._lock:
+            self._pending, cleared = [], self._cleared
+        try:
+            index = self._build()
+            with self._lock:
+                index._loaded_at = time.monotonic()
+                for apply in self._pending:
+                    apply(index)
+                self._swap(index)
+                self._loaded_at = index._loaded_at if self._cleared == cleared else None
+                return len(index)
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def _ensure_loaded(self) -> None:
+        if self.loaded:
+            return
+        if self._loaded_at is None:
+            with self._reload_lock:
+                if self._loaded_at is None:
+                    self._load()
+        elif self._reload_lock.acquire(blocking=False):
+            try:
+                if not self.loaded:
+                    self._load()
+            finally:
+                self._reload_lock.release()
+
+    def _record(self, apply: typing.Callable[[typing.Any], None]) -> None:
+        """加载期间记录增量更新，调用时已持有锁"""
+        if self._pending is not None:
+            self._pending.append(apply)
+
+    def invalidate(self) -> None:
+        """事务提交后清空索引，下次使用时从数据库重新加载"""
+        transaction.on_commit(self.clear)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cleared += 1
+            self._loaded_at = None
+            self._reset()
+
+
+class TreeIndex(BaseIndex):
+    """树结点内存索引，读取时加锁
+
+    - nodes: 结点ID到结点数据
+    - paths: 结点路径到结点ID
+    - keys: key结点标识到结点ID
+    - child_counts: 结点ID到直接子结点个数，用于判断结点路径变更时是否需要重新加载
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._nodes: typing.Dict[int, IndexNode] = {}
+        self._paths: typing.Dict[str, int] = {}
+        self._keys: typing.Dict[str, int] = {}
+        self._child_counts: typing.Dict[typing.Optional[int], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.TREE_PERM_INDEX_ENABLED)
+
+    @property
+    def ttl(self) -> float:
+        return float(settings.TREE_PERM_INDEX_TTL)
+
+    def _build(self) -> "TreeIndex":
+        """从数据库加载所有未禁用的结点"""
+        from django_tree_perm.models import TreeNode
+
+        index = TreeIndex()
+        rows = TreeNode.objects.filter(disabled=False).order_by("path").values_list(*INDEX_FIELDS)
+        for row in rows.iterator():
+            index._add(IndexNode(*row))
+        return index
+
+    def _swap(self, index: "TreeIndex") -> None:
+        self._nodes, self._paths, self._keys, self._child_counts = (
+            index._nodes,
+            index._paths,
+            index._keys,
+            index._child_counts,
+        )
+
+    def _reset(self) -> None:
+        self._nodes, self._paths, self._keys, self._child_counts = {}, {}, {}, {}
+
+    def _add(self, node: IndexNode) -> None:
+        self._nodes[node.id] = node
+        self._paths[node.path] = node.id
+        if node.is_key:
+            self._keys[node.name] = node.id
+        self._child_counts[node.parent_id] = self._child_counts.get(node.parent_id, 0) + 1
+
+    def _remove(self, node_id: int) -> typing.Optional[IndexNode]:
+        node = self._nodes.pop(node_id, None)
+        if node:
+            if self._paths.get(node.path) == node_id:
+                del self._paths[node.path]
+            if node.is_key and self._keys.get(node.name) == node_id:
+                del self._keys[node.name]
+            count = self._child_counts.get(node.parent_id, 0) - 1
+            if count > 0:
+                self._child_counts[node.parent_id] = count
+            else:
+                self._child_counts.pop(node.parent_id, None)
+        return node
+
+    def get(self, node_id: int) -> typing.Optional[IndexNode]:
+        """按照结点ID查找"""
+        self._ensure_loaded()
+        with self._lock:
+            return self._nodes.get(node_id)
+
+    def get_by_path(self, path: str) -> typing.Optional[IndexNode]:
+        """按照结点路径查找"""
+        self._ensure_loaded()
+        with self._lock:
+            node_id = self._paths.get(path)
+            return self._nodes.get(node_id) if node_id is not None else None
+
+    def get_by_key(self, key_name: str) -> typing.Optional[IndexNode]:
+        """按照key结点标识查找"""
+        self._ensure_loaded()
+        with self._lock:
+            node_id = self._keys.get(key_name)
+            return self._nodes.get(node_id) if node_id is not None else None
+
+    def get_node(
+        self, path: typing.Optional[str] = None, key_name: typing.Optional[str] = None
+    ) -> typing.Optional[IndexNode]:
+        """查找结点，优先按照key_name查找；结点不存在或已禁用时返回None"""
+        if key_name:
+            return self.get_by_key(key_name)
+        if path:
+            return self.get_by_path(path)
+        return None
+
+    def get_node_path(self, path: typing.Optional[str] = None, key_name: typing.Optional[str] = None) -> str:
+        """获取结点路径，优先按照key_name查找；结点不存在或已禁用时返回空字符串"""
+        node = self.get_node(path=path, key_name=key_name)
+        return node.path if node else ""
+
+    def apply_save(self, node: IndexNode, disabled: bool = False) -> None:
+        """结点保存后更新索引；路径变更且有子结点时重新加载"""
+        with self._lock:
+            self._record(lambda index: index.apply_save(node, disabled=disabled))
+            if self._loaded_at is None:
+                return
+            old = self._nodes.get(node.id)
+            if old and old.path != node.path and self._child_counts.get(node.id):
+                self._loaded_at = None
+                return
+            self._remove(node.id)
+            if not disabled:
+                self._add(node)
+
+    def apply_delete(self, node_id: int) -> None:
+        """结点删除后更新索引"""
+        with self._lock:
+            self._record(lambda index: index.apply_delete(node_id))
+            self._remove(node_id)
+
+    def info(self) -> dict:
+        """索引统计信息"""
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "nodes": len(self._nodes),
+                "keys": len(self._keys),
+            }
+
+
+tree_index = TreeIndex()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+结点嵌套集合(区间)编码维护模块
+
+每个结点记录区间 `[lft, rgt]`，子孙结点的区间都在其内部，查询子树时可以使用 lft 整数范围条件代替路径前缀匹配。
+
+- 通过配置 `TREE_PERM_NESTED_SET_ENABLED` 开启，默认关闭；开启前需执行 `python manage.py rebuild_tree_intervals`
+- 编号之间预留间隔，新增、移动结点时在父结点区间末尾的剩余空间中分配，不需要重新编号整棵树
+- 剩余空间不足时，由近到远找到空间足够的父类结点，保持顺序在其区间内重新均匀编号
+- 结点新增、移动、导入由 `TreeNodeManger` 维护；删除结点留下的空隙不做处理，禁用key结点时清空其编号
+
+"""
+import typing
+
+from django.db import models
+
+from django_tree_perm import settings
+from django_tree_perm.models import TreeNode
+
+
+# 每批处理的结点数量
+BATCH_SIZE = 1000
+# 编号的最大值
+MAX_VALUE = 2**62
+# 相邻编号的最小间隔
+MIN_STEP = 8
+
+Interval = typing.Tuple[int, int]
+
+
+def is_enabled() -> bool:
+    return bool(settings.TREE_PERM_NESTED_SET_ENABLED)
+
+
+def _bounds(parent_id: typing.Optional[int]) -> typing.Optional[Interval]:
+    """获取并锁定父结点的区间，根结点在整个编号空间中分配；父结点未编号时返回None"""
+    if parent_id is None:
+        return 0, MAX_VALUE
+    lft, rgt = TreeNode.objects.select_for_update().filter(id=parent_id).values_list("lft", "rgt").get()
+    return (lft, rgt) if 0 < lft < rgt else None
+
+
+def _find_slot(
+    parent_id: typing.Optional[int],
+    bounds: Interval,
+    events: int,
+    exclude_id: typing.Optional[int] = None,
+    width: int = 0,
+) -> typing.Optional[Interval]:
+    """在父结点区间末尾的剩余空间中分配可容纳 events 个编号的区间
+
+    剩余空间从直接子结点(不含正在移动的结点 exclude_id)的最大右边界开始，分配其 1/8 处开始的 1/4，
+    之后的结点继续使用其余的空间；指定 width 且不超过剩余空间的一半时，按照 width 分配；剩余空间不足时返回None
+    """
+    lo, hi = bounds
+    queryset = TreeNode.objects.filter(parent_id=parent_id).exclude(id=exclude_id)
+    start = queryset.aggregate(value=models.Max("rgt"))["value"] or lo
+    free = hi - max(start, lo)
+    if not events * MIN_STEP <= width <= free // 2:
+        width = free // 4
+        if width < events * MIN_STEP:
+            return None
+    left = max(start, lo) + free // 8
+    return left, left + width
+
+
+def _renumber(
+    rows: typing.Iterable[typing.Tuple[int, int, int]],
+    start: int,
+    step: int,
+    gap_id: typing.Optional[int] = None,
+    gap: int = 0,
+) -> None:
+    """保持边界的先后顺序，按照固定间隔重新编号
+
+    Args:
+        rows: 结点的 (id, lft, rgt)
+        start: 起始编号，第一个边界为 start + step
+        step: 相邻编号的间隔
+        gap_id: 在该结点的右边界之前额外预留 gap 个编号
+        gap: 额外预留的编号个数
+    """
+    events = []
+    for node_id, lft, rgt in rows:
+        events.append((lft, 0, node_id))
+        events.append((rgt, 1, node_id))
+    events.sort()
+    values: typing.Dict[int, typing.List[int]] = {}
+    value = start
+    for _, index, node_id in events:
+        value += step
+        if index == 1 and node_id == gap_id:
+            value += gap
+        values.setdefault(node_id, [0, 0])[index] = value
+    nodes = [TreeNode(id=node_id, lft=lft, rgt=rgt) for node_id, (lft, rgt) in values.items()]
+    TreeNode.objects.bulk_update(nodes, TreeNode.TREE_INTERVAL_FIELDS, batch_size=BATCH_SIZE)
+
+
+def _make_room(parent_id: typing.Optional[int], bounds: Interval, events: int) -> None:
+    """由近到远找到空间足够的父类结点，在其区间内重新均匀编号，并在父结点末尾预留 events 个编号的空间"""
+    extra = 4 * events
+    candidates = []
+    if parent_id is not None:
+        candidates = list(
+            TreeNode.objects.filter(lft__gt=0, lft__lte=bounds[0], rgt__gte=bounds[1])
+            .order_by("-lft")
+            .values_list("lft", "rgt")
+        )
+    candidates.append((0, MAX_VALUE))
+    for lo, hi in candidates:
+        rows = list(TreeNode.objects.filter(lft__gt=lo, lft__lt=hi).values_list("id", "lft", "rgt"))
+        step = (hi - lo) // (2 * len(rows) + 1 + extra)
+        if step >= MIN_STEP:
+            _renumber(rows, lo, step, gap_id=parent_id, gap=extra * step)
+            return
+    raise OverflowError("No space left for tree node intervals.")
+
+
+def reserve(
+    parent_id: typing.Optional[int], events: int, exclude_id: typing.Optional[int] = None, width: int = 0
+) -> typing.Optional[Interval]:
+    """在父结点区间中预留可容纳 events 个编号的区间，需在事务中调用
+
+    Args:
+        parent_id: 父结点ID，为None时在根结点层级中分配
+        events: 需要的编号个数，即结点个数的2倍
+        exclude_id: 正在移动到该父结点下的结点ID
+        width: 期望的区间宽度，剩余空间足够时按照该宽度分配
+
+    Returns:
+        预留的区间，父结点未编号时返回None
+    """
+    bounds = _bounds(parent_id)
+    if bounds is None:
+        return None
+    slot = _find_slot(parent_id, bounds, events, exclude_id=exclude_id, width=width)
+    if slot is None:
+        _make_room(parent_id, bounds, events)
+        slot = _find_slot(parent_id, typing.cast(Interval, _bounds(parent_id)), events, exclude_id=exclude_id)
+    return slot
+
+
+def refresh(node: TreeNode) -> None:
+    """重新获取并锁定结点的区间，写入结点对象，需在事务中调用
+
+    其他事务新增、移动结点剩余空间不足时，会重新编号整个父类结点的区间，结点对象中的区间可能已过期；
+    按照区间查询子孙结点之前需调用，未开启时不做处理
+    """
+    if is_enabled() and node.id:
+        node.lft, node.rgt = TreeNode.objects.select_for_update().filter(id=node.id).values_list("lft", "rgt").get()
+
+
+def place_new(node: TreeNode) -> None:
+    """为待新增的结点分配区间，写入结点对象，不保存"""
+    slot = reserve(node.parent_id, 2)
+    if slot:
+        node.lft, node.rgt = slot
+
+
+def place_moved(node: TreeNode) -> None:
+    """结点移动到新的父结点后，将其子树的区间整体迁移到新父结点的剩余空间中
+
+    区间宽度足够时整体平移，否则在分配的区间内保持顺序重新编号；结果回写到结点对象
+    """
+    lft, rgt = TreeNode.objects.filter(id=node.id).values_list("lft", "rgt").get()
+    size = TreeNode.objects.filter(lft__gte=lft, lft__lte=rgt).count() if 0 < lft < rgt else 1
+    slot = reserve(node.parent_id, 2 * size, exclude_id=node.id, width=max(rgt - lft, 0))
+    if not slot:
+        return
+    lo, hi = slot
+    # 预留空间时可能重新编号，重新获取子树区间
+    lft, rgt = TreeNode.objects.filter(id=node.id).values_list("lft", "rgt").get()
+    if not 0 < lft < rgt:
+        TreeNode.objects.filter(id=node.id).update(lft=lo, rgt=hi)
+    elif rgt - lft <= hi - lo:
+        delta = lo - lft
+        TreeNode.objects.filter(lft__gte=lft, lft__lte=rgt).update(
+            lft=models.F("lft") + delta, rgt=models.F("rgt") + delta
+        )
+    else:
+        rows = list(TreeNode.objects.filter(lft__gte=lft, lft__lte=rgt).values_list("id", "lft", "rgt"))
+        step = (hi - lo) // (2 * len(rows) - 1)
+        _renumber(rows, lo - step, step)
+    node.lft, node.rgt = TreeNode.objects.filter(id=node.id).values_list("lft", "rgt").get()
+
+
+def _number_subtrees(
+    roots: typing.List[TreeNode],
+    children: typing.Dict[typing.Optional[int], typing.List[TreeNode]],
+    start: int,
+    step: int,
+) -> None:
+    """按照深度优先顺序为结点及其子孙结点编号，写入结点对象"""
+    value = start
+    stack: typing.List[typing.Tuple[TreeNode, bool]] = [(node, False) for node in reversed(roots)]
+    while stack:
+        node, visited = stack.pop()
+        value += step
+        if visited:
+            node.rgt = value
+            continue
+        node.lft = value
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(children.get(node.id, [])))
+
+
+def place_created(nodes: typing.List[TreeNode]) -> int:
+    """批量新增结点后分配区间，按照父结点分组，每组预留一次区间后按照深度优先顺序编号
+
+    Args:
+        nodes: 已写入数据库的新增结点
+
+    Returns:
+        编号的结点数量
+    """
+    created = {node.id: node for node in nodes}
+    children: typing.Dict[typing.Optional[int], typing.List[TreeNode]] = {}
+    for node in sorted(nodes, key=lambda node: node.path):
+        children.setdefault(node.parent_id, []).append(node)
+    sizes: typing.Dict[int, int] = {}
+    for node in sorted(nodes, key=lambda node: node.depth, reverse=True):
+        sizes[node.id] = 1 + sum(sizes[child.id] for child in children.get(node.id, []))
+
+    for parent_id, roots in children.items():
+        if parent_id in created:
+            continue
+        total = sum(sizes[node.id] for node in roots)
+        slot = reserve(parent_id, 2 * total)
+        if not slot:
+            continue
+        lo, hi = slot
+        _number_subtrees(roots, children, lo, (hi - lo) // (2 * total + 1))
+    changed = [node for node in nodes if node.lft]
+    TreeNode.objects.bulk_update(changed, TreeNode.TREE_INTERVAL_FIELDS, batch_size=BATCH_SIZE)
+    return len(changed)
+
+
+def rebuild() -> int:
+    """全量重建区间编码，未禁用的结点在整个编号空间中均匀编号，已禁用的结点清空编号
+
+    Returns:
+        编号的结点数量
+    """
+    nodes = list(TreeNode.objects.filter(disabled=False).only("id", "parent_id", "path").order_by("path"))
+    ids = set(node.id for node in nodes)
+    roots = []
+    children: typing.Dict[typing.Optional[int], typing.List[TreeNode]] = {}
+    for node in nodes:
+        if node.parent_id in ids:
+            children.setdefault(node.parent_id, []).append(node)
+        else:
+            roots.append(node)
+    _number_subtrees(roots, children, 0, MAX_VALUE // (2 * len(nodes) + 1))
+    TreeNode.objects.bulk_update(nodes, TreeNode.TREE_INTERVAL_FIELDS, batch_size=BATCH_SIZE)
+    TreeNode.objects.filter(disabled=True).exclude(lft=0, rgt=0).update(lft=0, rgt=0)
+    return len(nodes)
+
+
+def check() -> typing.List[int]:
+    """检查区间编码是否与父子关系一致：结点区间在父结点区间内，且兄弟结点的区间互不重叠
+
+    Returns:
+        编码错误的结点ID列表
+    """
+    rows = TreeNode.objects.filter(disabled=False).values_list("id", "parent_id", "lft", "rgt")
+    nodes = {node_id: (parent_id, lft, rgt) for node_id, parent_id, lft, rgt in rows.iterator(chunk_size=BATCH_SIZE)}
+    siblings: typing.Dict[typing.Optional[int], typing.List[typing.Tuple[int, int, int]]] = {}
+    results = set()
+    for node_id, (parent_id, lft, rgt) in nodes.items():
+        parent = nodes.get(parent_id) if parent_id else None
+        if not 0 < lft < rgt or (parent and not parent[1] < lft < rgt < parent[2]):
+            results.add(node_id)
+        siblings.setdefault(parent_id if parent else None, []).append((lft, rgt, node_id))
+    for group in siblings.values():
+        group.sort()
+        for (_, rgt, node_id), (lft, _, next_id) in zip(group, group[1:]):
+            if lft <= rgt:
+                results.update([node_id, next_id])
+    return sorted(results)
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# coding=utf-8
+import typing
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_tree_perm import effective
+
+
+class Command(BaseCommand):
+    help = "检查key结点生效权限表 EffectivePerm 与授权数据是否一致"
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        result = effective.check()
+        missing, extra = result["missing"], result["extra"]
+        for node_role_id, node_id in missing:
+            self.stdout.write(f"missing: node_role_id={node_role_id} node_id={node_id}")
+        for node_role_id, node_id in extra:
+            self.stdout.write(f"extra: node_role_id={node_role_id} node_id={node_id}")
+        if missing or extra:
+            raise CommandError(
+                f"Effective permissions are inconsistent: missing={len(missing)} extra={len(extra)}. "
+                "Run 'python manage.py rebuild_effective_perms' to fix."
+            )
+        self.stdout.write(self.style.SUCCESS("Effective permissions are consistent."))
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# coding=utf-8
+import typing
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from django_tree_perm.controller import TreeNodeManger
+
+
+class Command(BaseCommand):
+    help = "流式导出树型结构的JSON数据"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("file", help="导出的文件路径，`-` 表示输出到标准输出")
+        parser.add_argument("--path", default=None, help="仅导出该结点及其子结点")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="每批从数据库读取的结点数量")
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        content = TreeNodeManger.iter_json_tree(path=options["path"], chunk_size=options["chunk_size"])
+        if options["file"] == "-":
+            for part in content:
+                self.stdout.write(part, ending="")
+        else:
+            with open(options["file"], "w", encoding="utf-8") as fp:
+                fp.writelines(content)
+                self.stdout.write(self.style.SUCCESS(f"Exported to {options['file']}."))
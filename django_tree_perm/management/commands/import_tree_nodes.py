@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# coding=utf-8
+import sys
+import typing
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from django_tree_perm import utils
+from django_tree_perm.controller import TreeNodeManger
+
+
+class Command(BaseCommand):
+    help = "从NDJSON文件流式导入结点，每行一个结点，中断后可通过 --resume-after 继续导入"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("file", help="NDJSON文件路径，`-` 表示从标准输入读取")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="每个事务写入的结点数量")
+        parser.add_argument("--resume-after", default=None, help="上次最后提交的结点路径")
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        def progress(result: typing.Dict[str, typing.Any]) -> None:
+            self.stdout.write(
+                f"created={result['created']} skipped={result['skipped']} last_path={result['last_path']}"
+            )
+
+        if options["file"] == "-":
+            result = self._import(sys.stdin, options, progress)
+        else:
+            with open(options["file"], encoding="utf-8") as fp:
+                result = self._import(fp, options, progress)
+        self.stdout.write(self.style.SUCCESS(f"Created {result['created']} nodes, skipped {result['skipped']} nodes."))
+
+    def _import(
+        self, fp: typing.TextIO, options: typing.Dict[str, typing.Any], progress: typing.Callable
+    ) -> typing.Dict[str, typing.Any]:
+        return TreeNodeManger.import_tree_records(
+            utils.read_ndjson(fp),
+            chunk_size=options["chunk_size"],
+            resume_after=options["resume_after"],
+            progress=progress,
+        )
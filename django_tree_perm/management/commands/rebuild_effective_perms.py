@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# coding=utf-8
+import typing
+
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from django_tree_perm import effective
+
+
+class Command(BaseCommand):
+    help = "全量重建key结点生效权限表 EffectivePerm"
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        with transaction.atomic():
+            count = effective.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} effective permissions."))
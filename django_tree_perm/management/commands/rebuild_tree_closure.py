@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# coding=utf-8
+import typing
+
+from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from django_tree_perm import closure
+
+
+class Command(BaseCommand):
+    help = "检查并全量重建树结点闭包表 TreeNodeClosure"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--check", action="store_true", help="仅检查闭包表是否与结点数据一致，不做修改")
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        if options["check"]:
+            results = closure.check()
+            for key in ("missing", "extra"):
+                for ancestor_id, descendant_id, distance in results[key]:
+                    self.stdout.write(
+                        f"{key}: ancestor_id={ancestor_id} descendant_id={descendant_id} distance={distance}"
+                    )
+            if results["missing"] or results["extra"]:
+                raise CommandError(
+                    f"Tree node closure is inconsistent: missing={len(results['missing'])}, "
+                    f"extra={len(results['extra'])}. Run 'python manage.py rebuild_tree_closure' to fix."
+                )
+            self.stdout.write(self.style.SUCCESS("Tree node closure is consistent."))
+            return
+
+        with transaction.atomic():
+            count = closure.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} closure rows."))
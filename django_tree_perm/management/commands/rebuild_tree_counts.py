@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# coding=utf-8
+import typing
+
+from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from django_tree_perm import counts
+from django_tree_perm.cache import tree_response_cache
+
+
+class Command(BaseCommand):
+    help = "检查并全量重建树结点的子树规模字段 child_count/descendant_count"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--check", action="store_true", help="仅检查数据是否一致，不做修改")
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        if options["check"]:
+            results = counts.check()
+            for node_id, expected, actual in results:
+                self.stdout.write(f"node_id={node_id} expected={expected} actual={actual}")
+            if results:
+                raise CommandError(
+                    f"Tree node counts are inconsistent: nodes={len(results)}. "
+                    "Run 'python manage.py rebuild_tree_counts' to fix."
+                )
+            self.stdout.write(self.style.SUCCESS("Tree node counts are consistent."))
+            return
+
+        with transaction.atomic():
+            count = counts.rebuild()
+            if count:
+                # 批量更新不会触发信号
+                tree_response_cache.invalidate()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counts of {count} nodes."))
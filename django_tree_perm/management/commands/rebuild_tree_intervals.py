@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# coding=utf-8
+import typing
+
+from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from django_tree_perm import intervals
+
+
+class Command(BaseCommand):
+    help = "检查并全量重建树结点的嵌套集合区间编码 lft/rgt"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--check", action="store_true", help="仅检查编码是否与父子关系一致，不做修改")
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        if options["check"]:
+            node_ids = intervals.check()
+            for node_id in node_ids:
+                self.stdout.write(f"invalid: node_id={node_id}")
+            if node_ids:
+                raise CommandError(
+                    f"Tree node intervals are inconsistent: nodes={len(node_ids)}. "
+                    "Run 'python manage.py rebuild_tree_intervals' to fix."
+                )
+            self.stdout.write(self.style.SUCCESS("Tree node intervals are consistent."))
+            return
+
+        with transaction.atomic():
+            count = intervals.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt intervals of {count} nodes."))
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# coding=utf-8
+import typing
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from django_tree_perm.controller import TreeNodeManger
+
+
+class Command(BaseCommand):
+    help = "分批删除结点及其所有子结点，中断后可重新执行继续删除"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("path", help="结点路径")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="每批处理的结点数量")
+
+    def handle(self, *args: typing.Any, **options: typing.Any) -> None:
+        def progress(done: int, total: int) -> None:
+            self.stdout.write(f"{done}/{total}")
+
+        manager = TreeNodeManger(path=options["path"])
+        rows = manager.remove_in_chunks(chunk_size=options["chunk_size"], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Removed {rows} nodes."))
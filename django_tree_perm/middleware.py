@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+中间件模块
+
+在项目 `settings.MIDDLEWARE` 中 `AuthenticationMiddleware` 之后加入 `PermResolverMiddleware`，
+请求内通过 `request.tree_perm` 判断权限，详见 `django_tree_perm.controller.PermResolver`。
+
+"""
+import typing
+
+from django.http import HttpRequest, HttpResponse
+from django.utils.functional import SimpleLazyObject
+
+from django_tree_perm.controller import PermResolver
+
+
+def get_perm_resolver(request: HttpRequest) -> PermResolver:
+    """获取请求的权限判断对象，未配置中间件时创建并挂载到 request 上"""
+    resolver = getattr(request, "tree_perm", None)
+    if resolver is None:
+        resolver = PermResolver(getattr(request, "user", None))
+        request.tree_perm = resolver
+    return resolver
+
+
+class PermResolverMiddleware(object):
+    """为每个请求挂载权限判断对象 `request.tree_perm`"""
+
+    def __init__(self, get_response: typing.Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        request.tree_perm = SimpleLazyObject(lambda: PermResolver(getattr(request, "user", None)))
+        return self.get_response(request)
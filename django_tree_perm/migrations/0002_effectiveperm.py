@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_tree_perm', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectivePerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effectiveperm_set', to='django_tree_perm.treenode')),
+                ('node_role', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effectiveperm_set', to='django_tree_perm.noderole')),
+                ('role', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effectiveperm_set', to='django_tree_perm.role')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effectiveperm_set', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'key结点生效权限',
+                'indexes': [models.Index(fields=['user', 'node'], name='django_tree_user_id_3e700e_idx')],
+                'unique_together': {('node_role', 'node')},
+            },
+        ),
+    ]
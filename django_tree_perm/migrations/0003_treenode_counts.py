@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:58
+
+from django.db import migrations, models
+
+
+def backfill_counts(apps, schema_editor):
+    """按照深度由深到浅累加未禁用结点的计数"""
+    TreeNode = apps.get_model("django_tree_perm", "TreeNode")
+    rows = TreeNode.objects.filter(disabled=False).values_list("id", "parent_id", "depth")
+    nodes = sorted(rows.iterator(), key=lambda row: row[2], reverse=True)
+    counts = {node_id: [0, 0] for node_id, _, _ in nodes}
+    for node_id, parent_id, _ in nodes:
+        if parent_id in counts:
+            counts[parent_id][0] += 1
+            counts[parent_id][1] += counts[node_id][1] + 1
+    objs = [
+        TreeNode(id=node_id, child_count=children, descendant_count=descendants)
+        for node_id, (children, descendants) in counts.items()
+        if children
+    ]
+    TreeNode.objects.bulk_update(objs, ["child_count", "descendant_count"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_tree_perm", "0002_effectiveperm"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="treenode",
+            name="child_count",
+            field=models.IntegerField(default=0, verbose_name="直接子结点个数"),
+        ),
+        migrations.AddField(
+            model_name="treenode",
+            name="descendant_count",
+            field=models.IntegerField(default=0, verbose_name="子孙结点个数"),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_tree_perm", "0003_treenode_counts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="treenode",
+            name="lft",
+            field=models.BigIntegerField(default=0, verbose_name="区间左边界"),
+        ),
+        migrations.AddField(
+            model_name="treenode",
+            name="rgt",
+            field=models.BigIntegerField(default=0, verbose_name="区间右边界"),
+        ),
+        migrations.AddIndex(
+            model_name="treenode",
+            index=models.Index(
+                fields=["lft", "rgt"], name="django_tree_lft_a543ac_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_tree_perm", "0004_treenode_intervals"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TreeNodeClosure",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "distance",
+                    models.SmallIntegerField(default=0, verbose_name="层级距离"),
+                ),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="closure_descendants",
+                        to="django_tree_perm.treenode",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="closure_ancestors",
+                        to="django_tree_perm.treenode",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "结点闭包关系",
+                "indexes": [
+                    models.Index(
+                        fields=["descendant", "ancestor"],
+                        name="django_tree_descend_72b6c7_idx",
+                    )
+                ],
+                "unique_together": {("ancestor", "descendant")},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:20
+
+from django.db import migrations, models
+
+
+def backfill_ancestor_ids(apps, schema_editor):
+    """按照深度由浅到深，在父结点的父类结点ID之后追加父结点ID"""
+    TreeNode = apps.get_model("django_tree_perm", "TreeNode")
+    rows = TreeNode.objects.filter(disabled=False).order_by("depth").values_list("id", "parent_id")
+    ancestors = {}
+    objs = []
+    for node_id, parent_id in rows.iterator():
+        value = f"{ancestors[parent_id]}{parent_id}," if parent_id in ancestors else ""
+        ancestors[node_id] = value
+        if value:
+            objs.append(TreeNode(id=node_id, ancestor_ids=value))
+    TreeNode.objects.bulk_update(objs, ["ancestor_ids"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_tree_perm", "0005_treenodeclosure"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="treenode",
+            name="ancestor_ids",
+            field=models.TextField(blank=True, default="", verbose_name="父类结点ID"),
+        ),
+        migrations.RunPython(backfill_ancestor_ids, migrations.RunPython.noop),
+    ]
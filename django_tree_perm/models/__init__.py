@@ -1,4 +1,4 @@
 #!/usr/bin/env python
 # coding=utf-8
 
-from .tree import User, TreeNode, Role, NodeRole  # noqa: F401,F403
+from .tree import User, TreeNode, Role, NodeRole, EffectivePerm, TreeNodeClosure  # noqa: F401,F403
@@ -2,9 +2,16 @@
 # coding=utf-8
 import typing
 
-from django.db import models
+import django
+from django.db import models, connections
+from django.db.models.functions import Cast, Concat, StrIndex
 
-from django_tree_perm.utils import TREE_SPLIT_NODE_FLAG
+from django_tree_perm import settings
+from django_tree_perm.utils import TREE_SPLIT_ID_FLAG, TREE_SPLIT_NODE_FLAG, get_tree_paths
+from django_tree_perm.search import search_index
+
+# 每个搜索规则的排名间隔，需大于树的最大深度
+SEARCH_RANK_STEP = 1000
 
 
 class TreeNodeManager(models.Manager):
@@ -27,6 +34,10 @@ class TreeNodeQuerySet(models.QuerySet):
             - 优先搜索 is_key=True, name=value的结点，若存在忽略深度depth直接返回
             - 若无继续搜索 is_key=True, name contains 的结点，若存在忽略深度depth直接返回
             - 其次搜索 name contains 的结点，最终返回结果，仅返回 树深度depth 最浅的结点
+        - 以上规则通过 `filter_by_rank` 合并为一条SQL语句按照优先级排名返回，不再逐个规则查询是否存在；
+          之后追加的过滤条件只过滤排名最高的结点
+        - 开启 `TREE_PERM_SEARCH_INDEX_ENABLED` 后，在内存索引中按照以上规则排好优先级，通常只查询一次数据库，
+          详见 `django_tree_perm.search.SearchIndex.search`
 
         Args:
             value: 搜索输入值
@@ -38,29 +49,73 @@ class TreeNodeQuerySet(models.QuerySet):
         queryset = self
         if not value:
             return queryset.none()
+        # 结点标识只包含小写字母，转换为小写后匹配，各数据库及内存索引的结果一致
+        value = value.lower()
+        if search_index.enabled:
+            return search_index.search(queryset, value)
 
         # 传的值是path路径
         if TREE_SPLIT_NODE_FLAG in value:
-            qs = queryset.filter(path=value)
-            if qs.exists():
-                return qs
-            qs = queryset.filter(path__startswith=value)
-            if not qs.exists():
-                qs = queryset.filter(path__contains=value)
-            return qs.limit_to_top_node()
-
-        # 绝对叶子结点有值相等
-        qs = queryset.filter(is_key=True, name=value)
-        if qs.exists():
-            return qs
-        # 绝对叶子结点值有关联
-        qs = queryset.filter(is_key=True, name__contains=value)
-        if qs.exists():
-            return qs
-
-        # 根据name模糊搜索
-        qs = queryset.filter(name__contains=value)
-        return qs.limit_to_top_node()
+            rules = [
+                (models.Q(path=value), False),
+                (models.Q(path__startswith=value), True),
+                (models.Q(path__contains=value), True),
+            ]
+        else:
+            rules = [
+                # 绝对叶子结点有值相等
+                (models.Q(is_key=True, name=value), False),
+                # 绝对叶子结点值有关联
+                (models.Q(is_key=True, name__contains=value), False),
+                # 根据name模糊搜索
+                (models.Q(name__contains=value), True),
+            ]
+        return queryset.filter_by_rank(rules)
+
+    def filter_by_rank(self, rules: typing.List[typing.Tuple[models.Q, bool]]) -> "TreeNodeQuerySet":
+        """按照规则的先后顺序，一次查询返回排名最高的结点
+
+        - 通过 `CASE WHEN` 计算每个结点命中的第一个规则作为排名，需要限制深度的规则再加上结点的深度 depth；
+        - 数据库支持窗口函数时(Django>=4.2)，通过 `MIN(...) OVER ()` 过滤出排名最高的结点，
+          否则通过标量子查询查出最高的排名；
+        - 第一个规则不限制深度时(例如路径或者标识相等)，单独按照该规则查询，与其他规则的排名通过 `UNION ALL` 合并，
+          其他规则加上 `NOT EXISTS` 第一个规则的条件，命中第一个规则时不再扫描模糊匹配的条件；
+        - 排名最高的结点通过 `id__in` 子查询返回，只有一条SQL语句；之后追加的过滤条件只过滤排名最高的结点，
+          不影响排名的计算；结点较多时可开启 `TREE_PERM_SEARCH_INDEX_ENABLED` 使用内存索引。
+
+        Args:
+            rules: (查询条件, 是否仅返回深度最浅的结点) 的列表，按照优先级由高到低排列
+
+        Returns:
+            TreeNodeQuerySet
+        """
+        condition, limit_depth = rules[0]
+        if limit_depth:
+            return self.filter(id__in=self._top_ranked_ids(rules))
+        if len(rules) == 1:
+            return self.filter(condition)
+        matched = self.filter(condition)
+        others = self._top_ranked_ids(rules[1:], start=1).filter(~models.Exists(matched))
+        return self.filter(id__in=matched.order_by().values("id").union(others, all=True))
+
+    def _top_ranked_ids(self, rules: typing.List[typing.Tuple[models.Q, bool]], start: int = 0) -> models.QuerySet:
+        """查询排名最高的结点ID，start 为第一个规则的序号"""
+        whens = []
+        query = models.Q()
+        for index, (condition, limit_depth) in enumerate(rules, start=start):
+            rank = models.Value(index * SEARCH_RANK_STEP)
+            whens.append(models.When(condition, then=rank + models.F("depth") if limit_depth else rank))
+            query |= condition
+        qs = self.filter(query).annotate(
+            search_rank=models.Case(*whens, output_field=models.IntegerField()),
+        )
+        if django.VERSION >= (4, 2) and connections[qs.db].features.supports_over_clause:
+            qs = qs.annotate(top_rank=models.Window(models.Min("search_rank")))
+            qs = qs.filter(search_rank=models.F("top_rank"))
+        else:
+            top_rank = qs.order_by("search_rank").values("search_rank")[:1]
+            qs = qs.filter(search_rank=models.Subquery(top_rank))
+        return qs.order_by().values("id")
 
     def limit_to_top_node(self) -> "TreeNodeQuerySet":
         """若是按照路径查找，尽可能返回更少的结点。
@@ -70,13 +125,7 @@ class TreeNodeQuerySet(models.QuerySet):
         Returns:
             TreeNodeQuerySet
         """
-        qs = self
-        first = qs.order_by("depth").first()
-        if first:
-            qs = qs.filter(depth=first.depth)
-        else:
-            qs = qs.none()
-        return qs
+        return self.filter_by_rank([(models.Q(id__isnull=False), True)])
 
     def search_keys(self, value: str) -> "TreeNodeQuerySet":
         """仅搜索关键结点(key node)
@@ -88,15 +137,72 @@ class TreeNodeQuerySet(models.QuerySet):
             TreeNodeQuerySet
         """
         queryset = self.filter(is_key=True)
-        qs = queryset.filter(name=value)
-        if not qs.exists():
-            # 绝对叶子结点值有关联
-            qs = queryset.filter(name__contains=value)
-        return qs.order_by("name")
+        # 优先名称相等，否则返回名称有关联的结点
+        rules = [(models.Q(name=value), False), (models.Q(name__contains=value), False)]
+        return queryset.filter_by_rank(rules).order_by("name")
+
+    def descendants_of(self, node: typing.Any, include_self: bool = False) -> "TreeNodeQuerySet":
+        """查询结点的所有子孙结点
+
+        结点可以使用区间查询时(详见 `TreeNode.has_interval`)，按照 lft 整数范围查询，否则按照路径前缀查询。
+
+        Args:
+            node: TreeNode 结点对象
+            include_self: 是否包含结点自身
+
+        Returns:
+            TreeNodeQuerySet
+        """
+        if node.has_interval:
+            lookup = "lft__gte" if include_self else "lft__gt"
+            return self.filter(**{lookup: node.lft, "lft__lte": node.rgt})
+        query = models.Q(path__startswith=node.path_prefix)
+        if include_self:
+            query = models.Q(path=node.path) | query
+        return self.filter(query)
+
+    def ancestors_of(self, node: typing.Any, include_self: bool = False) -> "TreeNodeQuerySet":
+        """查询结点的所有父类结点
+
+        结点可以使用区间查询时，查询区间包含该结点的结点，否则按照父类路径查询。
+
+        Args:
+            node: TreeNode 结点对象
+            include_self: 是否包含结点自身
+
+        Returns:
+            TreeNodeQuerySet
+        """
+        if node.has_interval:
+            qs = self.filter(lft__gt=0, lft__lte=node.lft, rgt__gte=node.rgt)
+            return qs if include_self else qs.exclude(id=node.id)
+        paths = get_tree_paths(node.path)
+        return self.filter(path__in=paths if include_self else paths[:-1])
+
+    def is_descendant(self, node: typing.Any, ancestor: typing.Any) -> bool:
+        """判断结点是否是另一个结点的子孙结点，不查询数据库
+
+        Args:
+            node: TreeNode 结点对象
+            ancestor: TreeNode 父类结点对象
+
+        Returns:
+            bool
+        """
+        if node.has_interval and ancestor.has_interval:
+            return ancestor.lft < node.lft and node.rgt < ancestor.rgt
+        return bool(node.path) and node.path.startswith(ancestor.path_prefix)
 
     def filter_by_perm(self, user_id: int, roles: typing.Optional[typing.List[str]] = None) -> "TreeNodeQuerySet":
         """根据用户和角色搜索相关联的结点
 
+        - 开启 `TREE_PERM_CLOSURE_ENABLED` 后，通过闭包表关联授权结点的所有子孙结点，不再拼接路径条件；
+        - 已被父类结点覆盖的授权路径会被合并，不再单独生成查询条件；
+        - 合并后的路径数量不超过 `TREE_PERM_FILTER_PATHS_LIMIT` 时，按照路径前缀拼接查询条件；
+          开启 `TREE_PERM_NESTED_SET_ENABLED` 且授权结点都已编号时，改为按照区间拼接 lft 整数范围条件；
+        - 超过时改为按照 `ancestor_ids` 关联授权结点的 EXISTS 子查询，SQL 语句长度固定，不随授权数量和树的深度增长；
+          每个结点都要逐个比对用户的授权，全表统计且授权较多时建议开启 `TREE_PERM_CLOSURE_ENABLED`；
+
         Args:
             user_id: 用户ID
             roles: 用户角色，有任意其中一个角色即可，不传递表示有任意角色即可.
@@ -112,13 +218,92 @@ class TreeNodeQuerySet(models.QuerySet):
         nr_qs = NodeRole.objects.filter(user_id=user_id)
         if roles:
             nr_qs = nr_qs.filter(role__name__in=roles)
-        paths = list(nr_qs.values_list("node__path", flat=True).distinct())
+        if settings.TREE_PERM_CLOSURE_ENABLED:
+            from django_tree_perm.models import TreeNodeClosure
+
+            closure_qs = TreeNodeClosure.objects.filter(ancestor_id__in=nr_qs.values("node_id"))
+            return queryset.filter(id__in=closure_qs.values("descendant_id"))
+
+        rows = nr_qs.values_list("node__path", "node__lft", "node__rgt").distinct()
+        intervals = {path: (lft, rgt) for path, lft, rgt in rows}
+        paths = collapse_paths(intervals.keys())
         if not paths:
             return queryset.none()
 
+        if len(paths) > settings.TREE_PERM_FILTER_PATHS_LIMIT:
+            # 授权结点为自身或者出现在父类结点ID中，例如 ",1,3," 包含 ",3,"
+            grants = nr_qs.annotate(
+                position=StrIndex(
+                    Concat(
+                        models.Value(TREE_SPLIT_ID_FLAG),
+                        models.OuterRef("ancestor_ids"),
+                        output_field=models.TextField(),
+                    ),
+                    Concat(
+                        models.Value(TREE_SPLIT_ID_FLAG),
+                        Cast("node_id", models.CharField()),
+                        models.Value(TREE_SPLIT_ID_FLAG),
+                        output_field=models.TextField(),
+                    ),
+                )
+            )
+            grants = grants.filter(models.Q(node_id=models.OuterRef("id")) | models.Q(position__gt=0))
+            return queryset.filter(models.Exists(grants))
+
+        if settings.TREE_PERM_NESTED_SET_ENABLED and all(0 < intervals[path][0] < intervals[path][1] for path in paths):
+            # 子结点的区间都在有权限的结点区间内
+            query = models.Q()
+            for path in paths:
+                lft, rgt = intervals[path]
+                query |= models.Q(lft__gte=lft, lft__lte=rgt)
+            return queryset.filter(query)
+
         # 根据有权限的路径，其子结点也都有权限
         query = models.Q(path__in=paths)
         for path in paths:
             query = query | models.Q(path__startswith=f"{path}{TREE_SPLIT_NODE_FLAG}")
         queryset = queryset.filter(query)
         return queryset
+
+    def filter_keys_by_perm(self, user_id: int, roles: typing.Optional[typing.List[str]] = None) -> "TreeNodeQuerySet":
+        """根据用户和角色搜索有权限的key结点
+
+        开启 `TREE_PERM_EFFECTIVE_ENABLED` 后直接查询生效权限表，否则同 `filter_by_perm` 按照授权路径查询。
+
+        Args:
+            user_id: 用户ID
+            roles: 用户角色，有任意其中一个角色即可，不传递表示有任意角色即可.
+
+        Returns:
+            TreeNodeQuerySet
+        """
+        queryset = self.filter(is_key=True)
+        if not settings.TREE_PERM_EFFECTIVE_ENABLED:
+            return queryset.filter_by_perm(user_id, roles=roles)
+
+        from django_tree_perm.models import EffectivePerm
+
+        ep_qs = EffectivePerm.objects.filter(user_id=user_id)
+        if roles:
+            ep_qs = ep_qs.filter(role__name__in=roles)
+        return queryset.filter(id__in=ep_qs.values("node_id"))
+
+
+def collapse_paths(paths: typing.Iterable[str]) -> typing.List[str]:
+    """合并路径，去掉已被父类路径覆盖的子路径
+
+    例如 ["a.b", "a", "a.bc.d", "c"] 返回 ["a", "c"]
+
+    Args:
+        paths: 树结点路径
+
+    Returns:
+        排序后的路径
+    """
+    path_set = set(path for path in paths if path)
+    results = []
+    for path in sorted(path_set):
+        parents = get_tree_paths(path)[:-1]
+        if not any(parent in path_set for parent in parents):
+            results.append(path)
+    return results
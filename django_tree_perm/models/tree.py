@@ -6,7 +6,8 @@ import hashlib
 from django.db import models
 from django.core.validators import RegexValidator
 
-from django_tree_perm.utils import TREE_SPLIT_NODE_FLAG, get_tree_paths
+from django_tree_perm import settings
+from django_tree_perm.utils import TREE_SPLIT_NODE_FLAG, get_tree_paths, join_ancestor_ids, split_ancestor_ids
 from .manager import TreeNodeManager, TreeNodeQuerySet
 from .utils import User, user_to_json, format_datetime_field
 
@@ -36,8 +37,13 @@ class TreeNode(models.Model):
     | path        | varchar(191)  | 树结点完整路径    |         |
     | depth       | smallint      | 树结点深度        | `1`     |                                      |
     | node_hash   | 结点哈希值    | 保证唯一值        |         | path 全局唯一 ，且is_key=True时name全局唯一 |
+    | ancestor_ids | text         | 父类结点ID        | `""`    | 由根结点开始，不含自身，例如 `1,3,`  |
     | created_at  | datetime(6)   | 创建时间          |         |                                      |
     | updated_at  | datetime(6)   | 更新时间          |         |                                      |
+    | child_count | int           | 直接子结点个数    | `0`     | 仅统计未禁用的结点                   |
+    | descendant_count | int      | 子孙结点个数      | `0`     | 仅统计未禁用的结点，不含自身         |
+    | lft         | bigint        | 区间左边界        | `0`     | 嵌套集合编码，子孙结点的区间在其内部 |
+    | rgt         | bigint        | 区间右边界        | `0`     | 为0时表示未编号                      |
 
 
     Tip: 注意
@@ -46,9 +52,19 @@ class TreeNode(models.Model):
 
     Tip: `TREE_SPECIAL_FIELDS`
         定义特殊字段，这些字段不主动赋值；调用 `validate_save` 保存会自动更新相关字段，详见函数 `patch_attrs` 。
+
+    Tip: `TREE_COUNT_FIELDS`
+        子树规模字段，由 `django_tree_perm.counts` 沿父类结点链路按集合更新；更新已有结点时 `save` 不会写入这些字段，
+        避免保存旧的结点对象时覆盖计数。
+
+    Tip: `TREE_INTERVAL_FIELDS`
+        嵌套集合区间字段，开启 `TREE_PERM_NESTED_SET_ENABLED` 后由 `django_tree_perm.intervals` 维护；
+        同 `TREE_COUNT_FIELDS` ，更新已有结点时 `save` 不会写入这些字段。
     """
 
-    TREE_SPECIAL_FIELDS = ("path", "depth", "node_hash", "updated_at")
+    TREE_SPECIAL_FIELDS = ("path", "depth", "node_hash", "ancestor_ids", "updated_at")
+    TREE_COUNT_FIELDS = ("child_count", "descendant_count")
+    TREE_INTERVAL_FIELDS = ("lft", "rgt")
 
     class Meta:
         app_label = "django_tree_perm"
@@ -56,6 +72,7 @@ class TreeNode(models.Model):
         ordering = ("path",)
         indexes = [
             models.Index(fields=["is_key", "disabled", "name"]),
+            models.Index(fields=["lft", "rgt"]),
         ]
 
     name = models.CharField(verbose_name="标识", max_length=64, db_index=True, validators=[tree_validator()])
@@ -88,14 +105,31 @@ class TreeNode(models.Model):
             "unique": "结点已存在，请更换标识",
         },
     )
+    # 父类结点ID，权限判断时直接按照结点ID查询授权，无需关联结点表匹配路径
+    ancestor_ids = models.TextField(verbose_name="父类结点ID", default="", blank=True)
     created_at = models.DateTimeField("创建时间", auto_now_add=True)
     updated_at = models.DateTimeField("修改时间", auto_now=True)
+    # 子树规模，不允许直接赋值更新
+    child_count = models.IntegerField(verbose_name="直接子结点个数", default=0)
+    descendant_count = models.IntegerField(verbose_name="子孙结点个数", default=0)
+    # 嵌套集合区间编码，不允许直接赋值更新
+    lft = models.BigIntegerField(verbose_name="区间左边界", default=0)
+    rgt = models.BigIntegerField(verbose_name="区间右边界", default=0)
 
     objects = TreeNodeManager.from_queryset(TreeNodeQuerySet)()
 
     def __str__(self) -> str:
         return f"TreeNode:{self.id} {self.path}"
 
+    def save(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+        if not self._state.adding and not args and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.TREE_COUNT_FIELDS + self.TREE_INTERVAL_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def to_json(self, partial: bool = False) -> dict:
         """将model数据转换成可序列化的JSON数据
 
@@ -138,16 +172,35 @@ class TreeNode(models.Model):
         """
         return f"{self.path}{TREE_SPLIT_NODE_FLAG}"
 
+    @property
+    def has_interval(self) -> bool:
+        """是否可以使用嵌套集合区间查询，需开启 `TREE_PERM_NESTED_SET_ENABLED` 且结点已编号"""
+        return bool(settings.TREE_PERM_NESTED_SET_ENABLED) and 0 < self.lft < self.rgt
+
     def get_self_and_children(self) -> TreeNodeQuerySet:
         """查询自身及其所有子结点，包含孙子结点
 
-        查询条件为：path=self.path | path__startswith=self.path_prefix
+        查询条件为：path=self.path | path__startswith=self.path_prefix ；
+        开启 `TREE_PERM_NESTED_SET_ENABLED` 后为：lft__gte=self.lft & lft__lte=self.rgt ，详见 `descendants_of`
 
         Returns:
             返回一个查询对象
         """
-        qs = TreeNode.objects.filter(models.Q(path=self.path) | models.Q(path__startswith=self.path_prefix))
-        return qs
+        return TreeNode.objects.descendants_of(self, include_self=True)
+
+    def get_ancestor_ids(self, include_self: bool = True) -> typing.List[int]:
+        """获取由根结点开始的父类结点ID列表，与 `get_tree_paths(self.path)` 的路径一一对应
+
+        Args:
+            include_self: 是否包含结点自身
+
+        Returns:
+            结点ID列表
+        """
+        node_ids = split_ancestor_ids(self.ancestor_ids)
+        if include_self and self.id:
+            node_ids.append(self.id)
+        return node_ids
 
     def patch_attrs(self) -> None:
         """处理更新 `TREE_SPECIAL_FIELDS` 中定义字段的值
@@ -157,6 +210,7 @@ class TreeNode(models.Model):
         - `node_hash` 保证全局唯一的约束
             - path全局唯一
             - is_key=True是，name字段全局唯一
+        - `ancestor_ids` 在父结点的父类结点ID之后追加父结点ID，已禁用的结点为空
         """
         # 初始化path
         path = self.path
@@ -179,6 +233,11 @@ class TreeNode(models.Model):
             _value = self.name
         _hash = hashlib.md5(_value.encode("utf-8")).hexdigest()
         self.node_hash = _hash
+        # 更新父类结点ID
+        if self.disabled or not self.parent_id:
+            self.ancestor_ids = ""
+        else:
+            self.ancestor_ids = join_ancestor_ids(self.parent.ancestor_ids, self.parent_id)
 
     def validate_save(self) -> None:
         """更新特殊字段并校验数据合法性后进行保存"""
@@ -226,7 +285,8 @@ class Role(models.Model):
 
         Args:
             partial: 是否返回部分数据.
-            path: 结点路径，传递后将返回当前结点下有角色权限的用户，从父类结点继承的角色也算
+            path: 结点路径，传递后将返回当前结点下有角色权限的用户，从父类结点继承的角色也算；
+                开启 `TREE_PERM_CLOSURE_ENABLED` 后通过闭包表关联结点自身及其父类结点上的授权
 
         Returns:
             返回JSON数据
@@ -246,10 +306,12 @@ class Role(models.Model):
                 }
             )
             if path:
-                paths = get_tree_paths(path)
-                node_role_qs = NodeRole.objects.filter(node__path__in=paths, role_id=self.id).select_related(
-                    "user", "node"
-                )
+                if settings.TREE_PERM_CLOSURE_ENABLED:
+                    node_ids = TreeNodeClosure.objects.filter(descendant__path=path).values("ancestor_id")
+                    node_role_qs = NodeRole.objects.filter(node_id__in=node_ids, role_id=self.id)
+                else:
+                    node_role_qs = NodeRole.objects.filter(node__path__in=get_tree_paths(path), role_id=self.id)
+                node_role_qs = node_role_qs.select_related("user", "node")
                 data["user_set"] = []
                 for row in node_role_qs.order_by("-node__path"):
                     item = row.to_json(partial=True)
@@ -312,3 +374,68 @@ class NodeRole(models.Model):
                 }
             )
         return data
+
+
+class EffectivePerm(models.Model):
+    """key结点生效权限 (物化表)
+
+    结点上的角色授权对其所有子结点生效，该表将每条 `NodeRole` 授权展开到其覆盖的 key 结点上，
+    判断用户是否有 key 结点权限、查询用户有权限的 key 结点时只需一次索引查询。
+
+    - 通过配置 `TREE_PERM_EFFECTIVE_ENABLED` 开启维护，默认关闭；开启前需执行 `python manage.py rebuild_effective_perms`
+    - 随 `NodeRole` 的新增/删除，以及结点的新增/移动/删除增量维护，详见 `django_tree_perm.effective`
+
+    表结构设计如下：
+
+    | 字段         | 类型   | 描述     | 默认值 | 其他说明                  |
+    | ------------ | ------ | -------- | ------ | ------------------------- |
+    | id           | bigint | 主键     |        | pk(primary key), 自增     |
+    | node_role_id | bigint | 来源授权 |        | fk(foreign key)           |
+    | node_id      | bigint | key结点  |        | fk(foreign key)           |
+    | role_id      | bigint | 角色     |        | fk(foreign key)，冗余字段 |
+    | user_id      | bigint | 用户     |        | fk(foreign key)，冗余字段 |
+    """
+
+    class Meta:
+        app_label = "django_tree_perm"
+        verbose_name = "key结点生效权限"
+        unique_together = ("node_role", "node")
+        indexes = [
+            models.Index(fields=["user", "node"]),
+        ]
+
+    node_role = models.ForeignKey(NodeRole, on_delete=models.CASCADE, related_name="effectiveperm_set")
+    node = models.ForeignKey(TreeNode, on_delete=models.CASCADE, related_name="effectiveperm_set")
+    role = models.ForeignKey(Role, on_delete=models.CASCADE, related_name="effectiveperm_set")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="effectiveperm_set")
+
+
+class TreeNodeClosure(models.Model):
+    """结点闭包表
+
+    记录每个未禁用结点与其自身及所有父类结点的关系，查询父类结点、子孙结点时使用索引关联，不再拼接路径或者前缀匹配。
+
+    - 通过配置 `TREE_PERM_CLOSURE_ENABLED` 开启维护，默认关闭；开启前需执行 `python manage.py rebuild_tree_closure`
+    - 随结点的新增/移动/删除由 `TreeNodeManger` 维护，详见 `django_tree_perm.closure`
+
+    表结构设计如下：
+
+    | 字段          | 类型     | 描述     | 默认值 | 其他说明                    |
+    | ------------- | -------- | -------- | ------ | --------------------------- |
+    | id            | bigint   | 主键     |        | pk(primary key), 自增       |
+    | ancestor_id   | bigint   | 父类结点 |        | fk(foreign key)，包含自身   |
+    | descendant_id | bigint   | 子孙结点 |        | fk(foreign key)，包含自身   |
+    | distance      | smallint | 层级距离 | `0`    | 结点自身为0，直接子结点为1  |
+    """
+
+    class Meta:
+        app_label = "django_tree_perm"
+        verbose_name = "结点闭包关系"
+        unique_together = ("ancestor", "descendant")
+        indexes = [
+            models.Index(fields=["descendant", "ancestor"]),
+        ]
+
+    ancestor = models.ForeignKey(TreeNode, on_delete=models.CASCADE, related_name="closure_descendants")
+    descendant = models.ForeignKey(TreeNode, on_delete=models.CASCADE, related_name="closure_ancestors")
+    distance = models.SmallIntegerField(verbose_name="层级距离", default=0)
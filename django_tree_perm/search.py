@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+树结点搜索内存索引模块
+
+进程内加载所有结点(包含已禁用的结点)，对结点标识 `name` 和路径 `path` 建立 n-gram 倒排索引，
+`TreeNodeQuerySet.search_nodes` 在内存中按照搜索规则排好优先级，再一次查询数据库确认查询条件中存在的结点，不再逐个规则查询。
+
+- 通过配置 `TREE_PERM_SEARCH_INDEX_ENABLED` 开启，默认关闭；首次使用时加载
+- 单个结点的保存/删除通过信号在事务提交后增量更新，详见 `django_tree_perm.signals`
+- 批量移动、删除、导入结点后在事务提交后标记重新加载
+- 其他进程的变更无法感知，加载超过 `TREE_PERM_SEARCH_INDEX_TTL` 秒后重新加载
+- 确认结点时会用数据库中的值重新校验规则，索引过期只会遗漏结点，不会返回不匹配的结点
+- 结点标识和路径只包含小写字母，搜索值转换为小写后匹配，与数据库中不区分大小写的模糊匹配保持一致
+
+"""
+
+import typing
+
+from django.db import models
+
+from django_tree_perm import settings
+from django_tree_perm.index import BaseIndex
+from django_tree_perm.utils import TREE_SPLIT_NODE_FLAG
+
+# n-gram 的长度，短于该长度的搜索值遍历所有结点
+GRAM_SIZE = 3
+# 每次确认的结点数量
+BATCH_SIZE = 1000
+
+
+class SearchEntry(typing.NamedTuple):
+    """索引中的结点数据"""
+
+    id: int
+    parent_id: typing.Optional[int]
+    name: str
+    path: str
+    depth: int
+    is_key: bool
+    disabled: bool
+
+
+# 加载结点时查询的字段，与 SearchEntry 字段顺序一致
+SEARCH_FIELDS = SearchEntry._fields
+
+
+class Bucket(typing.NamedTuple):
+    """同一优先级的候选结点
+
+    - rule: 搜索规则，同一规则按照深度区分的优先级合并确认
+    - query: 该优先级在数据库中的查询条件
+    - match: 使用数据库中的值校验结点是否满足该优先级
+    - ids: 候选结点ID
+    """
+
+    rule: str
+    query: models.Q
+    match: typing.Callable[[SearchEntry], bool]
+    ids: typing.List[int]
+
+
+def get_grams(value: str) -> typing.Set[str]:
+    """获取字符串中所有长度为 `GRAM_SIZE` 的子串"""
+    grams = set()
+    for end in range(GRAM_SIZE, len(value) + 1):
+        start = end - GRAM_SIZE
+        grams.add(value[start:end])
+    return grams
+
+
+# 相等规则，见 `SearchIndex._iter_buckets`
+EXACT_RULES = ("path", "key")
+# 查询条件对应的校验方法，使用数据库中的值校验结点
+MATCHES: typing.Dict[str, typing.Callable[[SearchEntry, str], bool]] = {
+    "path__startswith": lambda node, value: node.path.startswith(value),
+    "path__contains": lambda node, value: value in node.path,
+    "name__contains": lambda node, value: value in node.name,
+}
+
+
+def match_depth(match: typing.Callable[[SearchEntry], bool], depth: int) -> typing.Callable[[SearchEntry], bool]:
+    """在校验规则的基础上，校验结点深度"""
+    return lambda node: node.depth == depth and match(node)
+
+
+class SearchIndex(BaseIndex):
+    """树结点搜索内存索引，加载和重新加载见 `BaseIndex`
+
+    - nodes: 结点ID到结点数据
+    - paths: 结点路径到结点ID列表，禁用的结点保留原路径，可能与新增的结点路径相同
+    - keys: key结点标识到结点ID列表
+    - child_counts: 结点ID到直接子结点个数，用于判断结点路径变更时是否需要重新加载
+    - names: 结点标识到结点ID列表
+    - grams: n-gram 到包含该子串的结点标识列表，相同的标识只记录一次
+    - path_grams: n-gram 到路径包含该子串的结点ID列表
+
+    n-gram 的记录在结点更新后不会删除，查找时校验；路径的 n-gram 按结点记录，内存占用与路径总长度成正比。
+    更新索引时加锁，查找时不加锁，只通过 `dict.get` 读取，索引被并发更新时不会抛出异常
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._nodes: typing.Dict[int, SearchEntry] = {}
+        self._paths: typing.Dict[str, typing.List[int]] = {}
+        self._keys: typing.Dict[str, typing.List[int]] = {}
+        self._child_counts: typing.Dict[typing.Optional[int], int] = {}
+        self._names: typing.Dict[str, typing.List[int]] = {}
+        self._grams: typing.Dict[str, typing.List[str]] = {}
+        self._path_grams: typing.Dict[str, typing.List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.TREE_PERM_SEARCH_INDEX_ENABLED)
+
+    @property
+    def ttl(self) -> float:
+        return float(settings.TREE_PERM_SEARCH_INDEX_TTL)
+
+    def _build(self) -> "SearchIndex":
+        """从数据库加载所有结点"""
+        from django_tree_perm.models import TreeNode
+
+        index = SearchIndex()
+        for row in TreeNode.objects.values_list(*SEARCH_FIELDS).iterator(chunk_size=BATCH_SIZE):
+            index._add(SearchEntry._make(row))
+        return index
+
+    def _swap(self, index: "SearchIndex") -> None:
+        self._nodes, self._paths, self._keys, self._child_counts = (
+            index._nodes,
+            index._paths,
+            index._keys,
+            index._child_counts,
+        )
+        self._names, self._grams, self._path_grams = index._names, index._grams, index._path_grams
+
+    def _reset(self) -> None:
+        self._nodes, self._paths, self._keys, self._child_counts = {}, {}, {}, {}
+        self._names, self._grams, self._path_grams = {}, {}, {}
+
+    def _add(self, node: SearchEntry, path_grams: bool = True) -> None:
+        self._nodes[node.id] = node
+        if node.path:
+            self._paths.setdefault(node.path, []).append(node.id)
+        if node.path and path_grams:
+            for gram in get_grams(node.path):
+                self._path_grams.setdefault(gram, []).append(node.id)
+        if node.is_key:
+            self._keys.setdefault(node.name, []).append(node.id)
+        self._child_counts[node.parent_id] = self._child_counts.get(node.parent_id, 0) + 1
+        node_ids = self._names.get(node.name)
+        if node_ids is None:
+            self._names[node.name] = [node.id]
+            for gram in get_grams(node.name):
+                self._grams.setdefault(gram, []).append(node.name)
+        else:
+            node_ids.append(node.id)
+
+    def _remove(self, node_id: int) -> typing.Optional[SearchEntry]:
+        node = self._nodes.pop(node_id, None)
+        if node:
+            for values, value in ((self._paths, node.path), (self._keys, node.name), (self._names, node.name)):
+                node_ids = values.get(value)
+                if node_ids and node_id in node_ids:
+                    node_ids.remove(node_id)
+                    if not node_ids:
+                        del values[value]
+            count = self._child_counts.get(node.parent_id, 0) - 1
+            if count > 0:
+                self._child_counts[node.parent_id] = count
+            else:
+                self._child_counts.pop(node.parent_id, None)
+        return node
+
+    def apply_save(self, node: SearchEntry) -> None:
+        """结点保存后更新索引；路径变更且有子结点时重新加载"""
+        with self._lock:
+            self._record(lambda index: index.apply_save(node))
+            if self._loaded_at is None:
+                return
+            old = self._nodes.get(node.id)
+            if old and old.path != node.path and self._child_counts.get(node.id):
+                self._loaded_at = None
+                return
+            self._remove(node.id)
+            # 路径未变更时不再重复记录路径的 n-gram
+            self._add(node, path_grams=not old or old.path != node.path)
+
+    def apply_delete(self, node_id: int) -> None:
+        """结点删除后更新索引"""
+        with self._lock:
+            self._record(lambda index: index.apply_delete(node_id))
+            self._remove(node_id)
+
+    def info(self) -> dict:
+        """索引统计信息"""
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "nodes": len(self._nodes),
+                "names": len(self._names),
+                "grams": len(self._grams),
+                "path_grams": len(self._path_grams),
+            }
+
+    def _name_contains(self, value: str) -> typing.List[SearchEntry]:
+        """查找标识中包含 value 的结点，使用最少标识的 n-gram 缩小范围后校验"""
+        grams = get_grams(value)
+        names: typing.Iterable[str]
+        if grams:
+            gram = min(grams, key=lambda gram: len(self._grams.get(gram, [])))
+            names = set(self._grams.get(gram, []))
+        else:
+            names = list(self._names.keys())
+        nodes: typing.List[SearchEntry] = []
+        for name in names:
+            if value in name:
+                nodes.extend(node for node in map(self._nodes.get, self._names.get(name, [])) if node)
+        return [node for node in nodes if value in node.name]
+
+    def _path_contains(self, value: str) -> typing.List[SearchEntry]:
+        """查找路径中包含 value 的结点，使用最少结点的 n-gram 缩小范围后校验"""
+        grams = get_grams(value)
+        nodes: typing.Iterable[typing.Optional[SearchEntry]]
+        if grams:
+            gram = min(grams, key=lambda gram: len(self._path_grams.get(gram, [])))
+            nodes = map(self._nodes.get, set(self._path_grams.get(gram, [])))
+        else:
+            nodes = list(self._nodes.values())
+        return [node for node in nodes if node and value in node.path]
+
+    @classmethod
+    def _iter_depths(
+        cls, rule: str, nodes: typing.List[SearchEntry], lookup: str, value: str
+    ) -> typing.Iterator[Bucket]:
+        """按照深度由浅到深返回同一规则的候选结点"""
+        levels: typing.Dict[int, typing.List[int]] = {}
+        for node in nodes:
+            levels.setdefault(node.depth, []).append(node.id)
+        match = MATCHES[lookup]
+        for depth in sorted(levels):
+            yield Bucket(
+                rule,
+                models.Q(**{lookup: value, "depth": depth}),
+                match_depth(lambda node: match(node, value), depth),
+                sorted(levels[depth]),
+            )
+
+    def _iter_buckets(self, value: str) -> typing.Iterator[Bucket]:
+        """按照 `TreeNodeQuerySet.search_nodes` 的规则由高到低返回各优先级的候选结点"""
+        if TREE_SPLIT_NODE_FLAG in value:
+            # 路径完全相等
+            node_ids = self._paths.get(value)
+            if node_ids:
+                yield Bucket("path", models.Q(path=value), lambda node: node.path == value, sorted(node_ids))
+
+            nodes = self._path_contains(value)
+            # 路径前缀匹配
+            starts = [node for node in nodes if node.path.startswith(value)]
+            yield from self._iter_depths("path__startswith", starts, "path__startswith", value)
+            # 路径包含
+            yield from self._iter_depths("path__contains", nodes, "path__contains", value)
+            return
+
+        # key结点标识相等
+        key_ids = self._keys.get(value)
+        if key_ids:
+            yield Bucket(
+                "key",
+                models.Q(is_key=True, name=value),
+                lambda node: node.is_key and node.name == value,
+                sorted(key_ids),
+            )
+
+        nodes = self._name_contains(value)
+        # key结点标识包含，忽略深度
+        node_ids = sorted(node.id for node in nodes if node.is_key)
+        if node_ids:
+            yield Bucket(
+                "key__contains",
+                models.Q(is_key=True, name__contains=value),
+                lambda node: node.is_key and value in node.name,
+                node_ids,
+            )
+        # 标识包含，按照深度由浅到深
+        yield from self._iter_depths("name__contains", nodes, "name__contains", value)
+
+    def search(self, queryset: models.QuerySet, value: str) -> models.QuerySet:
+        """按照 `TreeNodeQuerySet.search_nodes` 的规则搜索结点
+
+        - 同一规则各优先级的候选结点按顺序合并，每 `BATCH_SIZE` 个结点一次查询确认在 queryset 中存在的结点，
+          返回第一个存在结点的优先级，通常只需要查询一次数据库；
+        - 候选结点超过 `BATCH_SIZE` 个的优先级直接使用数据库查询条件判断是否存在；
+
+        Args:
+            queryset: TreeNodeQuerySet, 搜索范围
+            value: 搜索输入值
+
+        Returns:
+            TreeNodeQuerySet
+        """
+        if not value:
+            return queryset.none()
+        value = value.lower()
+        self._ensure_loaded()
+        pending: typing.List[Bucket] = []
+        size = 0
+        # 按需计算后续优先级的候选结点，存在结点时不再继续
+        for bucket in self._iter_buckets(value):
+            if pending and (bucket.rule != pending[-1].rule or size + len(bucket.ids) > BATCH_SIZE):
+                result = self._confirm(queryset, pending)
+                if result is not None:
+                    return result
+                pending, size = [], 0
+            if len(bucket.ids) > BATCH_SIZE:
+                result = queryset.filter(bucket.query)
+                if result.exists():
+                    return result
+                continue
+            pending.append(bucket)
+            size += len(bucket.ids)
+            if bucket.rule in EXACT_RULES:
+                # 相等规则只有一个优先级，立即确认，命中时无需计算模糊匹配的候选结点
+                result = self._confirm(queryset, pending)
+                if result is not None:
+                    return result
+                pending, size = [], 0
+        result = self._confirm(queryset, pending) if pending else None
+        return queryset.none() if result is None else result
+
+    @classmethod
+    def _confirm(cls, queryset: models.QuerySet, buckets: typing.List[Bucket]) -> typing.Optional[models.QuerySet]:
+        """一次查询确认候选结点，返回第一个存在结点的优先级，均不存在时返回None"""
+        node_ids = [node_id for bucket in buckets for node_id in bucket.ids]
+        rows = {row[0]: SearchEntry(*row) for row in queryset.filter(id__in=node_ids).values_list(*SEARCH_FIELDS)}
+        for bucket in buckets:
+            matched = [node_id for node_id in bucket.ids if node_id in rows and bucket.match(rows[node_id])]
+            if matched:
+                return queryset.filter(bucket.query, id__in=matched)
+        return None
+
+
+search_index = SearchIndex()
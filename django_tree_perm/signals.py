@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+信号处理模块
+
+在 `MrbacConfig.ready` 中导入，用于数据变更后失效相关缓存，以及增量维护生效权限表、结点内存索引、结点搜索索引和结点路径前缀树。
+
+"""
+
+import typing
+
+from django.db import transaction
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+
+from django_tree_perm import effective
+from django_tree_perm.models import User, TreeNode, Role, NodeRole
+from django_tree_perm.cache import perm_cache, tree_response_cache, change_generations
+from django_tree_perm.index import tree_index, IndexNode, INDEX_FIELDS
+from django_tree_perm.search import search_index, SearchEntry, SEARCH_FIELDS
+from django_tree_perm.trie import path_trie, TrieEntry, TRIE_FIELDS
+
+
+@receiver([post_save, post_delete], sender=NodeRole, dispatch_uid="tree_perm_node_role_changed")
+def node_role_changed(sender: typing.Type[NodeRole], instance: NodeRole, **kwargs: typing.Any) -> None:
+    perm_cache.invalidate_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Role, dispatch_uid="tree_perm_role_changed")
+def role_changed(sender: typing.Type[Role], instance: Role, **kwargs: typing.Any) -> None:
+    perm_cache.invalidate_grants()
+
+
+@receiver([post_save, post_delete], sender=TreeNode, dispatch_uid="tree_perm_tree_node_changed")
+def tree_node_changed(sender: typing.Type[TreeNode], instance: TreeNode, **kwargs: typing.Any) -> None:
+    # 结点路径变更会影响授权集合中记录的路径
+    perm_cache.invalidate_all()
+    tree_response_cache.invalidate()
+
+
+@receiver([post_save, post_delete], sender=User, dispatch_uid="tree_perm_user_changed")
+def user_changed(sender: typing.Type[User], instance: User, **kwargs: typing.Any) -> None:
+    # 角色成员接口返回用户信息，用于条件请求的校验值；登录时间不在返回结果中
+    update_fields = kwargs.get("update_fields")
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    change_generations.bump(change_generations.USERS)
+
+
+@receiver(post_save, sender=NodeRole, dispatch_uid="tree_perm_node_role_effective")
+def sync_node_role_effective(
+    sender: typing.Type[NodeRole], instance: NodeRole, created: bool = False, **kwargs: typing.Any
+) -> None:
+    # 删除授权时通过外键级联删除生效权限
+    if created and effective.is_enabled():
+        effective.sync_node_role(instance)
+
+
+@receiver(post_save, sender=TreeNode, dispatch_uid="tree_perm_tree_node_effective")
+def sync_tree_node_effective(sender: typing.Type[TreeNode], instance: TreeNode, **kwargs: typing.Any) -> None:
+    # key结点新增、禁用、移动都需要重新计算
+    if instance.is_key and effective.is_enabled():
+        effective.sync_key_nodes(TreeNode.objects.filter(id=instance.id))
+
+
+@receiver(post_save, sender=TreeNode, dispatch_uid="tree_perm_tree_node_index_saved")
+def tree_node_index_saved(sender: typing.Type[TreeNode], instance: TreeNode, **kwargs: typing.Any) -> None:
+    if tree_index.enabled:
+        # 记录保存时的数据，事务提交后再更新索引
+        node = IndexNode(*[getattr(instance, field) for field in INDEX_FIELDS])
+        disabled = instance.disabled
+        transaction.on_commit(lambda: tree_index.apply_save(node, disabled=disabled))
+
+
+@receiver(post_delete, sender=TreeNode, dispatch_uid="tree_perm_tree_node_index_deleted")
+def tree_node_index_deleted(sender: typing.Type[TreeNode], instance: TreeNode, **kwargs: typing.Any) -> None:
+    if tree_index.enabled:
+        node_id = instance.id
+        transaction.on_commit(lambda: tree_index.apply_delete(node_id))
+
+
+@receiver(post_save, sender=TreeNode, dispatch_uid="tree_perm_tree_node_search_saved")
+def tree_node_search_saved(sender: typing.Type[TreeNode], instance: TreeNode, **kwargs: typing.Any) -> None:
+    if search_index.enabled:
+        # 记录保存时的数据，事务提交后再更新索引
+        node = SearchEntry(*[getattr(instance, field) for field in SEARCH_FIELDS])
+        transaction.on_commit(lambda: search_index.apply_save(node))
+
+
+@receiver(post_delete, sender=TreeNode, dispatch_uid="tree_perm_tree_node_search_deleted")
+def tree_node_search_deleted(sender: typing.Type[TreeNode], instance: TreeNode, **kwargs: typing.Any) -> None:
+    if search_index.enabled:
+        node_id = instance.id
+        transaction.on_commit(lambda: search_index.apply_delete(node_id))
+
+
+@receiver(post_save, sender=TreeNode, dispatch_uid="tree_perm_tree_node_trie_saved")
+def tree_node_trie_saved(sender: typing.Type[TreeNode], instance: TreeNode, **kwargs: typing.Any) -> None:
+    # 前缀树在首次补全时加载，未加载时无需维护；过期后重新加载期间仍需维护
+    if path_trie.active:
+        entry = TrieEntry(*[getattr(instance, field) for field in TRIE_FIELDS])
+        disabled = instance.disabled
+        transaction.on_commit(lambda: path_trie.apply_save(entry, disabled=disabled))
+
+
+@receiver(post_delete, sender=TreeNode, dispatch_uid="tree_perm_tree_node_trie_deleted")
+def tree_node_trie_deleted(sender: typing.Type[TreeNode], instance: TreeNode, **kwargs: typing.Any) -> None:
+    if path_trie.active:
+        node_id = instance.id
+        transaction.on_commit(lambda: path_trie.apply_delete(node_id))
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+结点路径前缀树模块
+
+进程内按照路径分隔符 `TREE_SPLIT_NODE_FLAG` 将未禁用结点的路径拆分为逐级的标识，构建前缀树，
+用于输入路径时的自动补全，详见接口 `tree/complete/`。
+
+- 首次补全时加载，之后单个结点的保存/删除通过信号在事务提交后增量更新，详见 `django_tree_perm.signals`
+- 批量移动、删除、导入结点后在事务提交后标记重新加载
+- 其他进程的变更无法感知，加载超过 `TREE_PERM_TRIE_TTL` 秒后重新加载，加载期间继续使用旧的前缀树
+
+"""
+import bisect
+import typing
+
+from django_tree_perm import settings
+from django_tree_perm.index import BaseIndex
+from django_tree_perm.utils import TREE_SPLIT_NODE_FLAG
+
+
+class TrieEntry(typing.NamedTuple):
+    """前缀树中的结点数据"""
+
+    id: int
+    name: str
+    path: str
+    is_key: bool
+
+
+# 加载结点时查询的字段，与 TrieEntry 字段顺序一致
+TRIE_FIELDS = TrieEntry._fields
+
+
+class TrieNode(object):
+    """前缀树的结点
+
+    - entry: 结点数据，根为None
+    - children: 下一级标识到前缀树结点
+    - names: 排序后的下一级标识，用于按照前缀二分查找
+    """
+
+    __slots__ = ("entry", "children", "names")
+
+    def __init__(self, entry: typing.Optional[TrieEntry] = None) -> None:
+        self.entry = entry
+        self.children: typing.Dict[str, "TrieNode"] = {}
+        self.names: typing.List[str] = []
+
+    def to_json(self) -> dict:
+        entry = typing.cast(TrieEntry, self.entry)
+        return {
+            "id": entry.id,
+            "name": entry.name,
+            "path": entry.path,
+            "is_key": entry.is_key,
+            "has_children": bool(self.children),
+        }
+
+
+class PathTrie(BaseIndex):
+    """结点路径前缀树，读取时加锁；加载和重新加载见 `BaseIndex`
+
+    - root: 前缀树的根，其下一级为树的根结点
+    - paths: 结点ID到结点路径，用于删除、移动结点时查找原路径
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._root = TrieNode()
+        self._paths: typing.Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    @property
+    def ttl(self) -> float:
+        return float(settings.TREE_PERM_TRIE_TTL)
+
+    def _build(self) -> "PathTrie":
+        """从数据库加载所有未禁用的结点"""
+        from django_tree_perm.models import TreeNode
+
+        trie = PathTrie()
+        # 按照深度排序，父结点先于子结点加载
+        rows = TreeNode.objects.filter(disabled=False).order_by("depth").values_list(*TRIE_FIELDS)
+        for row in rows.iterator():
+            trie._add(TrieEntry(*row), keep_sorted=False)
+        stack = [trie._root]
+        while stack:
+            node = stack.pop()
+            node.names.sort()
+            stack.extend(node.children.values())
+        return trie
+
+    def _swap(self, trie: "PathTrie") -> None:
+        self._root, self._paths = trie._root, trie._paths
+
+    def _reset(self) -> None:
+        self._root, self._paths = TrieNode(), {}
+
+    def _find(self, names: typing.List[str]) -> typing.Optional[TrieNode]:
+        current = self._root
+        for name in names:
+            child = current.children.get(name)
+            if child is None:
+                return None
+            current = child
+        return current
+
+    def _add(self, entry: TrieEntry, keep_sorted: bool = True) -> bool:
+        *parent_names, name = entry.path.split(TREE_SPLIT_NODE_FLAG)
+        parent = self._find(parent_names)
+        if parent is None:
+            # 父结点已禁用或尚未加载
+            return False
+        node = parent.children.get(name)
+        if node is None:
+            node = parent.children[name] = TrieNode(entry)
+            if keep_sorted:
+                bisect.insort(parent.names, name)
+            else:
+                parent.names.append(name)
+        else:
+            node.entry = entry
+        self._paths[entry.id] = entry.path
+        return True
+
+    def _remove(self, node_id: int) -> typing.Optional[TrieNode]:
+        path = self._paths.pop(node_id, None)
+        if not path:
+            return None
+        *parent_names, name = path.split(TREE_SPLIT_NODE_FLAG)
+        parent = self._find(parent_names)
+        if parent is None or name not in parent.children:
+            return None
+        node = parent.children.pop(name)
+        del parent.names[bisect.bisect_left(parent.names, name)]
+        # 子孙结点随之移出前缀树
+        stack = list(node.children.values())
+        while stack:
+            child = stack.pop()
+            if child.entry:
+                self._paths.pop(child.entry.id, None)
+            stack.extend(child.children.values())
+        return node
+
+    def complete(
+        self,
+        prefix: str,
+        limit: int = 20,
+        predicate: typing.Optional[typing.Callable[[TrieEntry], bool]] = None,
+    ) -> dict:
+        """补全结点路径
+
+        按照路径分隔符拆分输入值，之前的标识需完全匹配，最后一段作为前缀；
+        返回最深一级匹配结点的子结点中标识以该前缀开始的结点，按照标识排序，最多 `limit` 个。
+        例如输入 `ops.db.my`，返回结点 `ops.db` 下标识以 `my` 开始的子结点；输入 `ops.db.` 返回其所有子结点。
+
+        Args:
+            prefix: 输入的路径前缀
+            limit: 最多返回的结点个数
+            predicate: 过滤结点的函数，返回False的结点不返回；在释放锁之后调用，可以查询数据库
+
+        Returns:
+            - parent: 最深一级匹配的结点路径，输入值不含分隔符时为空字符串，之前的标识无匹配结点时为None
+            - results: 补全的结点数据
+            - has_more: 是否还有更多补全的结点
+        """
+        self._ensure_loaded()
+        *parent_names, last = (prefix or "").split(TREE_SPLIT_NODE_FLAG)
+        results: typing.List[dict] = []
+        has_more = False
+        # 在锁内复制候选结点，之后再调用过滤函数，避免查询数据库时阻塞其他线程
+        candidates: typing.List[typing.Tuple[TrieEntry, dict]] = []
+        with self._lock:
+            parent = self._find(parent_names)
+            if parent is None:
+                return {"parent": None, "results": results, "has_more": has_more}
+            names = parent.names
+            for index in range(bisect.bisect_left(names, last), len(names)):
+                name = names[index]
+                if not name.startswith(last) or (not predicate and len(candidates) > limit):
+                    break
+                node = parent.children[name]
+                candidates.append((typing.cast(TrieEntry, node.entry), node.to_json()))
+        for entry, item in candidates:
+            if predicate and not predicate(entry):
+                continue
+            if len(results) >= limit:
+                has_more = True
+                break
+            results.append(item)
+        return {"parent": TREE_SPLIT_NODE_FLAG.join(parent_names), "results": results, "has_more": has_more}
+
+    def apply_save(self, entry: TrieEntry, disabled: bool = False) -> None:
+        """结点保存后更新前缀树；路径变更且有子结点时重新加载"""
+        with self._lock:
+            self._record(lambda trie: trie.apply_save(entry, disabled=disabled))
+            if self._loaded_at is None:
+                return
+            old_path = self._paths.get(entry.id)
+            if old_path and old_path != entry.path:
+                node = self._find(old_path.split(TREE_SPLIT_NODE_FLAG))
+                if node and node.children:
+                    self._loaded_at = None
+                    return
+            if old_path and (disabled or old_path != entry.path):
+                self._remove(entry.id)
+            if not disabled and not self._add(entry):
+                # 父结点不在前缀树中，重新加载
+                self._loaded_at = None
+
+    def apply_delete(self, node_id: int) -> None:
+        """结点删除后更新前缀树"""
+        with self._lock:
+            self._record(lambda trie: trie.apply_delete(node_id))
+            self._remove(node_id)
+
+    def info(self) -> dict:
+        """前缀树统计信息"""
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "nodes": len(self._paths),
+            }
+
+
+path_trie = PathTrie()
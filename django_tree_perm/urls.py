@@ -16,7 +16,11 @@ urlpatterns = [
                 path("nodes/<str:pk>/", views.TreeNodeEditView.as_view()),
                 path("load/", views.TreeLoadView.as_view()),
                 path("lazyload/", views.TreeLazyLoadView.as_view()),
+                path("export/", views.TreeExportView.as_view()),
+                path("complete/", views.TreeCompleteView.as_view()),
                 path("perm/", views.PermView.as_view()),
+                path("perm/batch/", views.PermBatchView.as_view()),
+                path("perm/users/", views.PermUserView.as_view()),
                 path("users/", views.UserListView.as_view()),
                 path("users/<str:pk>/", views.UserDetailView.as_view()),
                 path("roles/", views.RoleView.as_view()),
@@ -4,15 +4,19 @@
 工具模块
 
 - `TREE_SPLIT_NODE_FLAG` 定义树结点拼接path路径的分隔符
+- `TREE_SPLIT_ID_FLAG` 定义树结点拼接父类结点ID的分隔符
 - `SAFE_METHODS` 定义接口只读权限的 method
 
 """
+import json
 import typing
-import bisect
+import itertools
 
 
 # 结点层级分隔符
 TREE_SPLIT_NODE_FLAG = "."
+# 父类结点ID分隔符
+TREE_SPLIT_ID_FLAG = ","
 
 # 接口读方法
 SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
@@ -35,7 +39,7 @@ def get_tree_paths(paths: typing.Union[str, typing.List[str]]) -> typing.List[st
     if isinstance(paths, str):
         paths = [paths]
 
-    results: typing.List[str] = []
+    results: typing.Set[str] = set()
     for _path in paths:
         path = None
         for name in _path.split(TREE_SPLIT_NODE_FLAG):
@@ -43,10 +47,8 @@ def get_tree_paths(paths: typing.Union[str, typing.List[str]]) -> typing.List[st
                 path = name
             else:
                 path = TREE_SPLIT_NODE_FLAG.join([path, name])
-            if path not in results:
-                # 不存在则按顺序插入数组中
-                bisect.insort_right(results, path)
-    return results
+            results.add(path)
+    return sorted(results)
 
 
 def get_path_parent(path: str) -> str:
@@ -64,3 +66,72 @@ def get_path_parent(path: str) -> str:
     if len(info) <= 1:
         return ""
     return TREE_SPLIT_NODE_FLAG.join(info[:-1])
+
+
+def join_ancestor_ids(ancestor_ids: str, node_id: int) -> str:
+    """在结点的父类结点ID之后追加结点自身ID，即其子结点的父类结点ID
+
+    每个ID之后都带有分隔符，子树中所有结点的父类结点ID都以该值作为前缀，例如 "1,3," 和 7 返回 "1,3,7,"
+
+    Args:
+        ancestor_ids: 结点的父类结点ID
+        node_id: 结点ID
+
+    Returns:
+        子结点的父类结点ID
+    """
+    return f"{ancestor_ids}{node_id}{TREE_SPLIT_ID_FLAG}"
+
+
+def split_ancestor_ids(ancestor_ids: str) -> typing.List[int]:
+    """解析父类结点ID，例如 "1,3,7," 返回 [1, 3, 7]
+
+    Args:
+        ancestor_ids: 父类结点ID
+
+    Returns:
+        由根结点开始的父类结点ID列表
+    """
+    return [int(value) for value in ancestor_ids.split(TREE_SPLIT_ID_FLAG) if value]
+
+
+def chunked(iterable: typing.Iterable, size: int) -> typing.Iterator[list]:
+    """将可迭代对象按照固定大小分批
+
+    Args:
+        iterable: 可迭代对象
+        size: 每批数据的数量
+
+    Returns:
+        每次返回一批数据的迭代器
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_ndjson(fp: typing.Iterable[typing.Union[str, bytes]]) -> typing.Iterator[dict]:
+    """逐行解析NDJSON(每行一个JSON对象)，忽略空行
+
+    Args:
+        fp: 文件对象或者按行的可迭代对象
+
+    Raises:
+        ValueError: 行内容不是合法的JSON对象
+
+    Returns:
+        每次返回一行数据的迭代器
+    """
+    for lineno, line in enumerate(fp, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON at line {lineno}: {e}")
+        if not isinstance(record, dict):
+            raise ValueError(f"Invalid JSON at line {lineno}: expect an object")
+        yield record
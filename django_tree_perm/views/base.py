@@ -2,22 +2,96 @@
 # coding=utf-8
 import typing
 import json
+import datetime
+import hashlib
 import functools
 from http import HTTPStatus
 
 from django.db import models
 from django.views import View
-from django.http import JsonResponse, HttpRequest
+from django.http import JsonResponse, HttpRequest, HttpResponse
 from django.core.paginator import Paginator
 from django.core.exceptions import ValidationError
+from django.utils.http import urlencode, http_date, quote_etag
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import classonlymethod
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import AbstractUser
 
 from django_tree_perm import exceptions
+from django_tree_perm.cache import tree_response_cache
 from django_tree_perm.models.utils import user_to_json
 
 
+def cached_response(request: HttpRequest, render: typing.Callable[[], HttpResponse]) -> HttpResponse:
+    """按照请求路径和参数缓存编码后的响应内容，不区分用户；结点变更后失效
+
+    Args:
+        request: 请求
+        render: 渲染响应的方法
+
+    Returns:
+        HttpResponse
+    """
+    if not tree_response_cache.enabled:
+        return render()
+
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    key = hashlib.md5(f"{request.path}?{query}".encode("utf-8")).hexdigest()
+
+    def load() -> tuple:
+        response = render()
+        return response.status_code, response["Content-Type"], response.content
+
+    status, content_type, content = tree_response_cache.get_or_render(key, load)
+    return HttpResponse(content, status=status, content_type=content_type)
+
+
+def aggregate_validators(queryset: models.QuerySet, fields: typing.Sequence[str]) -> dict:
+    """聚合查询结果的数量、主键之和以及时间字段的最大值，用于判断数据是否变更
+
+    Args:
+        queryset: 查询结果
+        fields: 取最大值的时间字段，可以是关联字段
+
+    Returns:
+        聚合结果
+    """
+    aggregates = {"count": models.Count("pk"), "checksum": models.Sum("pk")}
+    aggregates.update({field: models.Max(field) for field in fields})
+    return queryset.order_by().aggregate(**aggregates)
+
+
+def conditional_response(
+    request: HttpRequest, validators: typing.List[dict], render: typing.Callable[[], HttpResponse]
+) -> HttpResponse:
+    """处理条件请求，`If-None-Match` 与校验值一致时返回304，不再渲染响应内容
+
+    - ETag 由请求路径和参数、校验值计算；
+    - Last-Modified 取校验值中时间的最大值，删除数据时不会变化，所以只返回不用于判断；
+
+    Args:
+        request: 请求
+        validators: 校验值，见 `aggregate_validators`
+        render: 渲染响应的方法
+
+    Returns:
+        HttpResponse
+    """
+    values = [request.get_full_path()] + [sorted(item.items()) for item in validators]
+    etag = quote_etag(hashlib.md5(json.dumps(values, default=str).encode("utf-8")).hexdigest())
+    times = [value for item in validators for value in item.values() if isinstance(value, datetime.datetime)]
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = render()
+    if response.status_code in (HTTPStatus.OK, HTTPStatus.NOT_MODIFIED):
+        response["ETag"] = etag
+        if times:
+            response["Last-Modified"] = http_date(max(times).timestamp())
+    return response
+
+
 class BaseView(View):
 
     @classmethod
@@ -87,6 +161,8 @@ class BaseListModelMixin(BaseModelView):
     search_fields: list = []
     filter_fields: list = []
     ordering: list = ["id"]
+    # 条件请求校验值取最大值的时间字段，可以是关联字段；为空时不支持条件请求
+    conditional_fields: list = []
 
     def get_queryset(self, request: HttpRequest, **kwargs: typing.Any) -> models.QuerySet:
         return self.model.objects.all().order_by(*self.ordering)
@@ -118,9 +194,18 @@ class BaseListModelMixin(BaseModelView):
 
         return queryset
 
-    def get(self, request: HttpRequest, *args: typing.Any, **kwargs: typing.Any) -> JsonResponse:
+    def get_validators(self, request: HttpRequest, queryset: models.QuerySet) -> typing.List[dict]:
+        """条件请求的校验值，默认按照 `conditional_fields` 聚合列表查询结果"""
+        return [aggregate_validators(queryset, self.conditional_fields)]
+
+    def get(self, request: HttpRequest, *args: typing.Any, **kwargs: typing.Any) -> HttpResponse:
         queryset = self.filter_queryset(request, **kwargs)
+        if not self.conditional_fields:
+            return self.list(request, queryset)
+        validators = self.get_validators(request, queryset)
+        return conditional_response(request, validators, lambda: self.list(request, queryset))
 
+    def list(self, request: HttpRequest, queryset: models.QuerySet) -> JsonResponse:
         count = queryset.count()
         # 分页返回
         page = int(request.GET.get("page", 1))
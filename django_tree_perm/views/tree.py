@@ -4,14 +4,18 @@ import typing
 from http import HTTPStatus
 
 from django.db import models
-from django.http import JsonResponse, HttpRequest, HttpResponse
+from django.http import JsonResponse, HttpRequest, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.contrib.auth import login, authenticate
 
 from django_tree_perm.models import User, TreeNode, Role, NodeRole
 from django_tree_perm.models.utils import user_to_json
-from django_tree_perm.controller import TreeNodeManger, PermManager
+from django_tree_perm.controller import TreeNodeManger, PermManager, PermResolver
+from django_tree_perm import settings
 from django_tree_perm import exceptions
+from django_tree_perm.cache import change_generations
+from django_tree_perm.trie import path_trie
+from django_tree_perm.middleware import get_perm_resolver
 
 from .base import (
     BaseView,
@@ -22,6 +26,9 @@ from .base import (
     BaseRetrieveModelMixin,
     BaseUpdateModelMixin,
     BaseDestoryModelMixin,
+    cached_response,
+    conditional_response,
+    aggregate_validators,
 )
 
 
@@ -43,12 +50,14 @@ class PermView(BaseView):
             roles = roles.split(",")
 
         data = user_to_json(user)
+        # 登录后用户会变化，不使用 request.tree_perm
+        resolver = PermResolver(user)
         # 是否具备树和角色的管理权限
-        data["tree_manager"] = PermManager.has_tree_perm(user)
+        data["tree_manager"] = resolver.has_tree_perm()
         # 是否具备结点管理权限
-        data["node_manager"] = PermManager.has_node_perm(user, path=path, key_name=key_name, can_manage=True)
+        data["node_manager"] = resolver.has_node_perm(path=path, key_name=key_name, can_manage=True)
         # 是否有该结点角色权限
-        data["node_perm"] = PermManager.has_node_perm(user, path=path, key_name=key_name, roles=roles)
+        data["node_perm"] = resolver.has_node_perm(path=path, key_name=key_name, roles=roles)
         return data
 
     def get(self, request: HttpRequest, *args: typing.Any, **kwargs: typing.Any) -> JsonResponse:
@@ -73,6 +82,52 @@ class PermView(BaseView):
         return JsonResponse({"error": "Wrong username or password."}, status=HTTPStatus.BAD_REQUEST)
 
 
+class PermBatchView(BasePermissionView):
+
+    @classmethod
+    def parse_list_value(cls, request: HttpRequest, data: dict, field: str) -> typing.List[str]:
+        """列表参数支持传递数组或者逗号分隔的字符串"""
+        if request.content_type == "multipart/form-data":
+            values = request.POST.getlist(field)
+            if len(values) == 1:
+                values = values[0]
+        else:
+            values = data.get(field) or []
+        if isinstance(values, str):
+            values = values.split(",")
+        return [value for value in values if value]
+
+    def post(self, request: HttpRequest, *args: typing.Any, **kwargs: typing.Any) -> JsonResponse:
+        """批量判断当前登录用户是否有结点权限"""
+        data = self.parese_request_body(request)
+        key_names = self.parse_list_value(request, data, "key_names")
+        paths = self.parse_list_value(request, data, "paths")
+        if not key_names and not paths:
+            raise exceptions.ParamsValidateException("key_names or paths cannot be empty.")
+        roles = self.parse_list_value(request, data, "roles")
+        can_manage = str(data.get("can_manage", "")).lower() in ("1", "true")
+
+        results = PermManager.has_node_perms(
+            request.user, paths=paths, key_names=key_names, roles=roles, can_manage=can_manage
+        )
+        return JsonResponse({"results": results}, status=HTTPStatus.OK)
+
+
+class PermUserView(BasePermissionView):
+
+    def get(self, request: HttpRequest, *args: typing.Any, **kwargs: typing.Any) -> JsonResponse:
+        """反查有结点权限的用户"""
+        key_names = [value for value in request.GET.get("key_names", "").split(",") if value]
+        paths = [value for value in request.GET.get("paths", "").split(",") if value]
+        if not key_names and not paths:
+            raise exceptions.ParamsValidateException("key_names or paths cannot be empty.")
+        roles = [value for value in request.GET.get("roles", "").split(",") if value]
+        can_manage = request.GET.get("can_manage", "").lower() in ("1", "true")
+
+        results = PermManager.users_with_perm(paths=paths, key_names=key_names, roles=roles, can_manage=can_manage)
+        return JsonResponse({"results": results}, status=HTTPStatus.OK)
+
+
 class TreeNodeView(BaseListModelMixin):
 
     model = TreeNode
@@ -90,6 +145,7 @@ class TreeNodeView(BaseListModelMixin):
         "description__icontains",
     ]
     ordering = ["path"]
+    conditional_fields = ["updated_at"]
 
     def filter_by_search(self, request: HttpRequest, queryset: models.QuerySet) -> models.QuerySet:
         search = request.GET.get("search", None)
@@ -159,28 +215,51 @@ class TreeNodeEditView(BaseRetrieveModelMixin):
         return JsonResponse(data, status=HTTPStatus.NO_CONTENT)
 
 
-class TreeLazyLoadView(BasePermissionView):
+def get_tree_validators() -> typing.List[dict]:
+    """树结构接口条件请求的校验值，使用结点变更的版本号，不查询数据库"""
+    return [change_generations.get_validators([change_generations.TREE])]
 
-    def get(self, request: HttpRequest, *args: typing.Any, **kwargs: typing.Any) -> JsonResponse:
-        parent_id = request.GET.get("parent_id", None)
-        parent_path = request.GET.get("parent_path", None)
 
-        queryset = TreeNode.objects.filter(disabled=False)
-        if parent_id:
-            queryset = queryset.filter(parent_id=parent_id)
-        elif parent_path:
-            queryset = queryset.filter(parent__path=parent_path)
-        else:
-            # 若是不传递则返回根结点
-            queryset = queryset.filter(depth=1)
+class TreeLazyLoadView(BasePermissionView):
+    # 一次最多加载的层级数
+    max_levels = 5
+    # 每个结点最多返回的子结点个数
+    max_page_size = 5000
+
+    def get(self, request: HttpRequest, *args: typing.Any, **kwargs: typing.Any) -> HttpResponse:
+        return conditional_response(
+            request, get_tree_validators(), lambda: cached_response(request, lambda: self.build_response(request))
+        )
 
-        count = queryset.count()
-        results = [node.to_json(partial=True) for node in queryset]
-        return JsonResponse({"count": count, "results": results}, status=HTTPStatus.OK)
+    def build_response(self, request: HttpRequest) -> JsonResponse:
+        try:
+            levels = int(request.GET.get("levels", 1))
+            page = int(request.GET.get("page", 1))
+            page_size = int(request.GET.get("page_size", 1000))
+        except ValueError as e:
+            raise exceptions.ParamsValidateException(f"levels/page/page_size must be integer: {e}")
+        if not 1 <= levels <= self.max_levels or page < 1 or not 1 <= page_size <= self.max_page_size:
+            raise exceptions.ParamsValidateException(
+                f"Require 1 <= levels <= {self.max_levels}, page >= 1 and 1 <= page_size <= {self.max_page_size}."
+            )
+
+        data = TreeNodeManger.load_children(
+            parent_id=request.GET.get("parent_id", None),
+            parent_path=request.GET.get("parent_path", None),
+            levels=levels,
+            page=page,
+            page_size=page_size,
+        )
+        return JsonResponse(data, status=HTTPStatus.OK)
 
 
 class TreeLoadView(BasePermissionView):
-    def get(self, request: HttpRequest, *args: typing.Any, **kwargs: typing.Any) -> JsonResponse:
+    def get(self, request: HttpRequest, *args: typing.Any, **kwargs: typing.Any) -> HttpResponse:
+        return conditional_response(
+            request, get_tree_validators(), lambda: cached_response(request, lambda: self.build_response(request))
+        )
+
+    def build_response(self, request: HttpRequest) -> JsonResponse:
         search = request.GET.get("search", None)
         path = request.GET.get("path", None)
         depth = request.GET.get("depth", None)
@@ -200,6 +279,38 @@ class TreeLoadView(BasePermissionView):
         return JsonResponse({"count": count, "results": data}, status=HTTPStatus.OK)
 
 
+class TreeCompleteView(BasePermissionView):
+    # 一次最多返回的结点个数
+    max_limit = 100
+
+    def get(self, request: HttpRequest, *args: typing.Any, **kwargs: typing.Any) -> JsonResponse:
+        prefix = request.GET.get("prefix", "")
+        try:
+            limit = int(request.GET.get("limit", settings.TREE_PERM_COMPLETE_LIMIT))
+        except ValueError as e:
+            raise exceptions.ParamsValidateException(f"limit must be integer: {e}")
+        if not 1 <= limit <= self.max_limit:
+            raise exceptions.ParamsValidateException(f"Require 1 <= limit <= {self.max_limit}.")
+
+        predicate = None
+        if request.GET.get("perm", "").lower() in ("1", "true"):
+            # 仅返回当前用户可见的结点
+            resolver = get_perm_resolver(request)
+            roles = [value for value in request.GET.get("roles", "").split(",") if value] or None
+            if not resolver.has_tree_perm():
+                predicate = lambda entry: resolver.is_visible(entry.path, roles=roles)  # noqa: E731
+
+        data = path_trie.complete(prefix, limit=limit, predicate=predicate)
+        return JsonResponse(data, status=HTTPStatus.OK)
+
+
+class TreeExportView(BasePermissionView):
+    def get(self, request: HttpRequest, *args: typing.Any, **kwargs: typing.Any) -> StreamingHttpResponse:
+        path = request.GET.get("path", None)
+        content = TreeNodeManger.iter_json_tree(path=path)
+        return StreamingHttpResponse(content, content_type="application/json", status=HTTPStatus.OK)
+
+
 class UserListView(BaseListModelMixin):
 
     model = User
@@ -237,6 +348,14 @@ class RoleView(BaseCreateModelMixin, BaseListModelMixin):
     ordering = ["-can_manage", "id"]
     disabled_paginator = True
     serializer_class = RoleSerializer
+    conditional_fields = ["updated_at"]
+
+    def get_validators(self, request: HttpRequest, queryset: models.QuerySet) -> typing.List[dict]:
+        validators = super().get_validators(request, queryset)
+        # 传递结点时返回角色关联的用户，结点路径及其父类结点、用户信息变更也会影响返回结果
+        validators.append(aggregate_validators(NodeRole.objects.all(), NodeRoleView.conditional_fields))
+        validators.append(change_generations.get_validators([change_generations.TREE, change_generations.USERS]))
+        return validators
 
     def check_create_permission(self, request: HttpRequest, **kwargs: typing.Any) -> None:
         if not PermManager.has_tree_perm(request.user):
@@ -296,11 +415,18 @@ class NodeRoleView(BaseCreateModelMixin, BaseListModelMixin):
         "user__username__in",
     ]
     search_fields = ["node__path"]
+    conditional_fields = ["created_at", "node__updated_at", "role__updated_at"]
 
     def get_queryset(self, request: HttpRequest, **kwargs: typing.Any) -> models.QuerySet:
         queryset = super().get_queryset(request, **kwargs)
         return queryset.select_related("node", "user", "role")
 
+    def get_validators(self, request: HttpRequest, queryset: models.QuerySet) -> typing.List[dict]:
+        validators = super().get_validators(request, queryset)
+        # 返回结果包含结点路径和用户信息
+        validators.append(change_generations.get_validators([change_generations.TREE, change_generations.USERS]))
+        return validators
+
     def filter_queryset(self, request: HttpRequest, **kwargs: typing.Any) -> models.QuerySet:
         queryset = super().filter_queryset(request, **kwargs)
         key_names = request.GET.get("key_names", None)
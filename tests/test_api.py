@@ -4,11 +4,13 @@ import pytest
 
 from http import HTTPStatus
 from django.test import Client
+from django.contrib.auth.models import update_last_login
 
 
 from django_tree_perm.models import TreeNode, NodeRole, Role
-from django_tree_perm.controller import PermManager
+from django_tree_perm.controller import PermManager, TreeNodeManger
 from django_tree_perm.views import base as base_v
+from django_tree_perm.views import tree as tree_v
 
 
 def test_main_view(client):
@@ -71,6 +73,48 @@ def test_perm_params(employee_client, employee_user, key_node, admin_role, dev_r
     assert data["node_perm"] is True
 
 
+@pytest.mark.django_db()
+def test_perm_batch(employee_client, employee_user, dept_node, key_node, sys_node, dev_role):
+    data = {"paths": [dept_node.path, sys_node.path]}
+    resp = Client().post("/tree/perm/batch/", data=data, content_type="application/json")
+    assert resp.status_code == HTTPStatus.FORBIDDEN, resp.content
+
+    resp = employee_client.post("/tree/perm/batch/", data={}, content_type="application/json")
+    assert resp.status_code == HTTPStatus.BAD_REQUEST, resp.content
+
+    NodeRole.objects.create(node=dept_node, user=employee_user, role=dev_role)
+    resp = employee_client.post("/tree/perm/batch/", data=data, content_type="application/json")
+    assert resp.status_code == HTTPStatus.OK, resp.content
+    assert resp.json()["results"] == {dept_node.path: True, sys_node.path: False}
+
+    data = {"key_names": key_node.name, "roles": dev_role.name, "can_manage": 1}
+    resp = employee_client.post("/tree/perm/batch/", data=data)
+    assert resp.status_code == HTTPStatus.OK, resp.content
+    assert resp.json()["results"] == {key_node.name: False}
+
+    data = {"key_names": [key_node.name, "not-found"], "roles": [dev_role.name]}
+    resp = employee_client.post("/tree/perm/batch/", data=data)
+    assert resp.status_code == HTTPStatus.OK, resp.content
+    assert resp.json()["results"] == {key_node.name: True, "not-found": False}
+
+
+@pytest.mark.django_db()
+def test_perm_users(employee_client, employee_user, dept_node, key_node, dev_role):
+    resp = employee_client.get("/tree/perm/users/")
+    assert resp.status_code == HTTPStatus.BAD_REQUEST, resp.content
+
+    NodeRole.objects.create(node=dept_node, user=employee_user, role=dev_role)
+    resp = employee_client.get("/tree/perm/users/", data={"key_names": key_node.name, "roles": dev_role.name})
+    assert resp.status_code == HTTPStatus.OK, resp.content
+    data = resp.json()["results"]
+    assert [item["user_id"] for item in data[key_node.name]] == [employee_user.id]
+    assert data[key_node.name][0]["node_id"] == dept_node.id
+
+    resp = employee_client.get("/tree/perm/users/", data={"paths": key_node.path, "can_manage": 1})
+    assert resp.status_code == HTTPStatus.OK, resp.content
+    assert resp.json()["results"] == {key_node.path: []}
+
+
 @pytest.mark.django_db()
 @pytest.mark.parametrize(
     "query_params,count",
@@ -377,3 +421,141 @@ def test_base_view(rf, admin_user, dev_role):
 
     resp = TestRoleEditView.as_view()(request, pk=dev_role.id)
     assert resp.status_code == HTTPStatus.OK, resp.content
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("init_tree")
+def test_tree_export(employee_client, django_assert_num_queries, root_node, dept_node):
+    import json
+    from io import StringIO
+    from django.core.management import call_command
+    from django_tree_perm.controller import TreeNodeManger
+
+    def sort_tree(tree_data):
+        for item in tree_data:
+            sort_tree(item.get("children") or [])
+        return sorted(tree_data, key=lambda item: item["path"])
+
+    # 名称中的"-"排在分隔符"."之前，不影响子结点的归属
+    TreeNodeManger.add_node(name="com-x", parent=None)
+    TreeNodeManger.add_node(name="sub", parent=TreeNode.objects.get(path="com-x"))
+    expect = TreeNodeManger.to_json_tree(TreeNode.objects.filter(disabled=False), trace_to_root=False)
+
+    resp = employee_client.get("/tree/export/")
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.streaming
+    data = json.loads(b"".join(resp.streaming_content))
+    assert sort_tree(data) == sort_tree(expect)
+
+    # 分批读取结果一致，按照二进制排序规则排序
+    with django_assert_num_queries(1) as ctx:
+        assert json.loads("".join(TreeNodeManger.iter_json_tree(chunk_size=2))) == data
+    assert 'COLLATE "BINARY"' in ctx.captured_queries[0]["sql"]
+
+    resp = employee_client.get("/tree/export/", data={"path": dept_node.path})
+    data = json.loads(b"".join(resp.streaming_content))
+    assert len(data) == 1
+    assert data[0]["path"] == dept_node.path
+    assert len(data[0]["children"]) == 6
+    assert json.loads("".join(TreeNodeManger.iter_json_tree(path="not-found"))) == []
+
+    out = StringIO()
+    call_command("export_tree_nodes", "-", path=root_node.path, stdout=out)
+    assert [item["path"] for item in json.loads(out.getvalue())] == [root_node.path]
+
+
+@pytest.mark.django_db()
+def test_tree_validators(django_assert_num_queries, dept_node):
+    # 未开启响应缓存时也使用版本号，不查询数据库
+    with django_assert_num_queries(0):
+        validators = tree_v.get_tree_validators()
+    dept_node.alias = "changed"
+    dept_node.save()
+    assert tree_v.get_tree_validators() != validators
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("init_tree")
+def test_conditional_get(employee_client, employee_user, dept_node, key_node, dev_role):
+    def assert_not_modified(url, data=None):
+        resp = employee_client.get(url, data=data)
+        assert resp.status_code == HTTPStatus.OK
+        assert resp["ETag"]
+        resp = employee_client.get(url, data=data, HTTP_IF_NONE_MATCH=resp["ETag"])
+        assert resp.status_code == HTTPStatus.NOT_MODIFIED
+        assert resp.content == b""
+        return resp["ETag"]
+
+    url = "/tree/nodes/"
+    etag = assert_not_modified(url, {"parent_id": dept_node.id})
+    assert employee_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTPStatus.OK
+    assert employee_client.get(url, {"parent_id": dept_node.id})["Last-Modified"]
+    # 修改、删除结点后数据变更
+    key_node.alias = "changed"
+    key_node.save()
+    etag = assert_not_modified(url, {"parent_id": dept_node.id})
+    TreeNode.objects.filter(parent=dept_node).exclude(id=key_node.id).first().delete()
+    assert assert_not_modified(url, {"parent_id": dept_node.id}) != etag
+
+    # 新增授权后角色关联的用户变更
+    etag = assert_not_modified("/tree/roles/", {"path": dept_node.path})
+    node_role = NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    assert assert_not_modified("/tree/roles/", {"path": dept_node.path}) != etag
+
+    etag = assert_not_modified("/tree/noderoles/")
+    node_role.delete()
+    assert assert_not_modified("/tree/noderoles/") != etag
+
+    etag = assert_not_modified("/tree/load/", {"depth": 2})
+    assert_not_modified("/tree/lazyload/")
+    dept_node.alias = "changed"
+    dept_node.save()
+    assert assert_not_modified("/tree/load/", {"depth": 2}) != etag
+
+    # 父类结点路径、用户信息变更后角色关联的用户变更，登录时间不在返回结果中
+    etag = assert_not_modified("/tree/roles/", {"node_id": key_node.id})
+    TreeNodeManger(node=dept_node).update_attrs(name="renamed")
+    assert assert_not_modified("/tree/roles/", {"node_id": key_node.id}) != etag
+    etag = assert_not_modified("/tree/noderoles/")
+    employee_user.first_name = "changed"
+    employee_user.save()
+    assert assert_not_modified("/tree/noderoles/") != etag
+    etag = assert_not_modified("/tree/noderoles/")
+    update_last_login(None, employee_user)
+    assert assert_not_modified("/tree/noderoles/") == etag
+
+    # 未声明校验字段不支持条件请求
+    assert "ETag" not in employee_client.get("/tree/users/")
+
+
+@pytest.mark.django_db()
+def test_lazy_load_levels(employee_client, django_assert_num_queries, root_node, dept_node):
+    resp = employee_client.get("/tree/lazyload/", data={"parent_id": dept_node.id})
+    data = resp.json()
+    expect = {item["path"]: item for item in data["results"]}
+    for node in TreeNode.objects.filter(parent=dept_node, disabled=False):
+        children_count = node.children.filter(disabled=False).count()
+        assert expect[node.path]["children_count"] == children_count
+        assert expect[node.path]["has_children"] is (children_count > 0)
+
+    # 多层级一次返回，每层一次查询
+    with django_assert_num_queries(3):
+        data = TreeNodeManger.load_children(parent_id=root_node.id, levels=3)
+    dept = [item for item in data["results"] if item["id"] == dept_node.id][0]
+    assert [item["path"] for item in dept["children"]] == [item["path"] for item in resp.json()["results"]]
+    grandchildren = [child for item in dept["children"] for child in item.get("children", [])]
+    assert grandchildren
+    assert all("children" not in item and item["path"].count(".") == 3 for item in grandchildren)
+
+    # 子结点分页
+    resp = employee_client.get("/tree/lazyload/", data={"parent_id": dept_node.id, "page": 2, "page_size": 4})
+    assert resp.json()["count"] == 6
+    assert [item["path"] for item in resp.json()["results"]] == list(expect.keys())[4:]
+    data = TreeNodeManger.load_children(parent_id=root_node.id, levels=2, page_size=2)
+    dept = [item for item in data["results"] if item["id"] == dept_node.id][0]
+    assert len(dept["children"]) == 2
+    assert dept["children_count"] == 6
+
+    for params in ({"levels": 0}, {"levels": "a"}, {"page_size": 100000}):
+        resp = employee_client.get("/tree/lazyload/", data=params)
+        assert resp.status_code == HTTPStatus.BAD_REQUEST
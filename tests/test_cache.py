@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# coding=utf-8
+import time
+import threading
+
+import pytest
+
+from django_tree_perm.cache import (
+    perm_cache,
+    tree_response_cache,
+    LRUCache,
+    PermCache,
+    build_grant_map,
+    match_grants,
+)
+from django_tree_perm.controller import PermManager, TreeNodeManger
+from django_tree_perm.models import NodeRole
+
+
+@pytest.fixture
+def enable_cache(settings):
+    settings.TREE_PERM_CACHE_ENABLED = True
+    perm_cache.grants.clear()
+    perm_cache.nodes.clear()
+    perm_cache.grants.reset_info()
+    perm_cache.nodes.reset_info()
+    yield perm_cache
+    perm_cache.grants.clear()
+    perm_cache.nodes.clear()
+
+
+def test_lru_cache(settings, monkeypatch):
+    settings.TREE_PERM_CACHE_MAXSIZE = 2
+    settings.TREE_PERM_CACHE_TTL = 10
+    cache = LRUCache("TREE_PERM_CACHE_MAXSIZE", "TREE_PERM_CACHE_TTL")
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    # 超出容量淘汰最久未使用的
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.info()["size"] == 2
+    assert cache.info()["hits"] == 2
+    assert cache.info()["misses"] == 1
+
+    # 过期
+    now = time.monotonic()
+    monkeypatch.setattr("django_tree_perm.cache.time.monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+
+    settings.TREE_PERM_CACHE_MAXSIZE = 0
+    cache.set("d", 4)
+    assert cache.get("d") is None
+
+
+def test_match_grants():
+    grant_map = build_grant_map([("a.b", "dev", False), ("a.b", "admin", True), ("c", "dev", False)])
+    assert match_grants(grant_map, "") is False
+    assert match_grants({}, "a.b") is False
+    assert match_grants(grant_map, "a") is False
+    assert match_grants(grant_map, "a.b.c") is True
+    assert match_grants(grant_map, "a.bc") is False
+    assert match_grants(grant_map, "a.b.c", can_manage=True) is True
+    assert match_grants(grant_map, "c.d", can_manage=True) is False
+    assert match_grants(grant_map, "c.d", roles=["admin"]) is False
+    assert match_grants(grant_map, "c.d", roles=["dev"]) is True
+
+
+@pytest.mark.django_db()
+def test_cached_node_perm(
+    enable_cache, django_assert_num_queries, employee_user, dept_node, key_node, dev_role, admin_role, not_found_path
+):
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+
+    assert PermManager.has_node_perm(employee_user, key_name=key_node.name) is True
+    # 命中缓存不再查询数据库
+    with django_assert_num_queries(0):
+        assert PermManager.has_node_perm(employee_user, key_name=key_node.name) is True
+        assert PermManager.has_node_perm(employee_user, key_name=key_node.name, can_manage=True) is False
+        assert PermManager.has_node_perm(employee_user, key_name=key_node.name, roles=[admin_role.name]) is False
+    assert enable_cache.info()["grants"]["hits"] >= 3
+    # 批量判断也使用缓存的授权
+    with django_assert_num_queries(1):
+        assert PermManager.has_node_perms(employee_user, key_names=[key_node.name]) == {key_node.name: True}
+
+    assert PermManager.has_node_perm(employee_user) is False
+    assert PermManager.has_node_perm(employee_user, path=not_found_path) is False
+
+    # 新增授权后缓存失效
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=admin_role)
+    assert PermManager.has_node_perm(employee_user, path=key_node.path, can_manage=True) is True
+
+    # 角色变更后缓存失效
+    admin_role.can_manage = False
+    admin_role.save()
+    assert PermManager.has_node_perm(employee_user, path=key_node.path, can_manage=True) is False
+
+    # 结点被删除后缓存失效
+    TreeNodeManger(node=key_node).remove()
+    assert PermManager.has_node_perm(employee_user, key_name=key_node.name) is False
+
+
+@pytest.fixture
+def enable_shared_cache(settings):
+    settings.TREE_PERM_SHARED_CACHE_ENABLED = True
+    perm_cache.shared.cache.clear()
+    perm_cache.shared.reset_info()
+    yield perm_cache
+    perm_cache.shared.cache.clear()
+
+
+def test_shared_cache_generation(enable_shared_cache, monkeypatch):
+    shared = enable_shared_cache.shared
+    shared.set("grants", "1", {"a": ()})
+    assert shared.get("grants", "1") == {"a": ()}
+    generation = shared.get_generation("grants")
+    shared.bump_generation("grants")
+    assert shared.get_generation("grants") == generation + 1
+    assert shared.get("grants", "1") is None
+    # 版本号丢失后重新初始化，不会与之前的版本号重复
+    shared.cache.delete(shared._generation_key("grants"))
+    now = time.time()
+    monkeypatch.setattr("django_tree_perm.cache.time.time", lambda: now + 1)
+    shared.bump_generation("grants")
+    assert shared.get_generation("grants") > generation + 1
+    assert shared.info()["hits"] == 1
+
+
+@pytest.mark.django_db()
+def test_shared_and_local_cache(enable_cache, enable_shared_cache, employee_user, dept_node, dev_role, admin_role):
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    # 模拟另一个进程，与当前进程共用共享缓存
+    other = PermCache()
+    assert other.get_user_grants(employee_user.id) == perm_cache.get_user_grants(employee_user.id)
+    assert other.grants.info()["size"] == 1
+
+    # 当前进程失效用户授权后，另一个进程不再读取进程内的旧数据
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=admin_role)
+    roles = {role_name for role_name, _ in other.get_user_grants(employee_user.id)[dept_node.path]}
+    assert roles == {dev_role.name, admin_role.name}
+    perm_cache.invalidate_grants()
+    NodeRole.objects.filter(role=admin_role).delete()
+    assert list(other.get_user_grants(employee_user.id)[dept_node.path]) == [(dev_role.name, False)]
+
+    # 加载期间缓存失效时，加载的旧数据不会被之后的请求读取
+    def load_stale():
+        perm_cache.invalidate_user(employee_user.id)
+        return "stale"
+
+    user_id = employee_user.id
+    scopes = [f"grants:{user_id}"]
+    perm_cache.invalidate_user(user_id)
+    assert other._get_or_load(other.grants, user_id, "grants", str(user_id), load_stale, scopes=scopes) == "stale"
+    assert other._get_or_load(other.grants, user_id, "grants", str(user_id), lambda: "new", scopes=scopes) == "new"
+
+
+@pytest.mark.django_db()
+def test_shared_cached_node_perm(
+    enable_shared_cache, django_assert_num_queries, employee_user, dept_node, key_node, dev_role, admin_role
+):
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+
+    assert PermManager.has_node_perm(employee_user, key_name=key_node.name) is True
+    # 命中共享缓存不再查询数据库，进程内缓存未开启
+    with django_assert_num_queries(0):
+        assert PermManager.has_node_perm(employee_user, key_name=key_node.name) is True
+        assert PermManager.has_node_perm(employee_user, key_name=key_node.name, can_manage=True) is False
+    assert perm_cache.grants.info()["size"] == 0
+    assert enable_shared_cache.info()["shared"]["hits"] >= 4
+
+    # 新增授权后缓存失效
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=admin_role)
+    assert PermManager.has_node_perm(employee_user, path=key_node.path, can_manage=True) is True
+
+    # 角色变更后缓存失效
+    admin_role.can_manage = False
+    admin_role.save()
+    assert PermManager.has_node_perm(employee_user, path=key_node.path, can_manage=True) is False
+
+    # 结点被删除后缓存失效
+    TreeNodeManger(node=key_node).remove()
+    assert PermManager.has_node_perm(employee_user, key_name=key_node.name) is False
+
+
+@pytest.fixture
+def enable_response_cache(settings):
+    settings.TREE_PERM_RESPONSE_CACHE_ENABLED = True
+    tree_response_cache.cache.clear()
+    tree_response_cache.reset_info()
+    yield tree_response_cache
+    tree_response_cache.cache.clear()
+
+
+def test_response_cache_single_flight(enable_response_cache):
+    calls = []
+    started = threading.Event()
+
+    def render():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return b"tree"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(tree_response_cache.get_or_render("k", render)))]
+    threads[0].start()
+    started.wait()
+    threads += [
+        threading.Thread(target=lambda: results.append(tree_response_cache.get_or_render("k", render)))
+        for _ in range(4)
+    ]
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join()
+    # 并发未命中只渲染一次
+    assert results == [b"tree"] * 5
+    assert len(calls) == 1
+
+    # 其他进程正在渲染时等待渲染结果
+    key = tree_response_cache.make_key(tree_response_cache.namespace, "other")
+    tree_response_cache.cache.add(f"{key}:lock", 1)
+    timer = threading.Timer(0.1, lambda: tree_response_cache.cache.set(key, b"other"))
+    timer.start()
+    assert tree_response_cache.get_or_render("other", render) == b"other"
+    assert len(calls) == 1
+
+    tree_response_cache.bump_generation(tree_response_cache.namespace)
+    assert tree_response_cache.get_or_render("k", lambda: b"new") == b"new"
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("init_tree")
+def test_cached_tree_response(enable_response_cache, django_assert_num_queries, employee_client, dept_node):
+    resp = employee_client.get("/tree/load/", data={"depth": 2, "search": "dept"})
+    assert resp.status_code == 200
+    data = resp.json()
+    # 命中缓存只查询登录用户，参数顺序不影响缓存
+    with django_assert_num_queries(2):
+        resp = employee_client.get("/tree/load/?search=dept&depth=2")
+    assert resp.json() == data
+    assert resp["Content-Type"] == "application/json"
+
+    resp = employee_client.get("/tree/lazyload/", data={"parent_id": dept_node.id})
+    count = resp.json()["count"]
+    TreeNodeManger.add_node(name="new-child", parent=dept_node)
+    resp = employee_client.get("/tree/lazyload/", data={"parent_id": dept_node.id})
+    assert resp.json()["count"] == count + 1
+    assert enable_response_cache.info()["hits"] == 1
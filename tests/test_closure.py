@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# coding=utf-8
+import pytest
+
+from django.core.management import call_command, CommandError
+
+from django_tree_perm import closure
+from django_tree_perm.utils import get_tree_paths
+from django_tree_perm.controller import PermManager, TreeNodeManger
+from django_tree_perm.models import TreeNode, NodeRole, TreeNodeClosure
+
+
+@pytest.fixture
+def enable_closure(settings):
+    settings.TREE_PERM_CLOSURE_ENABLED = True
+    closure.rebuild()
+
+
+def assert_consistent():
+    assert closure.check() == {"missing": [], "extra": []}
+
+
+def get_ancestor_ids(node):
+    return set(TreeNodeClosure.objects.filter(descendant_id=node.id).values_list("ancestor_id", flat=True))
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("enable_closure")
+def test_closure_sync(root_node, dept_node, key_node, no_child_node, sys_node):
+    assert_consistent()
+    assert get_ancestor_ids(key_node) == set(
+        TreeNode.objects.filter(path__in=get_tree_paths(key_node.path)).values_list("id", flat=True)
+    )
+
+    # 新增结点
+    manager = TreeNodeManger.add_node("new-child", parent=no_child_node)
+    assert TreeNodeClosure.objects.get(ancestor=dept_node, descendant=manager.node).distance == 3
+    assert_consistent()
+
+    # 批量导入
+    data = [{"name": root_node.name, "children": [{"name": "imported", "children": [{"name": "imported-child"}]}]}]
+    assert TreeNodeManger.import_tree_data(data)["created"] == 2
+    assert_consistent()
+    records = [{"path": f"{sys_node.path}.streamed"}, {"path": f"{sys_node.path}.streamed.child"}]
+    assert TreeNodeManger.import_tree_records(records, chunk_size=1)["created"] == 2
+    assert_consistent()
+
+    # 移动子树
+    TreeNodeManger(node=key_node.parent).move_path(parent=sys_node)
+    assert sys_node.id in get_ancestor_ids(key_node)
+    assert dept_node.id not in get_ancestor_ids(key_node)
+    assert_consistent()
+    TreeNodeManger(node=key_node.parent).move_path(parent_id=dept_node.id)
+    assert_consistent()
+
+    # 禁用key结点后清除关系，恢复后重新写入
+    parent_path = key_node.parent.path
+    TreeNodeManger(node=key_node).remove()
+    assert not get_ancestor_ids(key_node)
+    assert_consistent()
+    TreeNodeManger(node=key_node).move_path(parent_path=parent_path)
+    assert dept_node.id in get_ancestor_ids(key_node)
+    assert_consistent()
+
+    # 删除结点
+    TreeNodeManger(node=manager.node).remove()
+    assert_consistent()
+    TreeNodeManger(path=f"{root_node.path}.imported").remove_in_chunks(chunk_size=1)
+    assert_consistent()
+    TreeNodeManger(node=dept_node).remove(clear_chidren=True)
+    assert not TreeNodeClosure.objects.filter(descendant__disabled=True).exists()
+    assert_consistent()
+
+
+@pytest.mark.django_db()
+def test_closure_perm_query(
+    settings, django_assert_num_queries, employee_user, dept_node, key_node, sys_node, dev_role, admin_role
+):
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    NodeRole.objects.create(user=employee_user, node=sys_node, role=admin_role)
+    # 未开启时不维护
+    assert not TreeNodeClosure.objects.exists()
+    with pytest.raises(CommandError, match="inconsistent"):
+        call_command("rebuild_tree_closure", "--check")
+
+    def query_results():
+        return (
+            PermManager.has_node_perm(employee_user, key_name=key_node.name),
+            PermManager.has_node_perm(employee_user, path=key_node.path, can_manage=True),
+            PermManager.has_node_perm(employee_user, path=sys_node.path, can_manage=True),
+            PermManager.has_node_perm(employee_user, path=key_node.parent.path, roles=[admin_role.name]),
+            set(TreeNode.objects.filter_by_perm(employee_user.id).values_list("id", flat=True)),
+            set(
+                TreeNode.objects.filter_by_perm(employee_user.id, roles=[admin_role.name]).values_list("id", flat=True)
+            ),
+            dev_role.to_json(path=key_node.path)["user_set"],
+            admin_role.to_json(path=key_node.path)["user_set"],
+        )
+
+    expect = query_results()
+    assert expect[:4] == (True, False, True, False)
+
+    settings.TREE_PERM_CLOSURE_ENABLED = True
+    call_command("rebuild_tree_closure")
+    call_command("rebuild_tree_closure", "--check")
+    assert query_results() == expect
+    with django_assert_num_queries(1):
+        assert PermManager.has_node_perm(employee_user, key_name=key_node.name) is True
+    assert PermManager.has_node_perm(employee_user, path="not.found") is False
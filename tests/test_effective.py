@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# coding=utf-8
+import pytest
+
+from django.core.management import call_command, CommandError
+
+from django_tree_perm import effective
+from django_tree_perm.controller import PermManager, TreeNodeManger
+from django_tree_perm.models import TreeNode, NodeRole, EffectivePerm
+
+
+@pytest.fixture
+def enable_effective(settings):
+    settings.TREE_PERM_EFFECTIVE_ENABLED = True
+
+
+def assert_consistent():
+    assert effective.check() == {"missing": [], "extra": []}
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("enable_effective")
+def test_effective_sync(employee_user, root_node, dept_node, key_node, sys_node, dev_role, admin_role):
+    key_count = dept_node.get_self_and_children().filter(is_key=True).count()
+    node_role = NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    assert EffectivePerm.objects.filter(node_role=node_role).count() == key_count
+    NodeRole.objects.create(user=employee_user, node=key_node, role=admin_role)
+    assert_consistent()
+
+    # 新增key结点继承父类结点的授权
+    manager = TreeNodeManger.add_node("new-key", parent_path=key_node.parent.path, is_key=True)
+    assert EffectivePerm.objects.filter(node=manager.node, user=employee_user).exists()
+    assert_consistent()
+    # 批量导入的key结点继承父类结点的授权
+    data = [
+        {
+            "name": root_node.name,
+            "children": [{"name": dept_node.name, "children": [{"name": "imported-key", "is_key": True}]}],
+        }
+    ]
+    assert TreeNodeManger.import_tree_data(data)["created"] == 1
+    assert EffectivePerm.objects.filter(node__name="imported-key", user=employee_user).exists()
+    assert_consistent()
+
+    # 移动结点
+    TreeNodeManger(node=key_node.parent).move_path(parent=sys_node)
+    assert not EffectivePerm.objects.filter(node=manager.node).exists()
+    assert EffectivePerm.objects.filter(node=key_node, role=admin_role).exists()
+    assert_consistent()
+    TreeNodeManger(path=f"{sys_node.path}.{key_node.parent.name}").move_path(parent=dept_node)
+    assert_consistent()
+
+    # 删除授权
+    node_role.delete()
+    assert not EffectivePerm.objects.filter(node_role_id=node_role.id).exists()
+    assert_consistent()
+
+    # 删除结点
+    NodeRole.objects.create(user=employee_user, node=root_node, role=dev_role)
+    TreeNodeManger(node=manager.node).remove()
+    assert not EffectivePerm.objects.filter(node=manager.node).exists()
+    assert_consistent()
+    TreeNodeManger(path=dept_node.path).remove(clear_chidren=True)
+    assert not EffectivePerm.objects.filter(node__disabled=True).exists()
+    assert_consistent()
+
+
+@pytest.mark.django_db()
+def test_effective_perm_query(
+    settings, django_assert_num_queries, employee_user, dept_node, key_node, dev_role, admin_role
+):
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    # 未开启时不维护
+    assert not EffectivePerm.objects.exists()
+    with pytest.raises(CommandError, match="inconsistent"):
+        call_command("check_effective_perms")
+
+    settings.TREE_PERM_EFFECTIVE_ENABLED = True
+    call_command("rebuild_effective_perms")
+    call_command("check_effective_perms")
+
+    with django_assert_num_queries(1):
+        assert PermManager.has_node_perm(employee_user, key_name=key_node.name) is True
+    assert PermManager.has_node_perm(employee_user, key_name=key_node.name, roles=[admin_role.name]) is False
+    assert PermManager.has_node_perm(employee_user, key_name=key_node.name, can_manage=True) is False
+    with django_assert_num_queries(1):
+        results = PermManager.has_node_perms(employee_user, key_names=[key_node.name, "not-found"])
+    assert results == {key_node.name: True, "not-found": False}
+    results = PermManager.has_node_perms(employee_user, key_names=[key_node.name], roles=[admin_role.name])
+    assert results == {key_node.name: False}
+    results = PermManager.has_node_perms(employee_user, key_names=[key_node.name], can_manage=True)
+    assert results == {key_node.name: False}
+
+    expect = set(dept_node.get_self_and_children().filter(is_key=True).values_list("id", flat=True))
+    qs = TreeNode.objects.filter_keys_by_perm(employee_user.id)
+    assert set(qs.values_list("id", flat=True)) == expect
+    assert TreeNode.objects.filter_keys_by_perm(employee_user.id, roles=[admin_role.name]).count() == 0
+
+    settings.TREE_PERM_EFFECTIVE_ENABLED = False
+    qs = TreeNode.objects.filter_keys_by_perm(employee_user.id)
+    assert set(qs.values_list("id", flat=True)) == expect
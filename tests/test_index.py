@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# coding=utf-8
+import time
+import threading
+
+import pytest
+
+from django_tree_perm.controller import PermManager, TreeNodeManger
+from django_tree_perm.index import tree_index
+from django_tree_perm.models import TreeNode, NodeRole
+
+
+@pytest.fixture
+def enable_index(settings):
+    settings.TREE_PERM_INDEX_ENABLED = True
+    tree_index.clear()
+    yield tree_index
+    tree_index.clear()
+
+
+@pytest.mark.django_db()
+def test_tree_index(
+    enable_index, django_assert_num_queries, django_capture_on_commit_callbacks, root_node, dept_node, key_node
+):
+    with django_assert_num_queries(1):
+        assert tree_index.get_by_path(dept_node.path).id == dept_node.id
+        assert tree_index.get_by_key(key_node.name).path == key_node.path
+        assert tree_index.get(root_node.id).depth == 1
+        assert tree_index.get_node_path(key_name=dept_node.name) == ""
+        assert tree_index.get_node_path() == ""
+    assert tree_index.info()["nodes"] == TreeNode.objects.filter(disabled=False).count()
+
+    # 新增结点事务提交后更新
+    with django_capture_on_commit_callbacks(execute=True):
+        node = TreeNodeManger.add_node("new-key", parent=dept_node, is_key=True).node
+    with django_assert_num_queries(0):
+        assert tree_index.get_by_key(node.name).parent_id == dept_node.id
+        assert tree_index.get_by_path(node.path).id == node.id
+
+    # 移动结点重新加载
+    parent = key_node.parent
+    with django_capture_on_commit_callbacks(execute=True):
+        TreeNodeManger(node=parent).move_path(parent=root_node)
+    key_node.refresh_from_db()
+    assert tree_index.get_by_key(key_node.name).path == key_node.path
+    assert tree_index.get_by_path(f"{root_node.path}.{parent.name}").id == parent.id
+
+    # 删除结点
+    with django_capture_on_commit_callbacks(execute=True):
+        TreeNodeManger(node=node).remove()
+    assert tree_index.get_by_key(node.name) is None
+    with django_capture_on_commit_callbacks(execute=True):
+        TreeNodeManger(node=parent).remove(clear_chidren=True)
+    assert tree_index.get_by_key(key_node.name) is None
+    assert tree_index.get(parent.id) is None
+
+
+@pytest.mark.django_db()
+def test_tree_index_ttl(enable_index, settings, monkeypatch, dept_node):
+    settings.TREE_PERM_INDEX_TTL = 10
+    assert tree_index.get_by_path(dept_node.path)
+    TreeNode.objects.filter(id=dept_node.id).update(path="other")
+    assert tree_index.get_by_path(dept_node.path)
+    now = time.monotonic()
+    monkeypatch.setattr("django_tree_perm.index.time.monotonic", lambda: now + 11)
+    assert tree_index.get_by_path(dept_node.path) is None
+
+
+@pytest.mark.django_db()
+def test_tree_index_reload(enable_index, monkeypatch, dept_node, key_node):
+    tree_index.load()
+    seen = []
+    add = tree_index._add.__func__
+
+    def checked_add(self, node):
+        # 重新加载过程中，读取到的仍是加载前完整的索引
+        if self is not tree_index and not seen:
+            seen.append((tree_index.get_by_path(dept_node.path), tree_index.get_by_key(key_node.name)))
+        add(self, node)
+
+    monkeypatch.setattr(type(tree_index), "_add", checked_add)
+    assert tree_index.load() == TreeNode.objects.filter(disabled=False).count()
+    assert seen[0][0].id == dept_node.id
+    assert seen[0][1].id == key_node.id
+
+
+@pytest.mark.django_db()
+def test_tree_index_expired_reload(enable_index, settings, monkeypatch, dept_node, key_node):
+    tree_index.load()
+    built = tree_index._build()
+    started, release = threading.Event(), threading.Event()
+
+    def slow_build():
+        started.set()
+        release.wait(5)
+        return built
+
+    monkeypatch.setattr(tree_index, "_build", slow_build)
+    settings.TREE_PERM_INDEX_TTL = 0
+    thread = threading.Thread(target=tree_index.get, args=(dept_node.id,))
+    thread.start()
+    assert started.wait(5)
+    # 过期后其他线程重新加载期间，不等待加载完成，继续读取旧的索引
+    assert tree_index.get_by_path(dept_node.path).id == dept_node.id
+    # 加载期间的增量更新在新的索引中重放
+    tree_index.apply_delete(key_node.id)
+    settings.TREE_PERM_INDEX_TTL = 300
+    release.set()
+    thread.join(5)
+    assert tree_index.loaded
+    assert tree_index.get(key_node.id) is None
+    assert tree_index.get(dept_node.id).id == dept_node.id
+
+
+@pytest.mark.django_db()
+def test_tree_index_perm(
+    enable_index, django_assert_num_queries, employee_user, dept_node, key_node, dev_role, admin_role, not_found_path
+):
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    tree_index.load()
+
+    with django_assert_num_queries(1):
+        assert PermManager.has_node_perm(employee_user, key_name=key_node.name) is True
+    with django_assert_num_queries(1):
+        assert PermManager.has_node_perm(employee_user, path=key_node.path, roles=[admin_role.name]) is False
+    with django_assert_num_queries(0):
+        assert PermManager.has_node_perm(employee_user, path=not_found_path) is False
+    with django_assert_num_queries(1):
+        results = PermManager.has_node_perms(employee_user, key_names=[key_node.name, "not-found"])
+    assert results == {key_node.name: True, "not-found": False}
+    assert PermManager.has_node_perms(employee_user, paths=[dept_node.path]) == {dept_node.path: True}
+    # 结点从内存索引获取，只查询一次授权
+    with django_assert_num_queries(1):
+        users = PermManager.users_with_perm(key_names=[key_node.name])[key_node.name]
+    assert [item["user_id"] for item in users] == [employee_user.id]
+
+
+@pytest.mark.django_db()
+def test_tree_index_json_tree(enable_index, settings, django_assert_num_queries, dept_node):
+    queryset = TreeNode.objects.filter(path__startswith=dept_node.path_prefix, depth__lte=4)
+    tree_index.load()
+    with django_assert_num_queries(1):
+        data = TreeNodeManger.to_json_tree(queryset)
+    settings.TREE_PERM_INDEX_ENABLED = False
+    assert data == TreeNodeManger.to_json_tree(queryset)
@@ -4,11 +4,12 @@ import pytest
 import json
 
 from django.core.exceptions import ValidationError
+from django.db import connection
 
 from django_tree_perm.models import NodeRole, TreeNode, Role
 from django_tree_perm.models.utils import user_to_json, format_dict_to_json
 from django_tree_perm.models.tree import tree_validator
-from django_tree_perm.models.manager import TreeNodeManager, TreeNodeQuerySet
+from django_tree_perm.models.manager import TreeNodeManager, TreeNodeQuerySet, collapse_paths
 from django_tree_perm.views.tree import RoleSerializer
 from django_tree_perm.utils import TREE_SPLIT_NODE_FLAG
 
@@ -152,6 +153,39 @@ def test_node_manager(root_node, dept_node, key_node):
     assert qs.count() == 0
 
 
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("init_tree")
+def test_node_search_rank(monkeypatch, django_assert_num_queries, root_node, dept_node, key_node):
+    queryset = TreeNode.objects.filter(disabled=False)
+    values = [root_node.name, dept_node.path, dept_node.path[:-1], "dept1.prod", key_node.name[:-1], "dept", "dept3"]
+
+    def query_results():
+        results = []
+        for value in values:
+            # 每次搜索只有一条SQL语句
+            with django_assert_num_queries(1):
+                results.append(sorted(queryset.search_nodes(value).values_list("id", flat=True)))
+            with django_assert_num_queries(1):
+                results.append(list(queryset.search_keys(value).values_list("id", flat=True)))
+        with django_assert_num_queries(1):
+            results.append(list(queryset.filter(path__startswith=root_node.path).limit_to_top_node()))
+        # 之后追加的过滤条件只过滤排名最高的结点
+        results.append(queryset.search_nodes("dept1.prod").filter(depth=3).count())
+        results.append(queryset.search_nodes("dept1.prod").filter(depth=4).count())
+        return results
+
+    expect = query_results()
+    assert expect[-3:] == [[root_node], 6, 0]
+    assert queryset.search_nodes(dept_node.path[:-1]).count() == 2
+    # 路径完全相等时不再扫描其他规则
+    assert "UNION ALL" in str(queryset.search_nodes(dept_node.path).query)
+    assert list(queryset.search_nodes(dept_node.path)) == [dept_node]
+
+    # 数据库不支持窗口函数时通过子查询计算最高排名
+    monkeypatch.setattr(connection.features, "supports_over_clause", False)
+    assert query_results() == expect
+
+
 @pytest.mark.django_db()
 def test_node_filter_perm(dept_node, employee_user, dev_role):
     queryset = TreeNode.objects.all()
@@ -167,3 +201,46 @@ def test_node_filter_perm(dept_node, employee_user, dev_role):
     assert not Role.objects.filter(name="test").exists()
     qs = queryset.filter_by_perm(user_id=employee_user.id, roles=["test"])
     assert qs.count() == 0
+
+
+def test_collapse_paths():
+    assert collapse_paths([]) == []
+    assert collapse_paths(["", "a"]) == ["a"]
+    assert collapse_paths(["a.b", "a", "a-b", "a.bc.d", "c", "c"]) == ["a", "a-b", "c"]
+    assert collapse_paths(["a.b.c", "a.b", "a.bc"]) == ["a.b", "a.bc"]
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("limit", [0, 100])
+def test_node_filter_perm_exists(settings, limit, root_node, dept_node, key_node, sys_node, employee_user, dev_role):
+    settings.TREE_PERM_FILTER_PATHS_LIMIT = limit
+    queryset = TreeNode.objects.all()
+
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    NodeRole.objects.create(user=employee_user, node=key_node, role=dev_role)
+    NodeRole.objects.create(user=employee_user, node=sys_node, role=dev_role)
+    expect = set(dept_node.get_self_and_children().values_list("id", flat=True))
+    expect |= set(sys_node.get_self_and_children().values_list("id", flat=True))
+    qs = queryset.filter_by_perm(user_id=employee_user.id)
+    assert set(qs.values_list("id", flat=True)) == expect
+    assert root_node.id not in set(qs.values_list("id", flat=True))
+    qs = queryset.filter_by_perm(user_id=employee_user.id, roles=["test"])
+    assert qs.count() == 0
+
+
+@pytest.mark.django_db()
+def test_node_filter_perm_ancestor_ids(
+    settings, django_assert_num_queries, dept_node, key_node, sys_node, employee_user, dev_role
+):
+    NodeRole.objects.create(user=employee_user, node=key_node.parent, role=dev_role)
+    NodeRole.objects.create(user=employee_user, node=sys_node, role=dev_role)
+    settings.TREE_PERM_FILTER_PATHS_LIMIT = 100
+    expect = set(TreeNode.objects.filter_by_perm(user_id=employee_user.id).values_list("id", flat=True))
+    assert key_node.id in expect and dept_node.id not in expect
+
+    settings.TREE_PERM_FILTER_PATHS_LIMIT = 0
+    qs = TreeNode.objects.filter_by_perm(user_id=employee_user.id)
+    # 授权结点与父类结点ID的匹配在同一条SQL中完成
+    with django_assert_num_queries(1):
+        assert set(qs.values_list("id", flat=True)) == expect
+    assert "EXISTS" in str(qs.query).upper()
@@ -3,7 +3,7 @@
 import pytest
 
 from django_tree_perm.controller import PermManager, TreeNodeManger
-from django_tree_perm.models import NodeRole
+from django_tree_perm.models import TreeNode, NodeRole
 from django_tree_perm.exceptions import PermDenyException
 
 
@@ -18,7 +18,9 @@ def test_tree_perm(employee_user, admin_user):
 
 
 @pytest.mark.django_db()
-def test_node_perm(admin_user, employee_user, dept_node, key_node, dev_role, admin_role, not_found_path):
+def test_node_perm(
+    django_assert_num_queries, admin_user, employee_user, dept_node, key_node, dev_role, admin_role, not_found_path
+):
     # 超管所有结点权限
     assert PermManager.has_node_perm(admin_user, can_manage=True) is True
 
@@ -47,6 +49,15 @@ def test_node_perm(admin_user, employee_user, dept_node, key_node, dev_role, adm
     NodeRole.objects.get_or_create(user=employee_user, node=dept_node, role=admin_role)
     assert PermManager.has_node_perm(employee_user, path=dept_node.path, can_manage=True) is True
     assert PermManager.has_node_perm(employee_user, key_name=key_node.name, can_manage=True) is True
+    # 只查询一次数据库
+    with django_assert_num_queries(1):
+        assert PermManager.has_node_perm(employee_user, key_name=key_node.name, roles=[admin_role.name]) is True
+    with django_assert_num_queries(1):
+        assert PermManager.has_node_perm(employee_user, path=key_node.path, roles=["not-found"]) is False
+    # 路径前缀相同但不是父类结点
+    similar = TreeNodeManger.add_node(f"{dept_node.name}0", parent=dept_node.parent, is_key=True).node
+    assert PermManager.has_node_perm(employee_user, key_name=similar.name) is False
+    assert PermManager.has_node_perm(employee_user, path=similar.path) is False
 
     # 结点被删除
     TreeNodeManger(node=key_node).remove()
@@ -103,3 +114,71 @@ def test_node_remove(employee_user, key_node, dept_node, admin_role):
 
     NodeRole.objects.get_or_create(user=employee_user, node=dept_node, role=admin_role)
     TreeNodeManger(node=key_node, user=employee_user).remove()
+
+
+@pytest.mark.django_db()
+def test_node_perms(
+    django_assert_max_num_queries, admin_user, employee_user, dept_node, key_node, no_child_node, sys_node, dev_role
+):
+    paths = [dept_node.path, key_node.path, no_child_node.path, sys_node.path, "not.found"]
+    assert PermManager.has_node_perms(admin_user, paths=paths) == {path: True for path in paths}
+    assert PermManager.has_node_perms(None, paths=paths) == {path: False for path in paths}
+    assert PermManager.has_node_perms(employee_user) == {}
+    assert PermManager.has_node_perms(employee_user, paths=paths) == {path: False for path in paths}
+
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    with django_assert_max_num_queries(2) as captured:
+        results = PermManager.has_node_perms(employee_user, paths=paths)
+    # 按照父类结点ID查询授权，不关联结点表
+    assert TreeNode._meta.db_table not in captured.captured_queries[-1]["sql"]
+    assert results == {
+        dept_node.path: True,
+        key_node.path: True,
+        no_child_node.path: True,
+        sys_node.path: False,
+        "not.found": False,
+    }
+    # 与 has_node_perm 结果一致
+    for path in paths:
+        for kwargs in [{}, {"can_manage": True}, {"roles": ["test"]}, {"roles": [dev_role.name]}]:
+            expect = PermManager.has_node_perm(employee_user, path=path, **kwargs)
+            assert PermManager.has_node_perms(employee_user, paths=[path], **kwargs)[path] is expect
+
+    results = PermManager.has_node_perms(employee_user, key_names=[key_node.name, "not-found"])
+    assert results == {key_node.name: True, "not-found": False}
+
+    # 结点被删除
+    TreeNodeManger(node=key_node).remove()
+    assert PermManager.has_node_perms(employee_user, key_names=[key_node.name]) == {key_node.name: False}
+
+
+@pytest.mark.django_db()
+def test_users_with_perm(
+    django_assert_max_num_queries, django_user_model, employee_user, dept_node, key_node, sys_node, dev_role, admin_role
+):
+    assert PermManager.users_with_perm() == {}
+    assert PermManager.users_with_perm(key_names=["not-found"]) == {"not-found": []}
+
+    user = django_user_model.objects.create(username="leader")
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    NodeRole.objects.create(user=employee_user, node=key_node, role=admin_role)
+    NodeRole.objects.create(user=user, node=dept_node, role=admin_role)
+
+    with django_assert_max_num_queries(2):
+        results = PermManager.users_with_perm(key_names=[key_node.name], paths=[sys_node.path])
+    users = {item["user_id"]: item for item in results[key_node.name]}
+    assert list(results.keys()) == [key_node.name]
+    assert len(users) == 2
+    # 记录最近的授权结点
+    assert users[employee_user.id]["node_id"] == key_node.id
+    assert users[employee_user.id]["username"] == employee_user.username
+    assert sorted(users[employee_user.id]["roles"]) == sorted([admin_role.name, dev_role.name])
+    assert users[user.id]["path"] == dept_node.path
+
+    results = PermManager.users_with_perm(paths=[dept_node.path, key_node.path, sys_node.path], roles=[dev_role.name])
+    assert [item["user_id"] for item in results[dept_node.path]] == [employee_user.id]
+    assert [item["user_id"] for item in results[key_node.path]] == [employee_user.id]
+    assert results[sys_node.path] == []
+
+    results = PermManager.users_with_perm(paths=[dept_node.path], can_manage=True)
+    assert [item["user_id"] for item in results[dept_node.path]] == [user.id]
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# coding=utf-8
+from http import HTTPStatus
+
+import pytest
+
+from django.http import JsonResponse
+from django.contrib.auth.models import AnonymousUser
+
+from django_tree_perm.cache import perm_cache
+from django_tree_perm.controller import PermResolver
+from django_tree_perm.decorators import require_node_perm
+from django_tree_perm.middleware import PermResolverMiddleware, get_perm_resolver
+from django_tree_perm.models import NodeRole
+
+
+def ok_view(request, *args, **kwargs):
+    return JsonResponse({"ok": True})
+
+
+@pytest.mark.django_db()
+def test_perm_resolver(
+    django_assert_num_queries, admin_user, employee_user, dept_node, key_node, dev_role, admin_role, not_found_path
+):
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+
+    resolver = PermResolver(employee_user)
+    # 加载一次结点和一次授权
+    with django_assert_num_queries(2):
+        assert resolver.has_tree_perm() is False
+        assert resolver.has_node_perm(key_name=key_node.name) is True
+        assert resolver.has_node_perm(key_name=key_node.name, can_manage=True) is False
+        assert resolver.has_node_perm(key_name=key_node.name, roles=[admin_role.name]) is False
+    with django_assert_num_queries(1):
+        assert resolver.has_node_perm(path=dept_node.path) is True
+        assert resolver.has_node_perm(path=dept_node.path) is True
+    assert resolver.has_node_perm(path=not_found_path) is False
+    assert resolver.has_node_perm() is False
+
+    assert PermResolver(admin_user).has_node_perm(path=not_found_path) is True
+    with django_assert_num_queries(0):
+        assert PermResolver(AnonymousUser()).has_node_perm(path=key_node.path) is False
+        assert PermResolver(None).grant_map == {}
+
+
+@pytest.mark.django_db()
+def test_perm_resolver_cache(settings, django_assert_num_queries, employee_user, dept_node, key_node, dev_role):
+    settings.TREE_PERM_SHARED_CACHE_ENABLED = True
+    perm_cache.shared.cache.clear()
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    assert PermResolver(employee_user).has_node_perm(key_name=key_node.name) is True
+    with django_assert_num_queries(0):
+        assert PermResolver(employee_user).has_node_perm(key_name=key_node.name) is True
+
+
+@pytest.mark.django_db()
+def test_require_node_perm(rf, django_assert_num_queries, employee_user, dept_node, key_node, dev_role, admin_role):
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    middleware = PermResolverMiddleware(require_node_perm()(ok_view))
+
+    request = rf.get("/", data={"key_name": key_node.name})
+    request.user = AnonymousUser()
+    assert middleware(request).status_code == HTTPStatus.FORBIDDEN
+
+    request = rf.get("/", data={"key_name": key_node.name})
+    request.user = employee_user
+    with django_assert_num_queries(2):
+        assert middleware(request).status_code == HTTPStatus.OK
+        # 视图内再次判断不再查询
+        assert request.tree_perm.has_node_perm(key_name=key_node.name) is True
+
+    request = rf.get("/")
+    request.user = employee_user
+    assert middleware(request).status_code == HTTPStatus.FORBIDDEN
+
+    # 未配置中间件，从视图参数中获取结点
+    request = rf.get("/")
+    request.user = employee_user
+    assert require_node_perm()(ok_view)(request, path=key_node.path).status_code == HTTPStatus.OK
+    assert get_perm_resolver(request) is request.tree_perm
+
+    view = require_node_perm(path=key_node.path, roles=[admin_role.name])(ok_view)
+    assert view(request).status_code == HTTPStatus.FORBIDDEN
+    view = require_node_perm(key_name=lambda request, pk: pk, can_manage=True)(ok_view)
+    assert view(request, pk=key_node.name).status_code == HTTPStatus.FORBIDDEN
+    view = require_node_perm(key_name=lambda request, pk: pk)(ok_view)
+    assert view(request, pk=key_node.name).status_code == HTTPStatus.OK
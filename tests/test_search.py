@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# coding=utf-8
+import pytest
+
+from django_tree_perm import search
+from django_tree_perm.search import search_index, get_grams
+from django_tree_perm.controller import TreeNodeManger
+from django_tree_perm.models import TreeNode
+
+
+@pytest.fixture
+def enable_search_index(settings):
+    settings.TREE_PERM_SEARCH_INDEX_ENABLED = True
+    search_index.clear()
+    yield search_index
+    search_index.clear()
+
+
+def get_ids(queryset):
+    return sorted(queryset.values_list("id", flat=True))
+
+
+def test_get_grams():
+    assert get_grams("ab") == set()
+    assert get_grams("abcd") == {"abc", "bcd"}
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("init_tree")
+def test_search_same_as_query(settings, enable_search_index, root_node, dept_node, key_node, no_child_node):
+    TreeNodeManger(node=key_node).remove()
+    values = [
+        root_node.name,
+        dept_node.path,
+        dept_node.path[:-1],
+        f"{dept_node.path}.",
+        "dept1.prod",
+        ".prod",
+        "1.p",
+        key_node.name,
+        key_node.name[:-1],
+        "dept",
+        "dept3",
+        "s",
+        "em",
+        "not.found",
+    ]
+    querysets = [
+        lambda: TreeNode.objects.all(),
+        lambda: TreeNode.objects.filter(disabled=False),
+        lambda: TreeNode.objects.filter(depth__gte=3),
+        lambda: TreeNode.objects.exclude(path__startswith=dept_node.path),
+    ]
+    for value in values:
+        for get_queryset in querysets:
+            settings.TREE_PERM_SEARCH_INDEX_ENABLED = False
+            expect = get_ids(get_queryset().search_nodes(value))
+            settings.TREE_PERM_SEARCH_INDEX_ENABLED = True
+            assert get_ids(get_queryset().search_nodes(value)) == expect, value
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("init_tree")
+def test_search_parity(settings, enable_search_index, dept_node, key_node, sys_node):
+    # 禁用的key结点保留原路径，再新增相同路径的结点；禁用子树中的key结点
+    parent = key_node.parent
+    TreeNodeManger(node=key_node).remove()
+    TreeNodeManger.add_node(key_node.name, parent=parent)
+    TreeNodeManger(node=sys_node).remove(clear_chidren=True)
+    assert TreeNode.objects.filter(disabled=True).count() > 1
+
+    values = [
+        key_node.path,
+        key_node.path.upper(),
+        key_node.name.upper(),
+        key_node.name[1:].title(),
+        sys_node.path,
+        f"{sys_node.path}.",
+        sys_node.path.split(".", 1)[1],
+        f"{dept_node.path}.PROD",
+        "Dept1.Product2.Sys",
+        "Em",
+    ]
+    querysets = [
+        lambda: TreeNode.objects.all(),
+        lambda: TreeNode.objects.filter(disabled=True),
+        lambda: TreeNode.objects.filter(disabled=False),
+        lambda: TreeNode.objects.filter(depth__gte=4),
+    ]
+    for value in values:
+        for get_queryset in querysets:
+            settings.TREE_PERM_SEARCH_INDEX_ENABLED = False
+            expect = get_ids(get_queryset().search_nodes(value))
+            settings.TREE_PERM_SEARCH_INDEX_ENABLED = True
+            assert get_ids(get_queryset().search_nodes(value)) == expect, value
+    # 大小写不影响搜索结果
+    assert get_ids(TreeNode.objects.search_nodes(key_node.path.upper())) == get_ids(
+        TreeNode.objects.filter(path=key_node.path)
+    )
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("init_tree")
+def test_search_index(
+    settings,
+    enable_search_index,
+    monkeypatch,
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+    dept_node,
+    sys_node,
+):
+    assert TreeNode.objects.search_nodes("").count() == 0
+    TreeNode.objects.search_nodes("dept").count()
+    assert enable_search_index.info()["nodes"] == TreeNode.objects.count()
+    # 加载后一次查询确认候选结点
+    with django_assert_num_queries(1):
+        TreeNode.objects.search_nodes("dept1.prod")
+    # 无候选结点不查询数据库
+    with django_assert_num_queries(0):
+        assert list(TreeNode.objects.search_nodes("dept3")) == []
+
+    # 新增结点事务提交后更新
+    with django_capture_on_commit_callbacks(execute=True):
+        node = TreeNodeManger.add_node("searched-key", parent=dept_node, is_key=True).node
+    assert get_ids(TreeNode.objects.search_nodes("searched")) == [node.id]
+    # 移动结点后重新加载
+    with django_capture_on_commit_callbacks(execute=True):
+        TreeNodeManger(node=dept_node).move_path(parent=sys_node)
+    assert not enable_search_index.loaded
+    assert get_ids(TreeNode.objects.search_nodes(f"{sys_node.path}.{dept_node.name}")) == [dept_node.id]
+    # 删除结点
+    with django_capture_on_commit_callbacks(execute=True):
+        TreeNodeManger(node=node).remove()
+    assert TreeNode.objects.filter(disabled=False).search_nodes("searched").count() == 0
+
+    # 候选结点较多时分批确认，超过批量大小的优先级直接按照查询条件判断
+    monkeypatch.setattr(search, "BATCH_SIZE", 1)
+    for value in ["e", "dept", "1.p"]:
+        settings.TREE_PERM_SEARCH_INDEX_ENABLED = False
+        expect = get_ids(TreeNode.objects.search_nodes(value))
+        settings.TREE_PERM_SEARCH_INDEX_ENABLED = True
+        assert get_ids(TreeNode.objects.search_nodes(value)) == expect
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("init_tree")
+def test_search_index_disabled_path(enable_search_index, django_capture_on_commit_callbacks, key_node):
+    parent = key_node.parent
+    TreeNodeManger(node=key_node).remove()
+    node = TreeNodeManger.add_node(key_node.name, parent=parent).node
+    TreeNodeManger.add_node(f"{key_node.name}0", parent=parent)
+    enable_search_index.load()
+
+    # 禁用的key结点保留原路径，更新后不影响路径完全相等的匹配
+    key_node.refresh_from_db()
+    assert key_node.path == node.path
+    with django_capture_on_commit_callbacks(execute=True):
+        key_node.alias = "disabled"
+        key_node.save()
+    assert get_ids(TreeNode.objects.filter(disabled=False).search_nodes(node.path)) == [node.id]
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("init_tree")
+def test_search_index_reload(enable_search_index, monkeypatch, dept_node):
+    enable_search_index.load()
+    seen = []
+    add = search_index._add.__func__
+
+    def checked_add(self, node):
+        # 重新加载过程中，读取到的仍是加载前完整的索引
+        if self is not search_index and not seen:
+            seen.append((search_index._paths.get(dept_node.path), len(search_index._nodes)))
+        add(self, node)
+
+    monkeypatch.setattr(type(search_index), "_add", checked_add)
+    assert search_index.load() == TreeNode.objects.count()
+    assert seen == [([dept_node.id], TreeNode.objects.count())]
@@ -161,3 +161,412 @@ def test_get_node(dept_node, key_node, not_found_path):
     TreeNodeManger(node=key_node).remove()
     with pytest.raises(ParamsValidateException, match="This node is disabled"):
         TreeNodeManger.get_node_object(key_name=key_node.name)
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("in_db", [True, False])
+def test_move_node_engine(settings, django_assert_max_num_queries, in_db, dept_node, sys_node):
+    settings.TREE_PERM_MOVE_IN_DB = in_db
+    expect_count = dept_node.get_self_and_children().count()
+    rows = TreeNodeManger(node=dept_node).move_path(parent=sys_node)
+    assert rows == expect_count
+
+    dept_node.refresh_from_db()
+    nodes = list(dept_node.get_self_and_children().select_related("parent"))
+    assert len(nodes) == expect_count
+    for node in nodes:
+        values = [getattr(node, field) for field in ("path", "depth", "node_hash")]
+        node.patch_attrs()
+        assert values == [getattr(node, field) for field in ("path", "depth", "node_hash")]
+        assert node.path.startswith(sys_node.path_prefix)
+
+    if in_db:
+        # 查询次数与子结点数量无关
+        with django_assert_max_num_queries(10):
+            TreeNodeManger(node=dept_node).move_path(parent=dept_node.parent.parent)
+
+
+@pytest.mark.django_db()
+def test_remove_node_in_chunks(
+    settings, employee_user, root_node, dept_node, key_node, no_child_node, dev_role, admin_role
+):
+    from django.core.management import call_command
+    from django_tree_perm import effective
+    from django_tree_perm.models import NodeRole, EffectivePerm
+
+    settings.TREE_PERM_EFFECTIVE_ENABLED = True
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    NodeRole.objects.create(user=employee_user, node=key_node, role=admin_role)
+    NodeRole.objects.create(user=employee_user, node=root_node, role=dev_role)
+    queryset = dept_node.get_self_and_children()
+    key_ids = list(queryset.filter(is_key=True).values_list("id", flat=True))
+    expect_count = queryset.filter(is_key=False).count()
+
+    records = []
+    rows = TreeNodeManger(node=dept_node).remove_in_chunks(chunk_size=2, progress=lambda *args: records.append(args))
+    assert rows == expect_count
+    assert records[-1] == (expect_count + len(key_ids), expect_count + len(key_ids))
+    assert not TreeNode.objects.filter(path=dept_node.path).exists()
+    assert not TreeNode.objects.filter(parent_id=dept_node.id).exists()
+    for node in TreeNode.objects.filter(id__in=key_ids):
+        assert node.disabled is True and node.parent_id is None
+        values = [node.path, node.depth, node.node_hash]
+        node.patch_attrs()
+        assert values == [node.path, node.depth, node.node_hash]
+    assert not NodeRole.objects.filter(node_id__in=key_ids).exists()
+    assert NodeRole.objects.filter(node=root_node).exists()
+    assert effective.check() == {"missing": [], "extra": []}
+    assert not EffectivePerm.objects.filter(node_id__in=key_ids).exists()
+
+    # 无子结点
+    assert TreeNodeManger(node=no_child_node).remove_in_chunks() == 1
+    TreeNodeManger(path="web").remove_in_chunks()
+    call_command("remove_tree_node", root_node.path, chunk_size=3)
+    assert not TreeNode.objects.filter(disabled=False).exists()
+
+
+@pytest.mark.django_db()
+def test_remove_in_chunks_by_depth(monkeypatch, dept_node):
+    from django.db.models import QuerySet
+    from django_tree_perm.controller import perm_cache
+
+    depths = []
+    raw_delete = QuerySet._raw_delete
+
+    def record_raw_delete(self, using):
+        if self.model is TreeNode:
+            depths.append(set(self.values_list("depth", flat=True)))
+        return raw_delete(self, using)
+
+    invalidated = []
+    monkeypatch.setattr(QuerySet, "_raw_delete", record_raw_delete)
+    monkeypatch.setattr(perm_cache, "invalidate_all", lambda: invalidated.append(1))
+    queryset = dept_node.get_self_and_children().filter(is_key=False)
+    expect_depths = sorted(set(queryset.values_list("depth", flat=True)), reverse=True)
+    TreeNodeManger(node=dept_node).remove_in_chunks(chunk_size=1000)
+    # 每批只删除同一深度的结点，每批提交后失效缓存
+    assert depths == [{depth} for depth in expect_depths]
+    assert len(invalidated) == len(depths) + 1
+
+
+@pytest.mark.django_db()
+def test_import_tree_data(django_assert_max_num_queries):
+    import json
+
+    with open("tests/fixtures/tree.json", "rb") as f:
+        data = json.loads(f.read())
+
+    with django_assert_max_num_queries(20):
+        result = TreeNodeManger.import_tree_data(data, batch_size=3)
+    total = TreeNode.objects.count()
+    # 数据中有重复的结点
+    assert result == {"created": total, "skipped": 1}
+    for node in TreeNode.objects.select_related("parent"):
+        values = [node.path, node.depth, node.node_hash]
+        node.patch_attrs()
+        assert values == [node.path, node.depth, node.node_hash]
+
+    # 重复导入全部跳过，子结点继续导入
+    data[0]["children"].append({"name": "dept3", "children": [{"name": "new-key", "is_key": True}]})
+    assert TreeNodeManger.import_tree_data(data) == {"created": 2, "skipped": total + 1}
+    assert TreeNode.objects.get(path="com.dept3.new-key").parent.path == "com.dept3"
+    assert TreeNodeManger.load_tree_data(data) == 0
+    assert TreeNodeManger.import_tree_data([]) == {"created": 0, "skipped": 0}
+
+    # 校验失败整体回滚
+    with pytest.raises(ValidationError, match="name"):
+        TreeNodeManger.import_tree_data([{"name": "new", "children": [{"name": "Bad"}]}])
+    assert not TreeNode.objects.filter(path="new").exists()
+    with pytest.raises(ValidationError, match="结点已存在"):
+        TreeNodeManger.import_tree_data([{"name": "new", "children": [{"name": "new-key", "is_key": True}]}])
+    with pytest.raises(ValidationError, match="结点已存在"):
+        TreeNodeManger.import_tree_data(
+            [
+                {
+                    "name": "new",
+                    "children": [
+                        {"name": "aa", "children": [{"name": "k1", "is_key": True}]},
+                        {"name": "bb", "children": [{"name": "k1", "is_key": True}]},
+                    ],
+                }
+            ]
+        )
+    assert not TreeNode.objects.filter(path="new").exists()
+
+    # key结点不能作为父结点或根结点
+    with pytest.raises(ParamsValidateException, match="parent node"):
+        TreeNodeManger.import_tree_data(
+            [{"name": "new", "children": [{"name": "k2", "is_key": True, "children": [{"name": "a"}]}]}]
+        )
+    with pytest.raises(ParamsValidateException, match="root node"):
+        TreeNodeManger.import_tree_data([{"name": "k2", "is_key": True}])
+    # key结点标识与已存在的根结点路径相同
+    with pytest.raises(ValidationError, match="结点已存在"):
+        TreeNodeManger.import_tree_data([{"name": "new", "children": [{"name": "com", "is_key": True}]}])
+    assert not TreeNode.objects.filter(path="new").exists()
+
+
+@pytest.mark.django_db()
+def test_import_tree_records(tmp_path):
+    from django.core.management import call_command
+
+    lines = [
+        '{"path": "com"}',
+        "",
+        '{"path": "com.dept1", "alias": "部门1"}',
+        '{"path": "com.dept1.key1", "is_key": true}',
+        '{"path": "com.dept2"}',
+        '{"path": "com.dept2.key2", "is_key": true}',
+        '{"path": "com.dept1"}',
+        '{"path": "com.dept2.key2.app"}',
+    ]
+    records = list(utils.read_ndjson(lines))
+    assert len(records) == 7
+    with pytest.raises(ValueError, match="line 2"):
+        list(utils.read_ndjson(['{"path": "com"}', "[1]"]))
+
+    reports = []
+    # 导入中断，前两批已提交
+    with pytest.raises(ParamsValidateException):
+        TreeNodeManger.import_tree_records(records[:4] + [{"path": "x.y"}], chunk_size=2, progress=reports.append)
+    assert reports[-1] == {"created": 4, "skipped": 0, "last_path": "com.dept2"}
+    assert TreeNode.objects.get(path="com.dept1").alias == "部门1"
+
+    # 从最后提交的路径继续导入
+    result = TreeNodeManger.import_tree_records(records[:-1], chunk_size=2, resume_after=reports[-1]["last_path"])
+    assert result == {"created": 1, "skipped": 1, "last_path": "com.dept1"}
+    # key结点不能作为父结点
+    with pytest.raises(ParamsValidateException, match="parent node"):
+        TreeNodeManger.import_tree_records(records[-1:])
+    # 未找到继续导入的路径
+    with pytest.raises(ParamsValidateException, match="not found"):
+        TreeNodeManger.import_tree_records(records[:-1], resume_after="com.dept3")
+    # 记录字段错误
+    for record in [{"path": "com.dept3", "name": "dept3"}, {"path": "com.dept3", "unknown": 1}, {"alias": "x"}]:
+        with pytest.raises(ParamsValidateException, match="allowed fields"):
+            TreeNodeManger.import_tree_records([record])
+    assert not TreeNode.objects.filter(path="com.dept3").exists()
+    for node in TreeNode.objects.select_related("parent"):
+        values = [node.path, node.depth, node.node_hash]
+        node.patch_attrs()
+        assert values == [node.path, node.depth, node.node_hash]
+    assert TreeNode.objects.get(path="com.dept2.key2").parent.path == "com.dept2"
+
+    # 同一批中子结点先于父结点也可导入
+    path = tmp_path / "tree.ndjson"
+    path.write_text('{"path": "web.aa.bb"}\n{"path": "web.aa"}\n{"path": "web"}\n', encoding="utf-8")
+    call_command("import_tree_nodes", str(path), chunk_size=3)
+    assert TreeNode.objects.get(path="web.aa.bb").depth == 3
+
+    with pytest.raises(ValidationError, match="结点已存在"):
+        TreeNodeManger.import_tree_records([{"path": "web.key1", "is_key": True}])
+    assert not TreeNode.objects.filter(path="web.key1").exists()
+
+
+@pytest.mark.django_db()
+def test_to_json_tree(django_assert_num_queries, dept_node, key_node):
+    with django_assert_num_queries(1):
+        tree = TreeNodeManger.to_json_tree(TreeNode.objects.filter(disabled=False), trace_to_root=False)
+    assert tree[0] == {**tree[0], **dept_node.parent.to_json(partial=True)}
+    assert tree[0]["children"][0]["path"] == dept_node.path
+
+    # 父结点不在结果中的结点不展示
+    queryset = TreeNode.objects.filter(path__startswith=dept_node.path_prefix)
+    assert TreeNodeManger.to_json_tree(queryset, trace_to_root=False) == []
+
+    # 追溯到根结点，只查询缺失的父类结点
+    with django_assert_num_queries(2):
+        tree = TreeNodeManger.to_json_tree(TreeNode.objects.filter(id=key_node.id))
+    paths = []
+    while tree:
+        assert len(tree) == 1
+        paths.append(tree[0]["path"])
+        tree = tree[0].get("children")
+    assert paths == utils.get_tree_paths(key_node.path)
+    with django_assert_num_queries(1):
+        tree = TreeNodeManger.to_json_tree(TreeNode.objects.filter(depth=1))
+    assert [item["path"] for item in tree] == list(TreeNode.objects.filter(depth=1).values_list("path", flat=True))
+    assert "children" not in tree[0]
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("in_db", [True, False])
+def test_tree_counts(settings, in_db, root_node, dept_node, key_node, no_child_node, sys_node):
+    from django.core.management import call_command
+    from django.core.management.base import CommandError
+    from django_tree_perm import counts
+
+    settings.TREE_PERM_MOVE_IN_DB = in_db
+    # 导入数据后计数一致
+    assert counts.check() == []
+    descendants = dept_node.get_self_and_children().filter(disabled=False).count() - 1
+    assert dept_node.descendant_count == descendants
+    assert dept_node.child_count == TreeNode.objects.filter(parent=dept_node, disabled=False).count()
+
+    TreeNodeManger.add_node(name="count-child", parent=no_child_node)
+    TreeNodeManger(node=key_node).remove()
+    assert counts.check() == []
+    root_node.refresh_from_db()
+    assert root_node.descendant_count == TreeNode.objects.filter(path__startswith="com.", disabled=False).count()
+
+    # 旧的结点对象保存时不会覆盖计数
+    dept_node.alias = "dept"
+    dept_node.save()
+    dept_node.refresh_from_db()
+    TreeNodeManger(node=dept_node).move_path(parent=sys_node)
+    assert counts.check() == []
+    # 恢复已禁用的key结点
+    TreeNodeManger(node=TreeNode.objects.get(id=key_node.id)).move_path(parent_id=no_child_node.id)
+    assert counts.check() == []
+
+    TreeNodeManger(path="web.system1.dept1.product2.system2.count-child").remove()
+    TreeNodeManger(path="web.system1.dept1.product2").remove(clear_chidren=True)
+    assert counts.check() == []
+    TreeNodeManger(path="web.system1.dept1").remove_in_chunks(chunk_size=1)
+    assert counts.check() == []
+    TreeNodeManger.import_tree_records([{"path": "web.system1.a1"}, {"path": "web.system1.a1.b1"}])
+    assert counts.check() == []
+    assert TreeNode.objects.get(path="web.system1.a1").descendant_count == 1
+
+    # 直接修改数据后通过管理命令检查并重建
+    TreeNode.objects.filter(path="web").update(child_count=0, descendant_count=0)
+    with pytest.raises(CommandError):
+        call_command("rebuild_tree_counts", "--check")
+    call_command("rebuild_tree_counts")
+    assert counts.check() == []
+    call_command("rebuild_tree_counts", "--check")
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("in_db", [True, False])
+def test_ancestor_ids(settings, in_db, root_node, dept_node, key_node, no_child_node, sys_node):
+    settings.TREE_PERM_MOVE_IN_DB = in_db
+
+    def assert_ancestor_ids():
+        nodes = {node.id: node for node in TreeNode.objects.all()}
+        for node in nodes.values():
+            if node.disabled:
+                assert node.ancestor_ids == ""
+                continue
+            paths = [nodes[node_id].path for node_id in node.get_ancestor_ids()]
+            assert paths == utils.get_tree_paths(node.path)
+
+    assert_ancestor_ids()
+    assert key_node.get_ancestor_ids()[0] == root_node.id
+    assert key_node.get_ancestor_ids(include_self=False) == key_node.get_ancestor_ids()[:-1]
+
+    TreeNodeManger.add_node(name="ancestor-child", parent=no_child_node)
+    TreeNodeManger(node=key_node).remove()
+    assert_ancestor_ids()
+    TreeNodeManger(node=dept_node).move_path(parent=sys_node)
+    assert_ancestor_ids()
+    # 恢复已禁用的key结点
+    TreeNodeManger(node=TreeNode.objects.get(id=key_node.id)).move_path(parent_id=no_child_node.id)
+    assert_ancestor_ids()
+
+    TreeNodeManger.import_tree_data([{"name": "web", "children": [{"name": "a1", "children": [{"name": "b1"}]}]}])
+    TreeNodeManger.import_tree_records([{"path": "web.a1.b1.c1"}, {"path": "web.a1.b1.c1.d1"}])
+    assert_ancestor_ids()
+    TreeNodeManger(path="web.system1.dept1").remove_in_chunks(chunk_size=1)
+    assert_ancestor_ids()
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("in_db", [True, False])
+def test_nested_set_intervals(settings, in_db, employee_user, dev_role, dept_node, key_node, no_child_node, sys_node):
+    from django.core.management import call_command
+    from django_tree_perm import intervals
+    from django_tree_perm.models import NodeRole
+
+    def assert_consistent():
+        assert intervals.check() == []
+        for node in TreeNode.objects.filter(disabled=False):
+            assert node.has_interval
+            expected = set(
+                TreeNode.objects.filter(path__startswith=node.path_prefix, disabled=False).values_list("id", flat=True)
+            )
+            assert set(TreeNode.objects.descendants_of(node).filter(disabled=False).values_list("id", flat=True)) == (
+                expected
+            )
+            paths = utils.get_tree_paths(node.path)
+            assert sorted(TreeNode.objects.ancestors_of(node).values_list("path", flat=True)) == sorted(paths[:-1])
+
+    settings.TREE_PERM_MOVE_IN_DB = in_db
+    settings.TREE_PERM_NESTED_SET_ENABLED = True
+    call_command("rebuild_tree_intervals")
+    assert_consistent()
+    dept_node.refresh_from_db()
+    key_node.refresh_from_db()
+    assert TreeNode.objects.is_descendant(key_node, dept_node) is True
+    assert TreeNode.objects.is_descendant(dept_node, key_node) is False
+    assert "lft" in str(dept_node.get_self_and_children().query)
+
+    # 剩余空间不足时重新编号
+    no_child_node.refresh_from_db()
+    TreeNode.objects.filter(id=no_child_node.id).update(rgt=no_child_node.lft + 64)
+    for i in range(5):
+        TreeNodeManger.add_node(name=f"gap{i}", parent_id=no_child_node.id)
+    TreeNodeManger.add_node(name="new-root")
+    assert_consistent()
+
+    TreeNodeManger(node=TreeNode.objects.get(id=dept_node.id)).move_path(parent_id=sys_node.id)
+    assert_consistent()
+    TreeNodeManger(node=TreeNode.objects.get(id=key_node.id)).remove()
+    TreeNodeManger(node=TreeNode.objects.get(id=key_node.id)).move_path(parent_id=sys_node.id)
+    assert_consistent()
+    TreeNodeManger.import_tree_records([{"path": "web.system1.a1"}, {"path": "web.system1.a1.b1"}])
+    TreeNodeManger.load_tree_data([{"name": "new-root", "children": [{"name": "c1", "children": [{"name": "d1"}]}]}])
+    assert_consistent()
+    # 子树区间宽度超过剩余空间时在分配的区间内重新编号
+    narrow = TreeNodeManger.add_node(name="narrow", parent_id=sys_node.id).node
+    TreeNode.objects.filter(id=narrow.id).update(rgt=narrow.lft + 200)
+    TreeNodeManger(path="new-root").move_path(parent_id=narrow.id)
+    assert_consistent()
+    # 剩余空间足够时整体平移
+    TreeNodeManger(node=TreeNode.objects.get(id=narrow.id)).move_path(parent_path="web")
+    assert TreeNode.objects.get(id=narrow.id).rgt - TreeNode.objects.get(id=narrow.id).lft == 200
+    assert_consistent()
+
+    # 按照区间过滤有权限的结点，结果与按照路径前缀一致
+    NodeRole.objects.create(user=employee_user, node=TreeNode.objects.get(path="web.system1.dept1"), role=dev_role)
+    queryset = TreeNode.objects.filter_by_perm(employee_user.id)
+    assert "lft" in str(queryset.query)
+    ids = set(queryset.values_list("id", flat=True))
+    settings.TREE_PERM_NESTED_SET_ENABLED = False
+    assert set(TreeNode.objects.filter_by_perm(employee_user.id).values_list("id", flat=True)) == ids
+    settings.TREE_PERM_NESTED_SET_ENABLED = True
+
+    TreeNodeManger(path="web.system1.dept1").remove(clear_chidren=True)
+    assert_consistent()
+    call_command("rebuild_tree_intervals", "--check")
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("action", ["remove", "remove_in_chunks", "move_path"])
+def test_nested_set_stale_interval(settings, action):
+    from django_tree_perm import intervals
+
+    settings.TREE_PERM_NESTED_SET_ENABLED = True
+    TreeNodeManger.load_tree_data(
+        [{"name": "rr", "children": [{"name": "aa", "children": [{"name": "xx", "children": [{"name": "yy"}]}]}]}]
+    )
+    TreeNodeManger.add_node(name="bb", parent_path="rr")
+    intervals.rebuild()
+    stale = TreeNode.objects.get(path="rr.aa.xx")
+    # 剩余空间不足时重新编号，结点对象中的区间已过期
+    parent = TreeNode.objects.get(path="rr.aa")
+    for i in range(80):
+        TreeNodeManger.add_node(name=f"n{i}", parent=parent)
+    assert TreeNode.objects.get(id=stale.id).lft != stale.lft
+
+    manager = TreeNodeManger(node=stale)
+    if action == "remove":
+        manager.remove(clear_chidren=True)
+    elif action == "remove_in_chunks":
+        manager.remove_in_chunks(chunk_size=10)
+    else:
+        manager.move_path(parent_path="rr.bb")
+        assert TreeNode.objects.get(path="rr.bb.xx.yy").depth == 4
+    assert TreeNode.objects.filter(path__startswith="rr.aa.n").count() == 80
+    assert not TreeNode.objects.filter(path__startswith="rr.aa.xx").exists()
+    assert intervals.check() == []
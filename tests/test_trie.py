@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# coding=utf-8
+import threading
+
+import pytest
+
+from http import HTTPStatus
+
+from django_tree_perm.trie import path_trie
+from django_tree_perm.controller import TreeNodeManger
+from django_tree_perm.models import TreeNode, NodeRole
+
+
+@pytest.fixture
+def clear_trie():
+    path_trie.clear()
+    yield path_trie
+    path_trie.clear()
+
+
+def get_paths(data):
+    return [item["path"] for item in data["results"]]
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("init_tree")
+def test_path_trie_complete(clear_trie, django_assert_num_queries, dept_node, key_node):
+    with django_assert_num_queries(1):
+        data = path_trie.complete("")
+    assert data["parent"] == ""
+    assert get_paths(data) == ["com", "web"]
+    assert path_trie.info()["nodes"] == TreeNode.objects.filter(disabled=False).count()
+
+    with django_assert_num_queries(0):
+        data = path_trie.complete(f"{dept_node.path}.product")
+    assert data["parent"] == dept_node.path
+    assert get_paths(data) == [f"{dept_node.path}.product{i}" for i in range(1, 7)]
+    assert data["has_more"] is False
+    assert data["results"][1]["has_children"] is True
+
+    # 限制个数
+    data = path_trie.complete(f"{dept_node.path}.product", limit=2)
+    assert get_paths(data) == [f"{dept_node.path}.product1", f"{dept_node.path}.product2"]
+    assert data["has_more"] is True
+    # 输入完整的父结点路径时返回所有子结点
+    data = path_trie.complete(f"{key_node.parent.path}.")
+    assert get_paths(data) == [key_node.path, f"{key_node.parent.path}.module"]
+    assert data["results"][0]["is_key"] is True
+
+    # 过滤结点，过滤函数在释放锁之后调用
+    def predicate(entry):
+        assert not path_trie._lock._is_owned()
+        return entry.name.endswith("2")
+
+    data = path_trie.complete(f"{dept_node.path}.", predicate=predicate)
+    assert get_paths(data) == [f"{dept_node.path}.product2"]
+    # 父结点路径不存在
+    assert path_trie.complete("com.dept3.p") == {"parent": None, "results": [], "has_more": False}
+    assert get_paths(path_trie.complete("com.dept3")) == []
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("init_tree")
+def test_path_trie_sync(clear_trie, django_capture_on_commit_callbacks, dept_node, key_node, sys_node):
+    path_trie.load()
+
+    # 新增结点事务提交后更新
+    with django_capture_on_commit_callbacks(execute=True):
+        node = TreeNodeManger.add_node("product0", parent=dept_node).node
+    assert get_paths(path_trie.complete(f"{dept_node.path}.product"))[0] == node.path
+    # 移动没有子结点的结点
+    with django_capture_on_commit_callbacks(execute=True):
+        TreeNodeManger(node=node).move_path(parent=sys_node)
+    assert path_trie.loaded
+    assert node.path not in get_paths(path_trie.complete(f"{dept_node.path}.product"))
+    assert get_paths(path_trie.complete(f"{sys_node.path}.product")) == [f"{sys_node.path}.product0"]
+    # 禁用结点
+    with django_capture_on_commit_callbacks(execute=True):
+        TreeNodeManger(path=f"{sys_node.path}.product0").remove()
+    assert get_paths(path_trie.complete(f"{sys_node.path}.product")) == []
+    assert path_trie.info()["nodes"] == TreeNode.objects.filter(disabled=False).count()
+
+    # 移动有子结点的结点后重新加载
+    with django_capture_on_commit_callbacks(execute=True):
+        TreeNodeManger(node=key_node.parent).move_path(parent=sys_node)
+    assert not path_trie.loaded
+    assert get_paths(path_trie.complete(f"{sys_node.path}.system1.app")) == [f"{sys_node.path}.system1.appkey1"]
+
+    # 批量删除后重新加载
+    with django_capture_on_commit_callbacks(execute=True):
+        TreeNodeManger(node=dept_node).remove_in_chunks(chunk_size=2)
+    assert not path_trie.loaded
+    assert get_paths(path_trie.complete("com.")) == ["com.dept2"]
+
+
+@pytest.mark.django_db()
+def test_path_trie_expired_reload(clear_trie, settings, monkeypatch, key_node):
+    prefix = f"{key_node.parent.path}."
+    path_trie.load()
+    built = path_trie._build()
+    started, release = threading.Event(), threading.Event()
+
+    def slow_build():
+        started.set()
+        release.wait(5)
+        return built
+
+    monkeypatch.setattr(path_trie, "_build", slow_build)
+    settings.TREE_PERM_TRIE_TTL = 0
+    assert path_trie.active
+    thread = threading.Thread(target=path_trie.complete, args=("",))
+    thread.start()
+    assert started.wait(5)
+    # 过期后其他线程重新加载期间，不等待加载完成，继续使用旧的前缀树
+    assert key_node.path in get_paths(path_trie.complete(prefix))
+    # 加载期间的增量更新在新的前缀树中重放
+    path_trie.apply_delete(key_node.id)
+    settings.TREE_PERM_TRIE_TTL = 300
+    release.set()
+    thread.join(5)
+    assert path_trie.loaded
+    assert key_node.path not in get_paths(path_trie.complete(prefix))
+
+
+@pytest.mark.django_db()
+@pytest.mark.usefixtures("init_tree")
+def test_tree_complete_api(clear_trie, employee_client, employee_user, dept_node, dev_role, admin_role):
+    resp = employee_client.get("/tree/complete/", data={"prefix": "com.dept"})
+    assert resp.status_code == HTTPStatus.OK
+    assert get_paths(resp.json()) == ["com.dept1", "com.dept2"]
+    resp = employee_client.get("/tree/complete/", data={"prefix": "com.dept", "limit": 1})
+    assert resp.json()["has_more"] is True
+    for limit in ["a", 0, 101]:
+        resp = employee_client.get("/tree/complete/", data={"prefix": "com", "limit": limit})
+        assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+    # 仅返回有权限的结点及其父类结点
+    NodeRole.objects.create(user=employee_user, node=dept_node, role=dev_role)
+    resp = employee_client.get("/tree/complete/", data={"prefix": "", "perm": "1"})
+    assert get_paths(resp.json()) == ["com"]
+    resp = employee_client.get("/tree/complete/", data={"prefix": "com.", "perm": "true"})
+    assert get_paths(resp.json()) == [dept_node.path]
+    resp = employee_client.get("/tree/complete/", data={"prefix": f"{dept_node.path}.", "perm": "1"})
+    assert len(resp.json()["results"]) == 6
+    resp = employee_client.get("/tree/complete/", data={"prefix": "com.", "perm": "1", "roles": admin_role.name})
+    assert get_paths(resp.json()) == []
+
+    # 树管理员返回所有结点
+    employee_user.is_superuser = True
+    employee_user.save()
+    resp = employee_client.get("/tree/complete/", data={"prefix": "", "perm": "1"})
+    assert get_paths(resp.json()) == ["com", "web"]